@@ -1,6 +1,10 @@
+import bisect
 import yaml
 import os
 
+import numpy as np
+import pandas as pd
+
 from abc import ABC, abstractmethod
 
 
@@ -12,6 +16,9 @@ class BaseIdFactory(ABC):
     """
     PREFIXES = []  # Subclasses must override
     LABELSET_SYMBOLS = {} # Subclasses must override
+    INDIVIDUAL_PREFIXES = []  # prefixes of the individuals, which are identified by their accession id
+    ID_DIGITS = 7
+    INDIVIDUAL_KIND = "individual"
 
     @staticmethod
     def round_up_to_nearest(value, zeros=1):
@@ -54,6 +61,58 @@ class BaseIdFactory(ABC):
                 return True
         return False
 
+    @staticmethod
+    def add_annotation_summary(summary, annotation):
+        """
+        Adds an annotation to the annotation summary of a taxonomy: the annotation count ('labelset_counts') and the
+        accession id format ('accession_formats', such as 'CS20250428_GROUP_{:04d}') of each labelset. The summary is
+        all the id factories need from the annotations, so that annotations can be streamed (see
+        dendrogram_tools.stream_cas_json_2_nodes_n_edges).
+        Args:
+            summary: annotation summary to update
+            annotation: CAS annotation
+        """
+        labelset = annotation['labelset']
+        labelset_counts = summary.setdefault('labelset_counts', dict())
+        labelset_counts[labelset] = labelset_counts.get(labelset, 0) + 1
+        accession_formats = summary.setdefault('accession_formats', dict())
+        accession_parts = str(annotation['cell_set_accession']).split("_")
+        if labelset not in accession_formats and len(accession_parts) > 2:
+            accession_formats[labelset] = "{}_{}_{{:0{}d}}".format(accession_parts[0].strip(),
+                                                                   accession_parts[1].strip(),
+                                                                   len(accession_parts[2].strip()))
+
+    @classmethod
+    def get_annotation_summary(cls, taxonomy):
+        """
+        Returns the annotation summary of the taxonomy (see add_annotation_summary).
+        Args:
+            taxonomy: parsed CAS json, or CAS metadata with an annotation summary instead of the annotations
+
+        Returns: dict with the 'labelset_counts' and 'accession_formats' of the taxonomy.
+        """
+        if 'labelset_counts' in taxonomy:
+            return taxonomy
+        summary = {'labelset_counts': dict(), 'accession_formats': dict()}
+        for node in taxonomy['annotations']:
+            cls.add_annotation_summary(summary, node)
+        return summary
+
+    @staticmethod
+    def strip_prefix(id_str, prefixes):
+        """
+        Removes the longest matching prefix from the id string.
+        Args:
+            id_str: identifier string
+            prefixes: candidate prefixes
+
+        Returns: id string without the prefix, None if it has none of the prefixes.
+        """
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            if id_str.startswith(prefix):
+                return id_str[len(prefix):]
+        return None
+
     @classmethod
     def parse_accession_id(cls, accession_id):
         """
@@ -70,6 +129,225 @@ class BaseIdFactory(ABC):
         labelset_symbols = getattr(cls, "LABELSET_SYMBOLS", dict())
         return node_id, labelset_symbols[labelset_abbr]
 
+    @classmethod
+    def parse_accession_ids(cls, accession_ids):
+        """
+        Vectorized parse_accession_id, parses the node ids and labelset symbols of all accession ids at once.
+        Args:
+            accession_ids: sequence of cell set accession ids (such as CS20230722_CLAS_01)
+
+        Returns: tuple of node ids (int64 array) and labelset symbols (object array), in accession ids order.
+        """
+        accession_ids = np.asarray(accession_ids, dtype=str)
+        if not accession_ids.size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+        # np.char partitions are (n, 3) arrays of the head, separator and tail of each string
+        accession_parts = np.char.partition(accession_ids, "_")[:, 2]
+        labelset_parts = np.char.partition(accession_parts, "_")
+        node_ids = np.char.partition(labelset_parts[:, 2], "_")[:, 0]
+        node_ids = np.char.strip(node_ids).astype(np.int64)
+        labelset_abbrs = np.char.strip(labelset_parts[:, 0]).astype(object)
+        return node_ids, labelset_abbrs
+
     @abstractmethod
-    def __init__(self, taxonomy):
+    def get_labelset_ranges(self):
+        """
+        Returns the id range start of each labelset.
+        Returns: dict of labelset names to the first id of their range.
+        """
+        pass
+
+    @abstractmethod
+    def get_id_displacements(self):
+        """
+        Returns the displacement of each id kind (such as 'class' or 'marker_gene_set') from the labelset ranges.
+        Returns: dict of id kinds to id displacements.
+        """
+        pass
+
+    def get_range_table(self):
+        """
+        Returns the per labelset range table used by the batch id allocation. Computed once per factory (lazily, so
+        that factories of existing taxonomy snapshots support it too).
+        Returns: tuple of the labelset symbols index and the range starts (int64 array) aligned with it.
+        """
+        range_table = self.__dict__.get("_range_table")
+        if range_table is None:
+            labelset_ranges = self.get_labelset_ranges()
+            symbols = [symbol for symbol, labelset in self.LABELSET_SYMBOLS.items() if labelset in labelset_ranges]
+            range_starts = np.array([labelset_ranges[self.LABELSET_SYMBOLS[symbol]] for symbol in symbols],
+                                    dtype=np.int64)
+            range_table = (pd.Index(symbols, dtype=object), range_starts)
+            self._range_table = range_table
+        return range_table
+
+    def get_batch_ids(self, accession_ids, kinds=None):
+        """
+        Allocates the ids of all given accession ids in a single vectorized pass. Ids are the same as the ones of the
+        single accession methods (such as get_class_id).
+        Args:
+            accession_ids: sequence of cell set accession ids
+            kinds: id kinds to allocate (see get_id_displacements), all kinds of the factory if not provided
+
+        Returns: dict of id kinds to id arrays (int64) in accession ids order. Use format_ids to get the id strings.
+        """
+        displacements = self.get_id_displacements()
+        kinds = list(displacements) if kinds is None else kinds
+        for kind in kinds:
+            if kind not in displacements:
+                raise KeyError(kind)
+        symbols, range_starts = self.get_range_table()
+        node_ids, labelset_abbrs = self.parse_accession_ids(accession_ids)
+        positions = symbols.get_indexer(labelset_abbrs)
+        if (positions < 0).any():
+            unknown = labelset_abbrs[positions < 0][0]
+            raise KeyError(self.LABELSET_SYMBOLS.get(unknown, unknown))
+        class_ids = range_starts[positions] + node_ids
+        return {kind: class_ids + displacements[kind] for kind in kinds}
+
+    def allocate_ids(self, accession_ids, kinds=None):
+        """
+        Allocates and formats the ids of all given accession ids at once (see get_batch_ids and format_ids).
+        Accession ids that are not of a labelset of the factory are skipped.
+        Args:
+            accession_ids: sequence of cell set accession ids
+            kinds: id kinds to allocate (see get_id_displacements), all kinds of the factory if not provided
+
+        Returns: dict of id kinds to dicts of accession ids to seven digit id strings.
+        """
+        symbols, _ = self.get_range_table()
+        allocatable = []
+        for accession_id in accession_ids:
+            accession_parts = str(accession_id).split("_")
+            if (len(accession_parts) > 2 and accession_parts[1].strip() in symbols and
+                    accession_parts[2].strip().isdigit()):
+                allocatable.append(accession_id)
+        return {kind: dict(zip(allocatable, self.format_ids(ids).tolist()))
+                for kind, ids in self.get_batch_ids(allocatable, kinds).items()}
+
+    def get_reverse_table(self):
+        """
+        Returns the sorted id range table used by the reverse id lookups: one range per id kind and labelset. Ranges
+        are clipped to the start of the next range, so ids allocated twice (in the spare space of overlapping ranges)
+        resolve to the later range. Computed once per factory.
+        Returns: tuple of the range starts and ends (int64 arrays) and the id kinds and labelset names of the ranges.
+        """
+        reverse_table = self.__dict__.get("_reverse_table")
+        if reverse_table is None:
+            labelset_ranges = self.get_labelset_ranges()
+            labelsets = sorted(labelset_ranges, key=labelset_ranges.get)
+            bounds = [labelset_ranges[labelset] for labelset in labelsets] + [self.labelset_range_end]
+            ranges = sorted((bounds[index] + displacement, bounds[index + 1] + displacement, kind, labelset)
+                            for kind, displacement in self.get_id_displacements().items()
+                            for index, labelset in enumerate(labelsets))
+            starts = np.array([id_range[0] for id_range in ranges], dtype=np.int64)
+            ends = np.minimum(np.array([id_range[1] for id_range in ranges], dtype=np.int64),
+                              np.append(starts[1:], np.iinfo(np.int64).max))
+            reverse_table = (starts, ends, [id_range[2] for id_range in ranges], [id_range[3] for id_range in ranges])
+            self._reverse_table = reverse_table
+        return reverse_table
+
+    def parse_id_number(self, id_str):
+        """
+        Returns the number of an id of the factory (such as 160012 for 'PCL:0160012').
+        Args:
+            id_str: identifier string
+
+        Returns: id number, None for individuals and ids of other factories.
+        """
+        local_id = self.strip_prefix(str(id_str), self.PREFIXES)
+        if local_id is None or not local_id.strip().isdigit():
+            return None
+        return int(local_id)
+
+    def resolve_id(self, id_str):
+        """
+        Resolves an id generated by the factory back to the cell set accession id it was generated for, with a
+        binary search of the reverse range table.
+        Args:
+            id_str: identifier string (such as 'PCL:0160012' or 'http://purl.obolibrary.org/obo/CL_4310012')
+
+        Returns: tuple of the cell set accession id and the id kind (see get_id_displacements), None if the id is not
+        in the allocated id ranges.
+        """
+        accession_id = self.strip_prefix(str(id_str), self.INDIVIDUAL_PREFIXES)
+        if accession_id is not None:
+            return accession_id, self.INDIVIDUAL_KIND
+        id_number = self.parse_id_number(id_str)
+        if id_number is None:
+            return None
+        starts, ends, kinds, labelsets = self.get_reverse_table()
+        index = bisect.bisect_right(starts, id_number) - 1
+        if index < 0 or id_number >= ends[index] or labelsets[index] not in self.accession_formats:
+            return None
+        return self.accession_formats[labelsets[index]].format(id_number - int(starts[index])), kinds[index]
+
+    def get_reverse_id(self, id_str):
+        """
+        Converts an id generated by the factory to the cell set accession id it was generated for.
+        Args:
+            id_str: identifier string
+
+        Returns: cell set accession id, None if the id is not in the allocated id ranges.
+        """
+        resolved = self.resolve_id(id_str)
+        return resolved[0] if resolved else None
+
+    def get_reverse_ids(self, id_strs):
+        """
+        Vectorized resolve_id, resolves all given ids at once.
+        Args:
+            id_strs: sequence of identifier strings
+
+        Returns: tuple of the cell set accession ids and the id kinds lists, in id_strs order. Both are None for ids
+        that are not in the allocated id ranges.
+        """
+        id_strs = [str(id_str) for id_str in id_strs]
+        accession_ids = [self.strip_prefix(id_str, self.INDIVIDUAL_PREFIXES) for id_str in id_strs]
+        kinds = [None if accession_id is None else self.INDIVIDUAL_KIND for accession_id in accession_ids]
+        id_numbers = np.array([-1 if id_number is None else id_number
+                               for id_number in map(self.parse_id_number, id_strs)], dtype=np.int64)
+
+        starts, ends, range_kinds, labelsets = self.get_reverse_table()
+        indexes = np.searchsorted(starts, id_numbers, side="right") - 1
+        is_resolved = (id_numbers >= 0) & (indexes >= 0) & (id_numbers < ends[indexes.clip(0)])
+        for position in np.flatnonzero(is_resolved).tolist():
+            index = indexes[position]
+            accession_format = self.accession_formats.get(labelsets[index])
+            if accession_format:
+                accession_ids[position] = accession_format.format(int(id_numbers[position] - starts[index]))
+                kinds[position] = range_kinds[index]
+        return accession_ids, kinds
+
+    def rekey_records(self, records):
+        """
+        Re-keys a table keyed by the ids of the factory (such as a curation table keyed by PCL ids) by the cell set
+        accession ids. Keys that can't be resolved are kept as they are.
+        Args:
+            records: dict of ids to rows
+
+        Returns: new dict of cell set accession ids to rows, in records order.
+        """
+        accession_ids, _ = self.get_reverse_ids(records)
+        return {key if accession_id is None else accession_id: row
+                for (key, row), accession_id in zip(records.items(), accession_ids)}
+
+    @classmethod
+    def format_ids(cls, ids):
+        """
+        Formats ids as zero padded seven digit id strings.
+        Args:
+            ids: id array
+
+        Returns: array of id strings
+        """
+        return np.char.zfill(np.asarray(ids, dtype=np.int64).astype(str), cls.ID_DIGITS)
+
+    @abstractmethod
+    def __init__(self, taxonomy, taxonomy_details=None):
+        """
+        Args:
+            taxonomy: parsed CAS json
+            taxonomy_details: already parsed 'taxonomy_details.yaml' content. Read from disk if not provided.
+        """
         pass
\ No newline at end of file
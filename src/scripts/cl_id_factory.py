@@ -37,20 +37,25 @@ class CLIdFactory(BaseIdFactory):
                         "GROUP": "Group",
                         "CLUST": "Cluster"}
 
-    def __init__(self, taxonomy):
-        self.taxonomies = self.read_taxonomy_details_yaml()
+    def __init__(self, taxonomy, taxonomy_details=None):
+        self.taxonomies = taxonomy_details if taxonomy_details is not None else self.read_taxonomy_details_yaml()
         self.taxonomy_ids = [taxon["Taxonomy_id"] for taxon in self.taxonomies]
         ranked_labelsets = [labelset for labelset in taxonomy['labelsets'] if "rank" in labelset]
         self.labelsets = [labelset["name"] for labelset in sorted(ranked_labelsets, key=lambda x: x["rank"], reverse=True)]
-        annotation_count = sum(1 for node in taxonomy['annotations'])
+        # the taxonomy can have the annotation summary instead of the annotations
+        annotation_summary = self.get_annotation_summary(taxonomy)
+        labelset_counts = annotation_summary['labelset_counts']
+        annotation_count = sum(labelset_counts.values())
 
         # class ranges per labelset
         self.class_ranges = {}
         id_range = ID_RANGE_BASE
         for labelset in self.labelsets:
             self.class_ranges[labelset] = id_range
-            id_range = id_range + int(sum(1 for node in taxonomy['annotations'] if node['labelset'] == labelset) * 1.15)  # %15 more than the number of nodes
+            id_range = id_range + int(labelset_counts.get(labelset, 0) * 1.15)  # %15 more than the number of nodes
             id_range = self.round_up_to_nearest(id_range, 1)
+        self.labelset_range_end = id_range
+        self.accession_formats = annotation_summary['accession_formats']
 
         # print(self.class_ranges)
 
@@ -71,6 +76,13 @@ class CLIdFactory(BaseIdFactory):
         return str(cl_id).zfill(7)
 
 
+    def get_labelset_ranges(self):
+        return self.class_ranges
+
+    def get_id_displacements(self):
+        return {"class": 0}
+
+
     def get_taxonomy_id(self, taxonomy_id):
         """
         DEPRECATED: now individuals use accession_id
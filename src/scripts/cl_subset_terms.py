@@ -6,6 +6,8 @@ import yaml
 
 from rdflib import Graph
 
+from template_sidecar import read_template_columns, get_list_values, filter_prefixed_rows
+
 PATTERNS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "patterns", "data", "default")
 
 GENE_COLUMNS = ["NT_marker_1", "NT_marker_2", "NT_marker_3", "NT_marker_4", "NT_marker_5", "NT_marker_6", "NT_marker_7", "NT_marker_8", "Markers"]
@@ -30,33 +32,79 @@ def collect_classes(data_folder, collect_genes=False):
     terms = set()
     for file in tsv_files:
         try:
+            sidecar_columns = read_template_columns(file, ["defined_class"] + GENE_COLUMNS)
+            if sidecar_columns is not None:
+                collect_table_terms(sidecar_columns, terms, prefixes, template_prefixes, collect_genes)
+                continue
             with open(file, newline='', encoding='utf-8') as f:
                 reader = csv.DictReader(f, delimiter='\t')
-                if "defined_class" not in reader.fieldnames:
-                    continue
-                for row in reader:
-                    defined_class = row.get("defined_class", "")
-                    if any(defined_class.startswith(prefix) for prefix in prefixes):
-                        terms.add(defined_class)
-                        if collect_genes:
-                            for col in GENE_COLUMNS:
-                                #  collect gene terms and expand curies
-                                for gene in row.get(col, "").split("|"):
-                                    if ":" in gene:
-                                        prefix, local_id = gene.split(":", 1)
-                                        url = template_prefixes.get(prefix)
-                                        if url:
-                                            terms.add(f"{url}{local_id}")
-                                        else:
-                                            terms.add(gene)
-                                    else:
-                                        terms.add(gene)
+                collect_row_terms(reader.fieldnames, reader, terms, prefixes, template_prefixes, collect_genes)
 
         except Exception as e:
             print(f"Error reading '{file}': {e}")
 
     return terms
 
+def collect_row_terms(fieldnames, rows, terms, prefixes, template_prefixes, collect_genes=False):
+    """
+    Collects the terms of the template rows whose defined_class matches the prefixes.
+    Args:
+        fieldnames: template column names
+        rows: template rows as dicts of column names to values
+        terms: set of the collected terms
+        prefixes: cl subset prefixes
+        template_prefixes: template prefixes to expand the gene curies
+        collect_genes: If True, also collects gene terms from specified columns.
+    """
+    if "defined_class" not in fieldnames:
+        return
+    for row in rows:
+        defined_class = row.get("defined_class", "")
+        if any(defined_class.startswith(prefix) for prefix in prefixes):
+            terms.add(defined_class)
+            if collect_genes:
+                for col in GENE_COLUMNS:
+                    #  collect gene terms and expand curies
+                    for gene in row.get(col, "").split("|"):
+                        add_gene_term(gene, terms, template_prefixes)
+
+def collect_table_terms(table, terms, prefixes, template_prefixes, collect_genes=False):
+    """
+    Collects the terms of the template sidecar rows whose defined_class matches the prefixes.
+    Args:
+        table: typed template columns (see template_sidecar.read_template_columns)
+        terms: set of the collected terms
+        prefixes: cl subset prefixes
+        template_prefixes: template prefixes to expand the gene curies
+        collect_genes: If True, also collects gene terms from specified columns.
+    """
+    if "defined_class" not in table.column_names:
+        return
+    table = filter_prefixed_rows(table, "defined_class", prefixes)
+    terms.update(table.column("defined_class").to_pylist())
+    if collect_genes and table.num_rows:
+        for col in GENE_COLUMNS:
+            genes = get_list_values(table, col).unique().to_pylist() if col in table.column_names else []
+            if col not in table.column_names or table.column(col).null_count:
+                # empty cells are collected as '' from the template rows too
+                genes.append("")
+            for gene in genes:
+                add_gene_term(gene, terms, template_prefixes)
+
+def add_gene_term(gene, terms, template_prefixes):
+    """
+    Collects a gene term, expanding its curie with the template prefixes.
+    """
+    if ":" in gene:
+        prefix, local_id = gene.split(":", 1)
+        url = template_prefixes.get(prefix)
+        if url:
+            terms.add(f"{url}{local_id}")
+        else:
+            terms.add(gene)
+    else:
+        terms.add(gene)
+
 def get_template_prefixes(prefixes_yaml):
     with open(prefixes_yaml, 'r', encoding='utf-8') as f:
         prefix_dict = yaml.safe_load(f)
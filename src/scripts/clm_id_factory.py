@@ -36,19 +36,24 @@ class CLMIdFactory(BaseIdFactory):
                         "GROUP": "Group",
                         "CLUST": "Cluster"}
 
-    def __init__(self, taxonomy):
-        self.taxonomies = self.read_taxonomy_details_yaml()
+    def __init__(self, taxonomy, taxonomy_details=None):
+        self.taxonomies = taxonomy_details if taxonomy_details is not None else self.read_taxonomy_details_yaml()
         ranked_labelsets = [labelset for labelset in taxonomy['labelsets'] if "rank" in labelset]
         self.labelsets = [labelset["name"] for labelset in sorted(ranked_labelsets, key=lambda x: x["rank"], reverse=True)]
-        annotation_count = sum(1 for node in taxonomy['annotations'])
+        # the taxonomy can have the annotation summary instead of the annotations
+        annotation_summary = self.get_annotation_summary(taxonomy)
+        labelset_counts = annotation_summary['labelset_counts']
+        annotation_count = sum(labelset_counts.values())
 
         self.ms_ranges = {}
         id_range = ID_RANGE_BASE
         for labelset in self.labelsets:
             self.ms_ranges[labelset] = id_range
-            id_range = id_range + int(sum(1 for node in taxonomy['annotations'] if node['labelset'] == labelset) * 1.1)  # %10 more than the number of nodes
+            id_range = id_range + int(labelset_counts.get(labelset, 0) * 1.1)  # %10 more than the number of nodes
             id_range = self.round_up_to_nearest(id_range, 1)
 
+        self.labelset_range_end = id_range
+        self.accession_formats = annotation_summary['accession_formats']
         self.nsf_marker_set_start = id_range + 10
         self.ws_marker_set_id_start = self.round_up_to_nearest( int(self.nsf_marker_set_start + (annotation_count * 1.1)) , 1)
         self.evidence_marker_set_id_start = self.round_up_to_nearest( int(self.ws_marker_set_id_start + (annotation_count * 1.1)) , 1)
@@ -60,6 +65,16 @@ class CLMIdFactory(BaseIdFactory):
         print("Evidence marker set id range: " + str(self.evidence_marker_set_id_start) + " to " + str(evidence_marker_set_id_end))
 
 
+    def get_labelset_ranges(self):
+        return self.ms_ranges
+
+    def get_id_displacements(self):
+        return {"marker_gene_set": 0,
+                "nsf_marker_gene_set": self.nsf_marker_set_start - ID_RANGE_BASE,
+                "ws_marker_gene_set": self.ws_marker_set_id_start - ID_RANGE_BASE,
+                "evidence_marker_gene_set": self.evidence_marker_set_id_start - ID_RANGE_BASE}
+
+
     def get_marker_gene_set_id(self, accession_id):
         """
         Generates a CLM id for the given accession id. Parses taxonomy id from accession id and based on taxonomy's order
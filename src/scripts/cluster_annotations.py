@@ -0,0 +1,118 @@
+"""
+Shared loader of the consensus cluster annotation table (HMBA_BG_consensus_annotation.csv). Only the columns used by
+the template generators and the disclaimer checks are read, with declared types. The table is indexed by its
+accession columns and its CCF region frequency columns are parsed into RegionFrequencyMatrix once, when they are
+first used. The table is loaded once per process and shared by all its users.
+"""
+import os
+
+import pandas as pd
+
+from region_frequencies import RegionFrequencyMatrix
+
+CLUSTER_ACCESSION = "cell_set_accession.cluster"
+GROUP_ACCESSION = "accession_group"
+ACCESSION_COLUMNS = (GROUP_ACCESSION, CLUSTER_ACCESSION)
+
+CCF_BROAD_FREQ = "CCF_broad.freq"
+CCF_ACRONYM_FREQ = "CCF_acronym.freq"
+
+# used columns and their types, columns missing from the table are ignored
+ANNOTATION_COLUMNS = {
+    GROUP_ACCESSION: "string",
+    CLUSTER_ACCESSION: "string",
+    "Group": "string",
+    "cluster_id_label": "string",
+    "supertype_id_label": "string",
+    "nt_type_label": "string",
+    "nt_type_combo_label": "string",
+    CCF_BROAD_FREQ: "string",
+    CCF_ACRONYM_FREQ: "string",
+}
+
+# Per process cache of the loaded annotation tables
+cluster_annotations = dict()
+
+
+class ClusterAnnotations:
+    """
+    Column projected cluster annotation table with accession indexes and lazily parsed region frequencies.
+    """
+
+    def __init__(self, frame):
+        """
+        Args:
+            frame: annotation table with a RangeIndex
+        """
+        self.frame = frame
+        # accession column -> accession -> row, the last row wins for duplicate accessions
+        self.accession_indexes = dict()
+        for column in ACCESSION_COLUMNS:
+            if column in frame.columns:
+                accessions = frame[column].dropna()
+                self.accession_indexes[column] = dict(zip(accessions.tolist(), accessions.index.tolist()))
+        # frequency column -> region frequencies by row, parsed on first use (see get_region_frequencies)
+        self.region_frequencies = dict()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def get_row(self, accession, column=CLUSTER_ACCESSION):
+        """
+        Returns the row of the accession.
+        Args:
+            accession: cell set accession
+            column: accession column
+        Returns:
+            row number or None if the accession (or the accession column) doesn't exist.
+        """
+        return self.accession_indexes.get(column, {}).get(accession)
+
+    def get_record(self, accession, column=CLUSTER_ACCESSION):
+        """
+        Returns the annotations of the accession as a dict of column names to values (missing values are None).
+        """
+        row = self.get_row(accession, column)
+        if row is None:
+            return None
+        return {key: (None if pd.isna(value) else value) for key, value in self.frame.iloc[row].items()}
+
+    def get_region_frequencies(self, column):
+        """
+        Returns the region frequencies of a CCF frequency column, keyed by row. The column is parsed on the first call.
+        Missing columns are empty.
+        """
+        if column not in self.region_frequencies:
+            if column in self.frame.columns:
+                values = self.frame[column]
+            else:
+                values = pd.Series(pd.NA, index=self.frame.index, dtype="string")
+            self.region_frequencies[column] = RegionFrequencyMatrix.from_series(values)
+        return self.region_frequencies[column]
+
+
+def read_cluster_annotations(csv_path):
+    """
+    Reads the used columns of the cluster annotation table.
+    Args:
+        csv_path: Path of the annotation CSV file
+    Returns:
+        ClusterAnnotations
+    """
+    frame = pd.read_csv(csv_path, usecols=lambda column: column in ANNOTATION_COLUMNS, dtype=ANNOTATION_COLUMNS,
+                        encoding="utf-8-sig")
+    return ClusterAnnotations(frame)
+
+
+def get_cluster_annotations(csv_path):
+    """
+    Returns the cluster annotation table, reading it only once per process.
+    Args:
+        csv_path: Path of the annotation CSV file
+    Returns:
+        ClusterAnnotations, to be treated as read-only
+    """
+    key = os.path.realpath(csv_path)
+    if key not in cluster_annotations:
+        cluster_annotations[key] = read_cluster_annotations(csv_path)
+    return cluster_annotations[key]
@@ -1,5 +1,333 @@
 import warnings
 import json
+import re
+import sys
+from fnmatch import translate
+
+from collections.abc import Mapping, MutableMapping
+
+# characters read from the file at a time by the streaming CAS reader
+STREAM_CHUNK_SIZE = 1024 * 1024
+CAS_STREAMED_FIELDS = ("annotations",)
+DEFERRED_ANNOTATION_FIELDS = ("cell_ids",)
+AUTHOR_ANNOTATION_FIELDS = "author_annotation_fields"
+_WHITESPACE = " \t\n\r"
+_DECODER = json.JSONDecoder()
+_STRUCTURE_CHARS = re.compile(r'["\[\]{}]')
+_STRING_CHARS = re.compile(r'["\\]')
+_PRIMITIVE_END = re.compile(r'[\s,\]}]')
+
+
+class _JsonStream:
+    """
+    Minimal incremental JSON tokenizer over a text file. Only keeps the current value in memory, values that are not
+    needed can be skipped without being decoded.
+    """
+
+    def __init__(self, file, chunk_size=STREAM_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character without consuming it, '' at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Invalid json: expected '{}' but found '{}'".format(char, self.peek()))
+        self.pos += 1
+
+    def _scan_value(self, keep):
+        """
+        Moves to the end of the next value without decoding it. If keep is True, returns the raw text of the value.
+        """
+        if self.peek() in ('{', '[', '"'):
+            # fast path, the value is complete in the buffer. Decoded in C and discarded, which is faster than scanning
+            try:
+                end = _DECODER.raw_decode(self.buffer, self.pos)[1]
+                raw = self.buffer[self.pos:end] if keep else None
+                self.pos = end
+                return raw
+            except json.JSONDecodeError:
+                pass
+        start = self.pos
+        kept = []
+        depth = 0
+        in_string = False
+        escaped = False
+        primitive = self.buffer[self.pos:self.pos + 1] not in ('{', '[', '"')
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+            done = False
+            if escaped and pos < len(buffer):
+                pos += 1
+                escaped = False
+            while pos < len(buffer):
+                if primitive:
+                    match = _PRIMITIVE_END.search(buffer, pos)
+                    pos = match.start() if match else len(buffer)
+                    done = match is not None
+                    break
+                if in_string:
+                    match = _STRING_CHARS.search(buffer, pos)
+                    if not match:
+                        pos = len(buffer)
+                    elif match.group() == "\\":
+                        pos = match.end() + 1
+                        # escaped character is in the next chunk
+                        escaped = pos > len(buffer)
+                        pos = min(pos, len(buffer))
+                        continue
+                    else:
+                        pos = match.end()
+                        in_string = False
+                        done = depth == 0
+                        if done:
+                            break
+                    continue
+                match = _STRUCTURE_CHARS.search(buffer, pos)
+                if not match:
+                    pos = len(buffer)
+                    continue
+                pos = match.end()
+                char = match.group()
+                if char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        done = True
+                        break
+            self.pos = pos
+            if done:
+                break
+            if keep:
+                kept.append(buffer[start:pos])
+            self.buffer = ""
+            self.pos = 0
+            start = 0
+            if not self._fill():
+                if primitive:
+                    break
+                raise ValueError("Invalid json: unexpected end of file")
+        if keep:
+            kept.append(self.buffer[start:self.pos])
+            return "".join(kept)
+        return None
+
+    def read_value(self):
+        if self.peek() not in ('{', '[', '"'):
+            # primitives may be cut at the buffer end (e.g. '12' of '12.5'), find the end of the value first
+            return json.loads(self._scan_value(keep=True))
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # grow the buffer geometrically, so that large values are decoded in linear time
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def skip_value(self):
+        char = self.peek()
+        if char in ('{', '['):
+            try:
+                self.pos = _DECODER.raw_decode(self.buffer, self.pos)[1]
+                return
+            except json.JSONDecodeError:
+                pass
+            # larger than the buffer, skip item by item so that only one item is in memory at a time
+            if char == '{':
+                for _ in self.iter_object_keys():
+                    self.skip_value()
+            else:
+                for _ in self.iter_array():
+                    self.skip_value()
+        else:
+            self._scan_value(keep=False)
+
+    def iter_object_keys(self):
+        """
+        Iterates over the keys of the next json object, the caller must consume (read or skip) the value of each key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+    def iter_array(self):
+        """
+        Iterates over the items of the next json array, the caller must consume (read or skip) each item.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+
+class LazyFields:
+    """
+    Raw json text of an annotation sub-document (such as 'author_annotation_fields') that is decoded on first access
+    by TaxonomyNode.
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def decode(self):
+        return json.loads(self.raw)
+
+
+class _FieldMatcher:
+    """
+    Matches field names against fnmatch patterns, caching the result per field name.
+    """
+
+    def __init__(self, patterns):
+        # an empty pattern list matches nothing
+        self.pattern = re.compile("|".join(translate(pattern) for pattern in patterns) or "(?!)")
+        self.matches = dict()
+
+    def __call__(self, key):
+        matched = self.matches.get(key)
+        if matched is None:
+            matched = self.matches[key] = self.pattern.match(key) is not None
+        return matched
+
+
+def _read_author_fields(stream, lazy, field_matcher):
+    if stream.peek() != "{":
+        return stream.read_value()
+    if field_matcher is not None:
+        try:
+            fields, stream.pos = _DECODER.raw_decode(stream.buffer, stream.pos)
+            return {key: value for key, value in fields.items() if field_matcher(key)}
+        except json.JSONDecodeError:
+            pass
+        # larger than the buffer
+        fields = dict()
+        for key in stream.iter_object_keys():
+            if field_matcher(key):
+                fields[key] = stream.read_value()
+            else:
+                stream.skip_value()
+        return fields
+    if lazy:
+        return LazyFields(stream._scan_value(keep=True))
+    return stream.read_value()
+
+
+def _read_annotation(stream, include_cell_ids, lazy_author_fields=False, field_matcher=None):
+    annotation = dict()
+    for key in stream.iter_object_keys():
+        if not include_cell_ids and key in DEFERRED_ANNOTATION_FIELDS:
+            stream.skip_value()
+        elif key == AUTHOR_ANNOTATION_FIELDS:
+            annotation[key] = _read_author_fields(stream, lazy_author_fields, field_matcher)
+        else:
+            annotation[key] = stream.read_value()
+    return annotation
+
+
+def iter_cas_annotations(file_path, include_cell_ids=False, lazy_author_fields=False, author_fields=None):
+    """
+    Streams the annotations of the CAS json file one at a time, without loading the whole file into memory.
+    Args:
+        file_path: The path to the CAS json file.
+        include_cell_ids: If False (default), potentially huge 'cell_ids' arrays are skipped without being decoded.
+        lazy_author_fields: If True, 'author_annotation_fields' are kept as raw json (LazyFields) to be decoded on
+        first access by TaxonomyNode.
+        author_fields: Optional list of 'author_annotation_fields' key patterns (fnmatch) to load, other keys are
+        skipped without being decoded.
+
+    Returns: generator of annotation dicts.
+    """
+    field_matcher = _FieldMatcher(author_fields) if author_fields is not None else None
+    with open(file_path, "r") as f:
+        stream = _JsonStream(f)
+        for key in stream.iter_object_keys():
+            if key == "annotations":
+                for _ in stream.iter_array():
+                    yield _read_annotation(stream, include_cell_ids, lazy_author_fields, field_matcher)
+            else:
+                stream.skip_value()
+
+
+def read_cas_metadata(file_path):
+    """
+    Reads all top level CAS json fields (labelsets, author details etc.) except the annotations, which are skipped
+    without being decoded.
+    Args:
+        file_path: The path to the CAS json file.
+
+    Returns: The CAS json object without the 'annotations'.
+    """
+    metadata = dict()
+    with open(file_path, "r") as f:
+        stream = _JsonStream(f)
+        for key in stream.iter_object_keys():
+            if key in CAS_STREAMED_FIELDS:
+                stream.skip_value()
+            else:
+                metadata[key] = stream.read_value()
+    return metadata
+
+
+def read_cas_json_stream(file_path, include_cell_ids=False, lazy_author_fields=False, author_fields=None):
+    """
+    Reads the CAS json file with the streaming reader. Equivalent of read_json_file, except that 'cell_ids' of the
+    annotations are not loaded unless asked.
+    Args:
+        file_path: The path to the CAS json file.
+        include_cell_ids: whether to load 'cell_ids' of the annotations.
+        lazy_author_fields: whether to defer decoding of the 'author_annotation_fields' (see iter_cas_annotations)
+        author_fields: Optional list of 'author_annotation_fields' key patterns to load (see iter_cas_annotations)
+
+    Returns: The CAS json object.
+    """
+    cas = read_cas_metadata(file_path)
+    cas["annotations"] = list(iter_cas_annotations(file_path, include_cell_ids, lazy_author_fields, author_fields))
+    return cas
 
 
 def read_json_file(file_path):
@@ -20,24 +348,219 @@ def cas_json_2_nodes_n_edges(path_to_json):
     return out
 
 
+def stream_cas_json_2_nodes_n_edges(path_to_json, include_cell_ids=False, lazy_author_fields=True,
+                                    author_fields=None, metadata=None, visit_annotation=None):
+    """
+    Bounded memory equivalent of cas_json_2_nodes_n_edges. Annotations are streamed from the file one at a time and
+    'cell_ids' are not loaded unless asked.
+    Args:
+        path_to_json: The path to the CAS json file.
+        include_cell_ids: whether to load 'cell_ids' of the nodes.
+        lazy_author_fields: whether to decode 'author_annotation_fields' on first access (see iter_cas_annotations)
+        author_fields: Optional list of 'author_annotation_fields' key patterns to load (see iter_cas_annotations)
+        metadata: Optional, already read CAS metadata (see read_cas_metadata). Read from the file if not provided.
+        visit_annotation: Optional function called with each streamed annotation, including the annotations of the
+        labelsets that are not part of the dendrogram.
+
+    Returns: dendrogram nodes and edges (see tree_recurse)
+    """
+    if metadata is None:
+        metadata = read_cas_metadata(path_to_json)
+    ranked_labelsets = [labelset["name"] for labelset in metadata['labelsets'] if "rank" in labelset]
+    out = {}
+    _init_dendrogram(out)
+    for annotation in iter_cas_annotations(path_to_json, include_cell_ids, lazy_author_fields, author_fields):
+        if visit_annotation is not None:
+            visit_annotation(annotation)
+        if annotation['labelset'] in ranked_labelsets:
+            _add_dendrogram_node(out, annotation)
+    return out
+
+
+# CAS annotation fields, in schema order. Stored in slots by TaxonomyNode, other fields are kept in a side dict
+CAS_ANNOTATION_FIELDS = ('labelset', 'cell_label', 'cell_set_accession', 'cell_fullname', 'cell_ontology_term_id',
+                         'cell_ontology_term', 'cell_ids', 'rationale', 'rationale_dois', 'marker_gene_evidence',
+                         'synonyms', 'parent_cell_set_accession', 'author_annotation_fields',
+                         'neurotransmitter_accession', 'neurotransmitter_rationale',
+                         'neurotransmitter_marker_gene_evidence', 'transferred_annotations', 'reviews')
+# highly repetitive field values that are shared through string interning
+INTERNED_FIELDS = frozenset(('labelset', 'cell_label', 'cell_set_accession', 'cell_ontology_term_id',
+                             'cell_ontology_term', 'parent_cell_set_accession'))
+_FIELD_INDEXES = dict()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class CompactFields(Mapping):
+    """
+    Read-only compact mapping for the 'author_annotation_fields' of the taxonomy nodes. All nodes with the same
+    field names share a single key index, only the (interned) values are stored per node.
+    """
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, fields):
+        keys = tuple(fields.keys())
+        index = _FIELD_INDEXES.get(keys)
+        if index is None:
+            index = _FIELD_INDEXES.setdefault(keys, {sys.intern(key): i for i, key in enumerate(keys)})
+        self._index = index
+        self._values = tuple(_intern(value) for value in fields.values())
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return CompactFields, (dict(self),)
+
+
+class TaxonomyNode(MutableMapping):
+    """
+    Compact, dict-like taxonomy node. CAS annotation fields are kept in slots (absent fields are unset slots) and
+    repetitive values are interned, which makes the node set several times smaller than per annotation dicts.
+    Any other field (such as the ones added by chain collapsing) is kept in a side dict. LazyFields values are decoded
+    on first access.
+    """
+    __slots__ = CAS_ANNOTATION_FIELDS + ('_extra',)
+    _SLOTS = frozenset(CAS_ANNOTATION_FIELDS)
+
+    def __init__(self, annotation=None):
+        if annotation:
+            for key, value in annotation.items():
+                self[key] = value
+
+    def _materialize(self, key, value):
+        value = value.decode()
+        if type(value) is dict:
+            value = CompactFields(value)
+        setattr(self, key, value)
+        return value
+
+    def __getitem__(self, key):
+        if key in self._SLOTS:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if type(value) is LazyFields:
+                return self._materialize(key, value)
+            return value
+        try:
+            return self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key in self._SLOTS:
+            if key in INTERNED_FIELDS:
+                value = _intern(value)
+            elif key == 'author_annotation_fields' and type(value) is dict:
+                value = CompactFields(value)
+            setattr(self, key, value)
+        else:
+            try:
+                self._extra[key] = value
+            except AttributeError:
+                self._extra = {key: value}
+
+    def __delitem__(self, key):
+        if key in self._SLOTS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            try:
+                del self._extra[key]
+            except AttributeError:
+                raise KeyError(key) from None
+
+    def __contains__(self, key):
+        if key in self._SLOTS:
+            return hasattr(self, key)
+        try:
+            return key in self._extra
+        except AttributeError:
+            return False
+
+    def __iter__(self):
+        for key in CAS_ANNOTATION_FIELDS:
+            if hasattr(self, key):
+                yield key
+        try:
+            yield from self._extra
+        except AttributeError:
+            pass
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        if key in self._SLOTS:
+            value = getattr(self, key, default)
+            if type(value) is LazyFields:
+                return self._materialize(key, value)
+            return value
+        try:
+            return self._extra.get(key, default)
+        except AttributeError:
+            return default
+
+    def copy(self):
+        return TaxonomyNode(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def _init_dendrogram(out):
+    out['nodes'] = []
+    out['edges'] = set()
+    out['parents'] = dict()
+    out['children'] = dict()
+
+
+def _add_dendrogram_node(out, annotation):
+    node = TaxonomyNode(annotation)
+    out['nodes'].append(node)
+    accession = node['cell_set_accession']
+    parent = node.get('parent_cell_set_accession', '')
+    out['edges'].add((accession, parent))
+    if accession not in out['parents']:
+        out['parents'][accession] = parent
+        if parent:
+            out['children'].setdefault(parent, []).append(accession)
+
+
 def tree_recurse(tree, out):
     """Convert CAS JSON to a list of nodes and edges, where nodes are
-    Copies of nodes in CAS JSON & edges are duples - (subject(child), object(parent))
-    identified by 'cell_set_accession'.
+    compact copies (TaxonomyNode) of nodes in CAS JSON & edges are duples - (subject(child), object(parent))
+    identified by 'cell_set_accession'. Edges are also indexed as 'parents' (child -> parent, '' for root nodes) and
+    'children' (parent -> list of children) so that consumers don't need to scan the edge set.
 
     Args:
         - Tree: CAS JSON, or some subtree of it
         - Output structure to populate (starting point must be an empty dict)
     """
     if not out:
-        out['nodes'] = []
-        out['edges'] = set()
+        _init_dendrogram(out)
     ranked_labelsets = [labelset["name"] for labelset in tree['labelsets'] if "rank" in labelset]
     for annotation in tree['annotations']:
         if annotation['labelset'] in ranked_labelsets:
-            node = annotation.copy()
-            out['nodes'].append(node)
-            out['edges'].add((node['cell_set_accession'], node.get('parent_cell_set_accession', '')))
+            _add_dendrogram_node(out, annotation)
     # if 'node_attributes' in tree.keys():
     #     if len(tree['node_attributes']) > 1:
     #         warnings.warn("Don't know how to deal with multiple nodes per recurse")
@@ -0,0 +1,198 @@
+"""
+Pre-indexed DHBA ontology tables. The DHBA symbol, exact synonym and label maps and the part_of closure are extracted
+from the ontology in a single pass and saved as a JSON index, so that the template generators and disclaimer checks
+don't need to download and parse the ontology on every run.
+"""
+import json
+import logging
+import os
+import tempfile
+
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDFS, OWL
+
+log = logging.getLogger(__name__)
+
+RESOURCES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../dendrograms/resources/")
+# manually applied closure over part_of using relation graph
+DHBA_ONTOLOGY_PATH = os.path.join(RESOURCES_PATH, "dhbao-base-materialized.owl")
+DHBA_INDEX_PATH = os.path.join(RESOURCES_PATH, "dhba_index.json")
+
+DHBA_BASE = "https://purl.brain-bican.org/ontology/dhbao/DHBA_"
+DHBA_PREFIX = "DHBA:"
+
+OBO = Namespace("http://purl.obolibrary.org/obo/")
+OBO_IN_OWL = Namespace("http://www.geneontology.org/formats/oboInOwl#")
+SYMBOL = OBO.IAO_0000028
+PART_OF = OBO.BFO_0000050
+
+# increment when the content or the structure of the index changes
+DHBA_INDEX_VERSION = 1
+
+
+class DhbaIndex:
+    """
+    DHBA symbol, synonym and label maps and the part_of closure, keyed by DHBA CURIEs ('DHBA:10333').
+    """
+
+    def __init__(self, symbols, synonyms, labels, part_of):
+        """
+        Args:
+            symbols: dict of region symbols (IAO:0000028) - ids
+            synonyms: dict of region exact synonyms - ids
+            labels: dict of ids - lower case labels
+            part_of: dict of ids - set of the ids of all regions they are part of
+        """
+        self.symbols = symbols
+        self.synonyms = synonyms
+        self.labels = labels
+        self.part_of = part_of
+
+    def is_part_of(self, region, container):
+        """
+        Checks if the region is the container region or one of its parts.
+        Args:
+            region: DHBA id of the region
+            container: DHBA id of the container region
+        Returns:
+            bool
+        """
+        return region == container or container in self.part_of.get(region, ())
+
+    def to_json(self):
+        return {"version": DHBA_INDEX_VERSION,
+                "symbols": self.symbols,
+                "synonyms": self.synonyms,
+                "labels": self.labels,
+                "part_of": {region: sorted(containers) for region, containers in sorted(self.part_of.items())}}
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != DHBA_INDEX_VERSION:
+            raise ValueError("Unsupported DHBA index version: {}".format(data.get("version")))
+        return cls(data["symbols"], data["synonyms"], data["labels"],
+                   {region: set(containers) for region, containers in data["part_of"].items()})
+
+
+def to_dhba_id(iri):
+    """
+    Returns the DHBA CURIE of a DHBA IRI, or None for other IRIs.
+    """
+    iri = str(iri)
+    if iri.startswith(DHBA_BASE):
+        return DHBA_PREFIX + iri.split("_")[-1]
+    return None
+
+
+def build_dhba_index(graph):
+    """
+    Indexes the DHBA classes of the ontology graph. part_of relations are read from both the materialized
+    (direct) triples and the OWL existential restrictions.
+    Args:
+        graph: rdflib Graph of the DHBA ontology
+    Returns:
+        DhbaIndex
+    """
+    symbols = dict()
+    synonyms = dict()
+    labels = dict()
+    parents = dict()
+    restrictions = dict()
+    for s, p, o in graph:
+        if p == OWL.onProperty or p == OWL.someValuesFrom:
+            restrictions.setdefault(s, dict())[p] = o
+        dhba_id = to_dhba_id(s)
+        if dhba_id is None:
+            if p == PART_OF:
+                parents.setdefault(str(s), set()).add(str(o))
+            continue
+        if p == SYMBOL:
+            symbols[str(o).strip()] = dhba_id
+        elif p == OBO_IN_OWL.hasExactSynonym:
+            synonyms[str(o).strip()] = dhba_id
+        elif p == RDFS.label:
+            labels[dhba_id] = str(o).strip().lower()
+        elif p == PART_OF:
+            parents.setdefault(str(s), set()).add(str(o))
+
+    for s, restriction in graph.subject_objects(RDFS.subClassOf):
+        restriction = restrictions.get(restriction)
+        if restriction and restriction.get(OWL.onProperty) == PART_OF and OWL.someValuesFrom in restriction:
+            parents.setdefault(str(s), set()).add(str(restriction[OWL.someValuesFrom]))
+
+    closure = dict()
+    part_of = dict()
+    for iri in parents:
+        dhba_id = to_dhba_id(iri)
+        if dhba_id:
+            part_of[dhba_id] = {to_dhba_id(container) for container in _get_containers(iri, parents, closure)
+                                if to_dhba_id(container)}
+    return DhbaIndex(symbols, synonyms, labels, part_of)
+
+
+def _get_containers(iri, parents, closure):
+    """
+    Returns all regions the region is part of, using and filling the closure memo.
+    """
+    if iri in closure:
+        return closure[iri]
+    closure[iri] = set()  # guards against part_of cycles
+    containers = set()
+    for parent in parents.get(iri, ()):
+        containers.add(parent)
+        containers.update(_get_containers(parent, parents, closure))
+    closure[iri] = containers
+    return containers
+
+
+def write_dhba_index(dhba_index, index_path):
+    """
+    Saves the index, replacing the previous one atomically.
+    Args:
+        dhba_index: DhbaIndex to save
+        index_path: Path of the JSON index
+    """
+    index_dir = os.path.dirname(index_path) or "."
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=index_dir, suffix=".tmp", delete=False) as f:
+        json.dump(dhba_index.to_json(), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(f.name, index_path)
+
+
+def generate_dhba_index(ontology_path, index_path):
+    """
+    Builds the index of a local DHBA ontology file.
+    Args:
+        ontology_path: Path of the DHBA ontology (RDF/XML)
+        index_path: Path of the JSON index
+    Returns:
+        DhbaIndex
+    """
+    graph = Graph()
+    graph.parse(ontology_path, format="xml")
+    dhba_index = build_dhba_index(graph)
+    write_dhba_index(dhba_index, index_path)
+    return dhba_index
+
+
+def read_dhba_index(index_path=DHBA_INDEX_PATH, ontology_path=DHBA_ONTOLOGY_PATH):
+    """
+    Reads the DHBA index. The index is (re)built from the local ontology if it is missing or older than the
+    ontology.
+    Args:
+        index_path: Path of the JSON index
+        ontology_path: Path of the local DHBA ontology
+    Returns:
+        DhbaIndex
+    """
+    has_ontology = os.path.isfile(ontology_path)
+    if os.path.isfile(index_path) and not (has_ontology and
+                                           os.path.getmtime(ontology_path) > os.path.getmtime(index_path)):
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                return DhbaIndex.from_json(json.load(f))
+        except ValueError as e:
+            log.warning("Ignoring unreadable DHBA index {}: {}".format(index_path, e))
+    if has_ontology:
+        return generate_dhba_index(ontology_path, index_path)
+    raise FileNotFoundError("Neither the DHBA index {} nor the DHBA ontology {} exists, run 'make dhba_index' in the "
+                            "dendrograms folder.".format(index_path, ontology_path))
@@ -6,7 +6,6 @@ Following inconsistency checks are performed:
 - Clusters where NT in name is not supported by marker analysis
   Check: https://github.com/Cellular-Semantics/WMB_taxonomy_hacking/blob/location_experiments/Test_NT.ipynb
 """
-import os
 import re
 from typing import Optional
 
@@ -14,11 +13,10 @@ import pandas as pd
 import networkx as nx
 from rdflib import Graph
 
-# manually applied closure over part_of using relation graph
-ABAO_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../dendrograms/resources/dhbao-base-materialized.owl")
-
-# Singleton materialized graph
-aba_ontology = None
+from region_frequencies import RegionFrequencyMatrix
+from dhba_index import read_dhba_index, DHBA_BASE
+from cluster_annotations import get_cluster_annotations, CCF_ACRONYM_FREQ, GROUP_ACCESSION
+from shared_inputs import load_shared_input
 
 
 def get_neurotransmitter_inconsistencies(cluster_annotations_path: str) -> dict:
@@ -26,7 +24,7 @@ def get_neurotransmitter_inconsistencies(cluster_annotations_path: str) -> dict:
     Returns the list of cell sets names that include neurotransmitter unsupported by marker analysis.
     """
     # TODO: We don't have NT annotations for the clusters yet, so skipping this check for now
-    # clusters = pd.read_csv(cluster_annotations_path).dropna(subset=['cluster_id_label'])
+    # clusters = get_cluster_annotations(cluster_annotations_path).frame.dropna(subset=['cluster_id_label'])
     # cluster_nt_df = clusters[
     #     ['cluster_id_label', 'nt_type_label', 'nt_type_combo_label']].set_index('cluster_id_label')
     # cluster_2_nt = cluster_nt_df.to_dict(orient='index')
@@ -126,19 +124,29 @@ def get_anatomical_location_inconsistencies(cluster_annotations_path: str) -> di
     """
     Returns the list of cell sets names that include anatomical location unsupported by CCF.
     """
-    clusters = pd.read_csv(cluster_annotations_path).dropna(subset=['accession_group'])
+    annotations = get_cluster_annotations(cluster_annotations_path)
+    clusters = annotations.frame.dropna(subset=[GROUP_ACCESSION])
     inconsistencies = dict()
     # TODO : re-enable the checks after fixing the location associations in the taxonomy
-    # inconsistencies.update(check_cluster_level_name_consistency(clusters))
-    # inconsistencies.update(check_supertype_level_name_consistency(clusters))
+    # ccf_acronym_freqs = annotations.get_region_frequencies(CCF_ACRONYM_FREQ)
+    # inconsistencies.update(check_cluster_level_name_consistency(clusters, ccf_acronym_freqs=ccf_acronym_freqs))
+    # inconsistencies.update(check_supertype_level_name_consistency(clusters, ccf_acronym_freqs=ccf_acronym_freqs))
     return inconsistencies
 
 
-def check_cluster_level_name_consistency(clusters: pd.DataFrame, log_inconsistencies: bool = False) -> dict:
+def check_cluster_level_name_consistency(clusters: pd.DataFrame, log_inconsistencies: bool = False,
+                                         ccf_acronym_freqs: Optional[RegionFrequencyMatrix] = None) -> dict:
     """
     For each cluster checks if location names are supported by CCF_acronyms.
     We are abandoning this approach since a siblings based (supertype level) analysis makes more sense
+    Parameters:
+        clusters: cluster annotations
+        log_inconsistencies: print the inconsistencies
+        ccf_acronym_freqs: CCF_acronym.freq region frequencies indexed like the clusters. Parsed from the clusters
+        if not given.
     """
+    if ccf_acronym_freqs is None:
+        ccf_acronym_freqs = RegionFrequencyMatrix.from_series(clusters[CCF_ACRONYM_FREQ])
     inconsistencies = dict()
     for index, row in clusters.iterrows():
         locations = get_location_symbols(row['Group'])
@@ -147,8 +155,7 @@ def check_cluster_level_name_consistency(clusters: pd.DataFrame, log_inconsisten
                 # ignore some values for now
                 continue
             if get_mba_entity(location) and not pd.isna(row["CCF_acronym.freq"]):
-                ccf_acronym_str = row["CCF_acronym.freq"]
-                ccf_acronyms = [n.split(':')[0] for n in ccf_acronym_str.split(',') if (ccf_acronym_str and (re.match('^[A-Z].*', n)))]
+                ccf_acronyms = get_ccf_acronyms(ccf_acronym_freqs, index)
                 # print(row['cluster_id_label'] + "  " + location + "  " + str(ccf_acronyms))
                 if ccf_acronyms and not is_location_supported(location, ccf_acronyms):
                     locations = inconsistencies.get(row['cluster_id_label'], [])
@@ -159,10 +166,18 @@ def check_cluster_level_name_consistency(clusters: pd.DataFrame, log_inconsisten
     return inconsistencies
 
 
-def check_supertype_level_name_consistency(clusters: pd.DataFrame, log_inconsistencies: bool = False) -> dict:
+def check_supertype_level_name_consistency(clusters: pd.DataFrame, log_inconsistencies: bool = False,
+                                           ccf_acronym_freqs: Optional[RegionFrequencyMatrix] = None) -> dict:
     """
     Checks if anatomical locations mentioned in the supertypes are supported by their child (cluster) CCF_acronyms.
+    Parameters:
+        clusters: cluster annotations
+        log_inconsistencies: print the inconsistencies
+        ccf_acronym_freqs: CCF_acronym.freq region frequencies indexed like the clusters. Parsed from the clusters
+        if not given.
     """
+    if ccf_acronym_freqs is None:
+        ccf_acronym_freqs = RegionFrequencyMatrix.from_series(clusters[CCF_ACRONYM_FREQ])
     inconsistencies = dict()
     last_supertype = None
     last_supertype_ccfs = set()
@@ -187,29 +202,23 @@ def check_supertype_level_name_consistency(clusters: pd.DataFrame, log_inconsist
 
         # cumulatively collect CCF_acronym locations
         if not pd.isna(row["CCF_acronym.freq"]):
-            ccf_acronym_str = row["CCF_acronym.freq"]
-            ccf_acronyms = [n.split(':')[0] for n in ccf_acronym_str.split(',') if
-                            (ccf_acronym_str and (re.match('^[A-Z].*', n)))]
-            last_supertype_ccfs.update(ccf_acronyms)
+            last_supertype_ccfs.update(get_ccf_acronyms(ccf_acronym_freqs, index))
     return inconsistencies
 
+
+def get_ccf_acronyms(ccf_acronym_freqs: RegionFrequencyMatrix, cluster) -> list:
+    """
+    Returns the CCF acronyms of the cluster, ignoring the region symbols that are not acronyms (such as 'na').
+    """
+    return [symbol for symbol in ccf_acronym_freqs.get_region_symbols(cluster) if re.match('^[A-Z].*', symbol)]
+
 def get_mba_entity(symbol: str) -> Optional[str]:
     """
     Returns the IRI of the MBA class with the given symbol.
     """
-    query = f"""
-    PREFIX OBO: <http://purl.obolibrary.org/obo/>
-    SELECT ?entity
-    WHERE {{
-        ?entity OBO:IAO_0000028 "{symbol}" .
-    }}
-    """
-
-    results = get_mba_ontology().query(query)
-
-    for row in results:
-        return str(row.entity)
-
+    dhba_id = get_dhba_index().symbols.get(symbol)
+    if dhba_id:
+        return DHBA_BASE + dhba_id.split(":")[-1]
     return None
 
 
@@ -219,23 +228,11 @@ def is_location_supported(label_symbol: str, mba_symbols: list):
     """
     if label_symbol in mba_symbols:
         return True
-    location_class = get_mba_entity(label_symbol)
+    index = get_dhba_index()
+    location_class = index.symbols.get(label_symbol)
     if location_class:
-        symbols_values = " ".join(f'"{symbol}"' for symbol in mba_symbols)
-
-        query = f"""
-        PREFIX OBO: <http://purl.obolibrary.org/obo/>
-        SELECT ?subclass
-        WHERE {{
-            VALUES ?symbol {{ {symbols_values} }}
-
-            ?class OBO:IAO_0000028 "{label_symbol}" .
-            ?subclass OBO:BFO_0000050* ?class;
-                      OBO:IAO_0000028 ?symbol .
-        }}
-        """
-        results = get_mba_ontology().query(query)
-        return any(results)
+        return any(index.is_part_of(index.symbols[symbol], location_class)
+                   for symbol in mba_symbols if symbol in index.symbols)
     else:
         print("Unknown mba_class: " + label_symbol)
 
@@ -267,9 +264,9 @@ def get_location_symbols(cell_label: str) -> list:
     return locations
 
 
-def get_mba_ontology():
-    global aba_ontology
-    if not aba_ontology:
-        aba_ontology = Graph()
-        aba_ontology.parse(ABAO_PATH, format="xml")
-    return aba_ontology
\ No newline at end of file
+def get_dhba_index():
+    """
+    Returns the pre-indexed DHBA ontology, shared with the template generators (see
+    template_generation_tools.get_dhba_index).
+    """
+    return load_shared_input(read_dhba_index)
@@ -10,6 +10,7 @@ from typing import List, Dict
 import pandas as pd
 from template_generation_utils import read_csv, read_csv_to_dict, read_taxonomy_details_yaml, index_dendrogram
 from dendrogram_tools import cas_json_2_nodes_n_edges
+from template_sidecar import read_template_columns, get_list_values
 
 ENSEMBL_PREFIX = "ensembl:"
 
@@ -508,6 +509,12 @@ def extract_ensembl_terms(patterns_dir, output_path):
     gene_ids = set()
     tsv_files = glob.glob(os.path.join(patterns_dir, "*_marker_set.tsv"))
     for marker_set_file in tsv_files:
+        sidecar_columns = read_template_columns(marker_set_file, ["Markers"])
+        if sidecar_columns is not None:
+            if "Markers" in sidecar_columns.column_names:
+                genes = get_list_values(sidecar_columns, "Markers").unique()
+                gene_ids.update(gene.strip() for gene in genes.to_pylist())
+            continue
         with open(marker_set_file, mode="r", newline="") as f:
             reader = csv.DictReader(f, delimiter="\t")
             # Check if the file has a "Markers" column
@@ -0,0 +1,142 @@
+"""
+Gene symbol resolver. Gene names are looked up by exact name, case-folded name, synonym and finally by case-folded
+substring through a character n-gram index, so that no lookup has to scan the whole gene database.
+"""
+from collections.abc import Mapping
+
+EXACT = "exact"
+CASEFOLD = "casefold"
+ALIAS = "alias"
+SUBSTRING = "substring"
+
+
+class GeneMatch:
+    """
+    Result of a gene lookup.
+    """
+
+    __slots__ = ("query", "name", "id", "quality")
+
+    def __init__(self, query, name, gene_id, quality):
+        self.query = query
+        self.name = name
+        self.id = gene_id
+        self.quality = quality
+
+    def __repr__(self):
+        return "GeneMatch({!r}, {!r}, {!r}, {!r})".format(self.query, self.name, self.id, self.quality)
+
+
+class GeneIndex(Mapping):
+    """
+    Read-only gene name -> gene ID mapping with fuzzy lookups. Behaves as the plain gene db dictionary for exact names.
+    """
+
+    def __init__(self, genes, synonyms=None, ngram_size=3):
+        """
+        Args:
+            genes: dictionary of gene names to gene IDs
+            synonyms: optional dictionary of gene synonyms to gene names
+            ngram_size: length of the character n-grams of the substring index
+        """
+        self.genes = dict(genes)
+        self.ngram_size = ngram_size
+        self.names = sorted(self.genes)
+        self.folded_names = [name.casefold() for name in self.names]
+        self.casefolded = dict()
+        for name, folded in zip(self.names, self.folded_names):
+            self.casefolded.setdefault(folded, name)
+        self.aliases = dict()
+        for synonym, name in (synonyms or dict()).items():
+            if name in self.genes:
+                self.aliases.setdefault(synonym.casefold(), name)
+        self.ngrams = dict()
+        for position, folded in enumerate(self.folded_names):
+            for ngram in self._ngrams(folded):
+                self.ngrams.setdefault(ngram, set()).add(position)
+        self.misses = set()
+
+    def _ngrams(self, text):
+        return {text[i:i + self.ngram_size] for i in range(len(text) - self.ngram_size + 1)}
+
+    def __getitem__(self, name):
+        return self.genes[name]
+
+    def __contains__(self, name):
+        return name in self.genes
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def lookup(self, gene_name):
+        """
+        Finds the gene of the given name. Tries the exact name, the case-folded name, the synonyms and finally the
+        genes whose case-folded name contains the given name. Of the substring matches the shortest gene name wins,
+        ties are broken alphabetically so that the result is deterministic.
+        Args:
+            gene_name: gene name to look up
+        Returns:
+            GeneMatch or None if the gene is not found
+        """
+        query = gene_name.strip()
+        if query in self.genes:
+            return GeneMatch(gene_name, query, self.genes[query], EXACT)
+        if query in self.misses:
+            return None
+        folded = query.casefold()
+        if folded in self.casefolded:
+            name = self.casefolded[folded]
+            return GeneMatch(gene_name, name, self.genes[name], CASEFOLD)
+        if folded in self.aliases:
+            name = self.aliases[folded]
+            return GeneMatch(gene_name, name, self.genes[name], ALIAS)
+        name = self._find_substring(folded)
+        if name is None:
+            self.misses.add(query)
+            return None
+        return GeneMatch(gene_name, name, self.genes[name], SUBSTRING)
+
+    def _find_substring(self, folded):
+        if len(folded) < self.ngram_size:
+            candidates = range(len(self.names))
+        else:
+            candidates = None
+            for ngram in self._ngrams(folded):
+                postings = self.ngrams.get(ngram)
+                if not postings:
+                    return None
+                candidates = postings if candidates is None else candidates & postings
+        matches = [position for position in candidates if folded in self.folded_names[position]]
+        if not matches:
+            return None
+        return self.names[min(matches, key=lambda position: (len(self.names[position]), position))]
+
+    def bulk_lookup(self, gene_names):
+        """
+        Looks up all given gene names.
+        Args:
+            gene_names: iterable of gene names
+        Returns:
+            dict: gene name -> GeneMatch, or None for the genes that are not found
+        """
+        matches = dict()
+        for gene_name in gene_names:
+            if gene_name not in matches:
+                matches[gene_name] = self.lookup(gene_name)
+        return matches
+
+
+def as_gene_index(gene_db):
+    """
+    Returns the given gene db as a GeneIndex, indexing plain dictionaries.
+    Args:
+        gene_db: GeneIndex or dictionary of gene names to gene IDs
+
+    Returns: GeneIndex
+    """
+    if isinstance(gene_db, GeneIndex):
+        return gene_db
+    return GeneIndex(gene_db)
@@ -0,0 +1,177 @@
+"""
+Concurrent loading of independent inputs. Loaders are declared with their dependencies and run as futures as soon as
+their dependencies are loaded: I/O bound loaders (file reading, downloads, XML parsing) in threads and CPU bound
+loaders in forked processes. The load time of each input is recorded, so that the critical path of the loading can
+be reported.
+"""
+import concurrent.futures
+import contextlib
+import logging
+import multiprocessing
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+LoaderTiming = namedtuple("LoaderTiming", ["name", "process", "requires", "submitted", "duration", "finished"])
+LoaderTiming.__doc__ = """
+Load time of an input, in seconds since the start of the scheduler run.
+    name: input name
+    process: True if the input was loaded in a worker process
+    requires: names of the inputs it depends on
+    submitted: time its loader was submitted, once its dependencies were loaded
+    duration: run time of its loader
+    finished: time its result was available
+"""
+
+_LoaderTask = namedtuple("_LoaderTask", ["name", "loader", "args", "kwargs", "requires", "process", "on_result"])
+
+
+def _run_timed(loader, args, kwargs):
+    start = time.perf_counter()
+    result = loader(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class LoaderScheduler:
+    """
+    Runs input loaders concurrently, respecting their declared dependencies.
+    """
+
+    def __init__(self, max_workers=None, max_process_workers=None):
+        """
+        Args:
+            max_workers: maximum number of loader threads, defaults to the ThreadPoolExecutor default
+            max_process_workers: maximum number of loader processes, defaults to the number of process loaders up to
+            the number of CPUs
+        """
+        self.max_workers = max_workers
+        self.max_process_workers = max_process_workers
+        self.tasks = dict()
+        self.results = dict()
+        self.timings = dict()
+
+    def add(self, name, loader, args=(), kwargs=None, requires=(), process=False, on_result=None):
+        """
+        Declares an input loader.
+        Args:
+            name: unique input name
+            loader: function that loads the input. Process loaders and their arguments and results must be picklable.
+            args: loader arguments
+            kwargs: loader keyword arguments
+            requires: names of the (previously declared) inputs that must be loaded before this one
+            process: run the loader in a worker process instead of a thread, for CPU bound loaders. Runs in a thread if
+            fork is not supported by the platform.
+            on_result: optional function called with the loaded input, in the thread running the scheduler
+        """
+        if name in self.tasks:
+            raise ValueError("Input '{}' is already declared".format(name))
+        for required in requires:
+            if required not in self.tasks:
+                raise ValueError("Input '{}' requires the undeclared input '{}'".format(name, required))
+        self.tasks[name] = _LoaderTask(name, loader, tuple(args), dict(kwargs or {}), tuple(requires), process,
+                                       on_result)
+
+    def run(self):
+        """
+        Loads all declared inputs and waits for them. If a loader fails, the inputs depending on it are not loaded
+        and the first error (in declaration order) is raised once the other loaders are done.
+        Returns:
+            dict: input names to loaded inputs
+        """
+        use_processes = "fork" in multiprocessing.get_all_start_methods()
+        process_count = sum(1 for task in self.tasks.values() if task.process) if use_processes else 0
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for required in task.requires:
+                dependents[required].append(task.name)
+        waiting = {name: len(task.requires) for name, task in self.tasks.items()}
+        errors = dict()
+        start = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix="loader") as threads, \
+                self._get_process_executor(process_count) as processes:
+            running = dict()
+
+            def submit(task):
+                in_process = bool(task.process and processes)
+                future = (processes if in_process else threads).submit(_run_timed, task.loader, task.args, task.kwargs)
+                running[future] = (task, in_process, time.perf_counter() - start)
+
+            def skip(name, error):
+                errors[name] = error
+                for dependent in dependents[name]:
+                    if dependent not in errors:
+                        skip(dependent, error)
+
+            for task in self.tasks.values():
+                if not task.requires:
+                    submit(task)
+            while running:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task, in_process, submitted = running.pop(future)
+                    finished = time.perf_counter() - start
+                    try:
+                        result, duration = future.result()
+                    except Exception as e:
+                        self.timings[task.name] = LoaderTiming(task.name, in_process, task.requires, submitted,
+                                                               finished - submitted, finished)
+                        skip(task.name, e)
+                        continue
+                    self.timings[task.name] = LoaderTiming(task.name, in_process, task.requires, submitted,
+                                                           duration, finished)
+                    self.results[task.name] = result
+                    if task.on_result:
+                        task.on_result(result)
+                    for dependent in dependents[task.name]:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0 and dependent not in errors:
+                            submit(self.tasks[dependent])
+
+        for name in self.tasks:
+            if name in errors:
+                raise errors[name]
+        return self.results
+
+    def _get_process_executor(self, process_count):
+        if not process_count:
+            return contextlib.nullcontext()
+        workers = min(process_count, multiprocessing.cpu_count())
+        if self.max_process_workers:
+            workers = min(workers, self.max_process_workers)
+        executor = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+        # fork all workers before any loader thread is started
+        executor.submit(int).result()
+        return executor
+
+    def get_critical_path(self):
+        """
+        Returns the chain of inputs that determined the total load time: the last loaded input, preceded by its last
+        loaded dependency and so on.
+        Returns:
+            list of LoaderTiming, in load order
+        """
+        path = []
+        timing = max(self.timings.values(), key=lambda t: t.finished, default=None)
+        while timing is not None:
+            path.append(timing)
+            timing = max((self.timings[required] for required in timing.requires if required in self.timings),
+                         key=lambda t: t.finished, default=None)
+        return path[::-1]
+
+    def log_timings(self, title="Inputs"):
+        """
+        Logs the load times of the inputs and the critical path.
+        Args:
+            title: name of the loaded input set
+        """
+        for timing in sorted(self.timings.values(), key=lambda t: t.finished):
+            log.info("{} - {}: {:.3f}s ({}), submitted at {:.3f}s, loaded at {:.3f}s"
+                     .format(title, timing.name, timing.duration, "process" if timing.process else "thread",
+                             timing.submitted, timing.finished))
+        path = self.get_critical_path()
+        if path:
+            log.info("{} loaded in {:.3f}s, critical path: {}".format(title, path[-1].finished,
+                                                                     " -> ".join(timing.name for timing in path)))
+
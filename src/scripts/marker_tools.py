@@ -1,11 +1,11 @@
 import csv
-import networkx as nx
 import pandas as pd
 import logging
 import os
 
-from template_generation_utils import get_root_nodes, read_taxonomy_config, generate_dendrogram_tree, index_dendrogram, read_csv_to_dict
+from template_generation_utils import get_root_nodes, read_taxonomy_config, index_dendrogram, read_csv_to_dict
 from dendrogram_tools import cas_json_2_nodes_n_edges
+from taxonomy_tree import TaxonomyTree, as_taxonomy_tree
 # from nomenclature_tools import nomenclature_2_nodes_n_edges
 
 CLUSTER = "cluster"
@@ -56,7 +56,7 @@ def generate_denormalised_marker(dend_data, flat_marker_path, output_marker_path
     """
     if root_terms is None:
         root_terms = []
-    tree = generate_dendrogram_tree(dend_data)
+    tree = TaxonomyTree.from_dendrogram(dend_data)
     marker_expressions = read_marker_file(flat_marker_path)
     marker_extended_expressions = extend_expressions(tree, marker_expressions, root_terms)
     generate_marker_table(marker_extended_expressions, output_marker_path)
@@ -91,13 +91,14 @@ def extend_expressions(tree, marker_expressions, root_terms=None):
     """
     Utilizes tree to extend expression definitions of the marker expressions
     Args:
-        tree: networkx directed graph that represents the taxonomy
+        tree: TaxonomyTree or networkx directed graph that represents the taxonomy
         marker_expressions: marker file content as dict
         root_terms: 'cell_set_accession' of terms. So that algorithm could be applied to a subtree
 
     Returns: new marker file content with taxonomy based expression enrichment
 
     """
+    tree = as_taxonomy_tree(tree)
     check_root_terms(root_terms, marker_expressions)
     marker_extended_expressions = {}
 
@@ -133,14 +134,14 @@ def inherit_parent_expressions(tree, root_terms, term, marker_expressions, exten
     """
     Enrich child node data with the parent data. Parent and child both must be in the subtree.
     Args:
-        tree: networkx directed graph that represents the taxonomy tree
+        tree: TaxonomyTree that represents the taxonomy tree
         root_terms: list of root terms to define subtrees
         term: child node to enrich
         marker_expressions: marker data
         extended_expressions: set of expressions to be enriched with the parent data
 
     """
-    for parent in nx.ancestors(tree, term):
+    for parent in tree.ancestors(term):
         if is_in_subtree(tree, root_terms, parent) and parent in marker_expressions.keys():
             extended_expressions.update(marker_expressions[parent][EXPRESSIONS])
 
@@ -149,19 +150,17 @@ def is_in_subtree(tree, root_terms, term):
     """
     Checks if given term is under subtree of given root_terms in the tree
     Args:
-        tree: networkx directed graph that represents the taxonomy tree
+        tree: TaxonomyTree that represents the taxonomy tree
         root_terms: list of root terms to check their subtrees
         term: term to check
 
     Returns: true if term is in one of the subtrees of given root terms, false otherwise
 
     """
-    ancestors = nx.ancestors(tree, term)
-    ancestors.add(term)
     if not root_terms:
         # list is empty
         return True
-    return not ancestors.isdisjoint(root_terms)
+    return tree.in_subtrees(root_terms, term)
 
 
 def generate_marker_table(marker_data, output_filepath):
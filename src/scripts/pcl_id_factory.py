@@ -33,26 +33,33 @@ class PCLIdFactory(BaseIdFactory):
         "http://purl.obolibrary.org/obo/pcl/", "PCL_INDV:"
     ]
 
+    INDIVIDUAL_PREFIXES = ["http://purl.obolibrary.org/obo/pcl/", "PCL_INDV:"]
+
     LABELSET_SYMBOLS = {"NEIGH": "Neighborhood",
                         "CLASS": "Class",
                         "SUBCL": "Subclass",
                         "GROUP": "Group",
                         "CLUST": "Cluster"}
 
-    def __init__(self, taxonomy):
-        self.taxonomies = self.read_taxonomy_details_yaml()
+    def __init__(self, taxonomy, taxonomy_details=None):
+        self.taxonomies = taxonomy_details if taxonomy_details is not None else self.read_taxonomy_details_yaml()
         self.taxonomy_ids = [taxon["Taxonomy_id"] for taxon in self.taxonomies]
         ranked_labelsets = [labelset for labelset in taxonomy['labelsets'] if "rank" in labelset]
         self.labelsets = [labelset["name"] for labelset in sorted(ranked_labelsets, key=lambda x: x["rank"], reverse=True)]
-        annotation_count = sum(1 for node in taxonomy['annotations'])
+        # the taxonomy can have the annotation summary instead of the annotations
+        annotation_summary = self.get_annotation_summary(taxonomy)
+        labelset_counts = annotation_summary['labelset_counts']
+        annotation_count = sum(labelset_counts.values())
 
         # class ranges per labelset
         self.class_ranges = {}
         id_range = ID_RANGE_BASE
         for labelset in self.labelsets:
             self.class_ranges[labelset] = id_range
-            id_range = id_range + int(sum(1 for node in taxonomy['annotations'] if node['labelset'] == labelset) * 1.5)  # %50 more than the number of nodes
+            id_range = id_range + int(labelset_counts.get(labelset, 0) * 1.5)  # %50 more than the number of nodes
             id_range = self.round_up_to_nearest(id_range, 1)
+        self.labelset_range_end = id_range
+        self.accession_formats = annotation_summary['accession_formats']
         self.dataset_id_start = id_range + 1
         self.marker_set_id_start = self.round_up_to_nearest(self.dataset_id_start + 50, 2)
         self.nsf_marker_set_start = self.round_up_to_nearest( int(self.marker_set_id_start + (annotation_count * 1.5)) , 1)
@@ -84,6 +91,17 @@ class PCLIdFactory(BaseIdFactory):
         return str(pcl_id).zfill(7)
 
 
+    def get_labelset_ranges(self):
+        return self.class_ranges
+
+    def get_id_displacements(self):
+        return {"class": 0,
+                "marker_gene_set": self.marker_set_id_start - ID_RANGE_BASE,
+                "nsf_marker_gene_set": self.nsf_marker_set_start - ID_RANGE_BASE,
+                "ws_marker_gene_set": self.ws_marker_set_id_start - ID_RANGE_BASE,
+                "evidence_marker_gene_set": self.evidence_marker_set_id_start - ID_RANGE_BASE}
+
+
     def get_taxonomy_id(self, taxonomy_id):
         """
         DEPRECATED: now individuals use accession_id
@@ -184,39 +202,6 @@ class PCLIdFactory(BaseIdFactory):
         return str(pcl_id).zfill(7)
 
 
-# def get_reverse_id(pcl_id_str):
-#     """
-#     Converts PCL id to cell cet accession id
-#     Args:
-#         pcl_id_str: PCL id
-#     Returns: cell cet accession id
-#     """
-#     if str(pcl_id_str).startswith("http://purl.obolibrary.org/obo/pcl/") or str(pcl_id_str).startswith("PCL_INDV:"):
-#         pcl_id_str = str(pcl_id_str).replace("http://purl.obolibrary.org/obo/pcl/", "")
-#         pcl_id_str = str(pcl_id_str).replace("PCL_INDV:", "")
-#         return pcl_id_str
-#
-#     pcl_id_str = str(pcl_id_str).replace("http://purl.obolibrary.org/obo/PCL_", "")
-#     pcl_id_str = str(pcl_id_str).replace("PCL:", "")
-#     pcl_id_str = str(pcl_id_str).replace("PCL_", "")
-#
-#     pcl_id = int(pcl_id_str)
-#
-#     taxonomy_index = int((pcl_id - ID_RANGE_BASE) / TAXONOMY_ID_RANGE)
-#     taxonomy_id = taxonomy_ids[taxonomy_index].replace("CCN", "CS")
-#
-#     node_id = (pcl_id - ID_RANGE_BASE) - (TAXONOMY_ID_RANGE * taxonomy_index)
-#     if node_id > INDV_ID_DISPLACEMENT:
-#         node_id = node_id - INDV_ID_DISPLACEMENT
-#
-#     if taxonomy_id == "CS1908210":
-#         accession_id = taxonomy_id + str(node_id).zfill(3)
-#     else:
-#         accession_id = taxonomy_id + "_" + str(node_id)
-#
-#     return accession_id
-
-
 def is_pcl_id(id_str):
     """
     Returns 'True' if given id is PCL id.
@@ -0,0 +1,132 @@
+"""
+Sparse cluster x brain region frequency matrices of the consensus annotation CCF columns. Frequency columns such as
+'CCF_broad.freq' hold 'region:frequency' lists ("STR:0.85,PAL:0.12,na:0.03"). They are parsed once for the whole
+annotation table into compressed sparse row arrays, with the region symbols interned, so that thresholding and DHBA
+region assignment run over all clusters at once instead of re-parsing the strings of each cluster.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# region symbol used by the annotations for cells outside the parcellation, assigned to the whole brain
+NA_REGION = "na"
+ROOT_REGION = "root"
+
+RegionAssignment = namedtuple("RegionAssignment", ["mbas", "texts", "percentages", "missed"])
+RegionAssignment.__doc__ = """
+DHBA regions of a cluster, sorted by DHBA id and text.
+    mbas: DHBA ids of the regions
+    texts: 'label (region, frequency)' descriptions of the regions
+    percentages: cell frequencies of the regions
+    missed: region symbols above the threshold that have no DHBA id
+"""
+
+EMPTY_ASSIGNMENT = RegionAssignment((), (), (), ())
+
+
+class RegionFrequencyMatrix:
+    """
+    Cluster x region frequency matrix in compressed sparse row form: the regions of the cluster at row i are
+    regions[indices[indptr[i]:indptr[i + 1]]] with frequencies data[indptr[i]:indptr[i + 1]], in annotation order.
+    """
+
+    def __init__(self, keys, regions, indptr, indices, data):
+        """
+        Args:
+            keys: cluster keys, one per row
+            regions: array of interned region symbols
+            indptr: row offsets into indices and data
+            indices: region index of each entry
+            data: frequency of each entry
+        """
+        self.keys = list(keys)
+        self.regions = np.asarray(regions, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        self._rows = {key: row for row, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_series(cls, series):
+        """
+        Parses a frequency column.
+        Args:
+            series: 'region:frequency' list strings indexed by cluster key. Missing values are empty rows. Entries
+            without a frequency have frequency 0. For duplicate keys the last row is used.
+        Returns:
+            RegionFrequencyMatrix
+        """
+        series = series[~series.index.duplicated(keep="last")]
+        values = series.fillna("").astype(str).reset_index(drop=True)
+        items = values.str.split(",").explode()
+        items = items[items.str.strip() != ""]
+        parts = items.str.split(":")
+        codes, regions = pd.factorize(parts.str[0].str.strip())
+        data = parts.str[1].str.strip().astype(np.float64).fillna(0).to_numpy()
+        counts = np.bincount(items.index.to_numpy(dtype=np.int64), minlength=len(values))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(series.index, np.asarray(regions, dtype=object), indptr, codes, data)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def get_region_symbols(self, key):
+        """
+        Returns the region symbols of a cluster in annotation order, regardless of their frequency.
+        Args:
+            key: cluster key
+        Returns:
+            list of region symbols, empty for unknown clusters
+        """
+        row = self._rows.get(key)
+        if row is None:
+            return []
+        return self.regions[self.indices[self.indptr[row]:self.indptr[row + 1]]].tolist()
+
+    def get_region_assignments(self, mba_symbols, mba_labels, threshold):
+        """
+        Assigns the regions with a frequency of at least the threshold to DHBA regions, for all clusters at once.
+        Region 'na' is assigned to the whole brain ('root'). When a DHBA region is listed more than once for a
+        cluster, its percentage is the frequency of its first listing.
+        Args:
+            mba_symbols: dict of DHBA symbols - ids
+            mba_labels: dict of DHBA ids - labels
+            threshold: minimum region frequency
+        Returns:
+            dict of cluster keys to RegionAssignment
+        """
+        symbols = [ROOT_REGION if region.lower() == NA_REGION else region for region in self.regions]
+        region_ids = np.array([mba_symbols.get(symbol) for symbol in symbols], dtype=object)
+        rows = np.repeat(np.arange(len(self.keys)), np.diff(self.indptr))
+        selected = np.flatnonzero(self.data >= threshold)
+        entries = pd.DataFrame({"row": rows[selected],
+                                "region": self.regions[self.indices[selected]],
+                                "mba": region_ids[self.indices[selected]],
+                                "percentage": self.data[selected]})
+
+        is_mapped = entries["mba"].notna()
+        missed = entries[~is_mapped].drop_duplicates(["row", "region"]).groupby("row")["region"].agg(tuple)
+        mapped = entries[is_mapped]
+        # entries are in annotation order, so the first percentage of each region is kept
+        percentages = mapped.drop_duplicates(["row", "mba"]).set_index(["row", "mba"])["percentage"]
+        mapped = mapped.assign(text=[mba_labels[mba] + " (" + region + ", " + str(percentage) + ")"
+                                     for mba, region, percentage in
+                                     zip(mapped["mba"], mapped["region"], mapped["percentage"].tolist())])
+        mapped = mapped.sort_values(["row", "mba", "text"], kind="mergesort")
+        mapped = mapped.assign(percentage=percentages.reindex(pd.MultiIndex.from_frame(mapped[["row", "mba"]]))
+                               .to_numpy())
+
+        assignments = dict.fromkeys(self.keys, EMPTY_ASSIGNMENT)
+        for row, group in mapped.groupby("row", sort=False):
+            assignments[self.keys[row]] = RegionAssignment(tuple(group["mba"]), tuple(group["text"]),
+                                                           tuple(group["percentage"].tolist()),
+                                                           missed.get(row, ()))
+        for row, regions in missed.items():
+            if not assignments[self.keys[row]].mbas:
+                assignments[self.keys[row]] = EMPTY_ASSIGNMENT._replace(missed=regions)
+        return assignments
+
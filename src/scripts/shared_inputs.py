@@ -0,0 +1,46 @@
+"""
+Read-only inputs shared by all taxonomies, template generators and disclaimer checks, loaded once per process (see
+load_shared_input).
+"""
+
+# loaded inputs, keyed by loader and loader arguments
+shared_inputs = dict()
+
+
+def load_shared_input(loader, *args, **kwargs):
+    """
+    Returns the loader result, calling the loader only once per process for the same arguments. Shared inputs
+    (gene db, DHBA maps, curation tables etc.) are loaded before forking the template workers, so that the workers
+    inherit them instead of loading them again. Callers must treat the result as read-only.
+    Args:
+        loader: function that loads the input
+        *args: loader arguments
+        **kwargs: loader keyword arguments
+    Returns:
+        loader result
+    """
+    key = (loader, args, tuple(sorted(kwargs.items())))
+    if key not in shared_inputs:
+        shared_inputs[key] = loader(*args, **kwargs)
+    return shared_inputs[key]
+
+
+def schedule_shared_input(scheduler, name, loader, *args, requires=(), process=False, **kwargs):
+    """
+    Declares the loading of a shared input (see load_shared_input) in a LoaderScheduler, so that the shared inputs
+    are loaded concurrently. Inputs that are already loaded are not loaded again.
+    Args:
+        scheduler: LoaderScheduler
+        name: input name, used in the load time report
+        loader: function that loads the input
+        *args: loader arguments
+        requires: names of the inputs that must be loaded before this one
+        process: load the input in a worker process (for CPU bound loaders)
+        **kwargs: loader keyword arguments
+    """
+    key = (loader, args, tuple(sorted(kwargs.items())))
+    if process and key not in shared_inputs:
+        scheduler.add(name, loader, args, kwargs, requires=requires, process=True,
+                      on_result=lambda result: shared_inputs.setdefault(key, result))
+    else:
+        scheduler.add(name, load_shared_input, (loader,) + args, kwargs, requires=requires)
@@ -3,6 +3,8 @@ import argparse
 
 import pandas as pd
 
+from dhba_index import generate_dhba_index, DHBA_ONTOLOGY_PATH, DHBA_INDEX_PATH
+
 C2C_ANNOTATION_MEMBERSHIP = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../dendrograms/supplementary/version2/cluster_to_cluster_annotation_membership.csv")
 
 
@@ -40,10 +42,14 @@ parser.add_argument('-i2', '--input2', help="Path to second input file")
 parser.add_argument('-o', '--output', help="Path to output file")
 parser.add_argument('-b', '--base', help="List of all class base TSV files")
 parser.add_argument('-nt', action='store_true', help="Generate neurotransmitter data.")
+parser.add_argument('-dhba', action='store_true', help="Generate the DHBA ontology index.")
 
 args = parser.parse_args()
 
 if args.nt:
     generate_neurotransmitter_data(args.output)
+elif args.dhba:
+    generate_dhba_index(args.input or DHBA_ONTOLOGY_PATH, args.output or DHBA_INDEX_PATH)
+    print("DHBA index generated at: ", args.output or DHBA_INDEX_PATH)
 else:
     raise ValueError("No action specified")
\ No newline at end of file
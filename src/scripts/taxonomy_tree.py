@@ -0,0 +1,180 @@
+"""
+Array backed taxonomy tree. Nodes are numbered in depth-first pre-order and each node keeps the pre-order interval of
+its subtree, so that ancestor checks are O(1) and subtree enumeration is a list slice.
+"""
+
+
+class TaxonomyTree:
+    """
+    Immutable taxonomy tree built from (child, parent) edges. Empty parents ('' or None) denote root nodes.
+    """
+
+    def __init__(self, edges, nodes=None):
+        """
+        Args:
+            edges: iterable of (child, parent) tuples, such as dend['edges']
+            nodes: optional iterable of nodes to include even if they are not part of any edge
+        """
+        self.nodes = []
+        self.index = dict()
+        if nodes is not None:
+            for node in nodes:
+                self._add_node(node)
+        parent_indexes = dict()
+        for child, parent in edges:
+            child_index = self._add_node(child)
+            if parent:
+                parent_index = self._add_node(parent)
+                # taxonomies are trees, first parent wins if an inconsistent edge is given
+                parent_indexes.setdefault(child_index, parent_index)
+
+        size = len(self.nodes)
+        self.parents = [-1] * size
+        self.child_lists = [[] for _ in range(size)]
+        for child_index in range(size):
+            parent_index = parent_indexes.get(child_index, -1)
+            self.parents[child_index] = parent_index
+            if parent_index >= 0:
+                self.child_lists[parent_index].append(child_index)
+        self.root_indexes = [i for i in range(size) if self.parents[i] < 0]
+        self._number_nodes()
+
+    def _add_node(self, node):
+        node_index = self.index.get(node)
+        if node_index is None:
+            node_index = len(self.nodes)
+            self.index[node] = node_index
+            self.nodes.append(node)
+        return node_index
+
+    def _number_nodes(self):
+        """
+        Iterative depth-first traversal that assigns pre-order numbers (pre) and subtree interval ends (end, exclusive)
+        """
+        size = len(self.nodes)
+        self.pre = [-1] * size
+        self.end = [-1] * size
+        self.depths = [0] * size
+        self.order = []
+        for root in self.root_indexes:
+            stack = [(root, False)]
+            while stack:
+                node_index, visited = stack.pop()
+                if visited:
+                    self.end[node_index] = len(self.order)
+                    continue
+                self.pre[node_index] = len(self.order)
+                self.order.append(node_index)
+                parent_index = self.parents[node_index]
+                if parent_index >= 0:
+                    self.depths[node_index] = self.depths[parent_index] + 1
+                stack.append((node_index, True))
+                for child_index in reversed(self.child_lists[node_index]):
+                    stack.append((child_index, False))
+
+    @classmethod
+    def from_dendrogram(cls, dend):
+        """
+        Builds the tree from dendrogram data (see dendrogram_tools.tree_recurse).
+        Args:
+            dend: dendrogram data
+
+        Returns: TaxonomyTree
+        """
+        if 'parents' in dend:
+            return cls(dend['parents'].items())
+        return cls(dend['edges'])
+
+    @classmethod
+    def from_networkx(cls, tree):
+        """
+        Builds the tree from a networkx directed graph whose edges point from parent to child.
+        Args:
+            tree: networkx directed graph that represents the taxonomy
+
+        Returns: TaxonomyTree
+        """
+        return cls(((child, parent) for parent, child in tree.edges()), nodes=tree.nodes())
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def has_node(self, node):
+        return node in self.index
+
+    @property
+    def roots(self):
+        return [self.nodes[i] for i in self.root_indexes]
+
+    def parent(self, node):
+        """
+        Returns the parent of the node, None for root nodes.
+        """
+        parent_index = self.parents[self.index[node]]
+        return self.nodes[parent_index] if parent_index >= 0 else None
+
+    def children(self, node):
+        return [self.nodes[i] for i in self.child_lists[self.index[node]]]
+
+    def depth(self, node):
+        return self.depths[self.index[node]]
+
+    def is_ancestor(self, ancestor, node):
+        """
+        Returns True if ancestor is a proper ancestor of the node. O(1)
+        """
+        ancestor_index = self.index.get(ancestor)
+        node_index = self.index.get(node)
+        if ancestor_index is None or node_index is None:
+            return False
+        return self.pre[ancestor_index] < self.pre[node_index] < self.end[ancestor_index]
+
+    def is_ancestor_or_self(self, ancestor, node):
+        return ancestor == node and node in self.index or self.is_ancestor(ancestor, node)
+
+    def ancestors(self, node):
+        """
+        Returns the ancestors of the node, starting from its parent up to the root.
+        """
+        ancestors = []
+        parent_index = self.parents[self.index[node]]
+        while parent_index >= 0:
+            ancestors.append(self.nodes[parent_index])
+            parent_index = self.parents[parent_index]
+        return ancestors
+
+    def subtree(self, node):
+        """
+        Returns the node and all of its descendants in pre-order.
+        """
+        node_index = self.index[node]
+        return [self.nodes[i] for i in self.order[self.pre[node_index]:self.end[node_index]]]
+
+    def descendants(self, node):
+        """
+        Returns all descendants of the node in pre-order.
+        """
+        node_index = self.index[node]
+        return [self.nodes[i] for i in self.order[self.pre[node_index] + 1:self.end[node_index]]]
+
+    def in_subtrees(self, roots, node):
+        """
+        Returns True if the node is one of the given roots or a descendant of them.
+        """
+        return any(self.is_ancestor_or_self(root, node) for root in roots)
+
+
+def as_taxonomy_tree(tree):
+    """
+    Returns the given tree as a TaxonomyTree, converting networkx directed graphs.
+    Args:
+        tree: TaxonomyTree or networkx directed graph that represents the taxonomy
+
+    Returns: TaxonomyTree
+    """
+    if isinstance(tree, TaxonomyTree):
+        return tree
+    return TaxonomyTree.from_networkx(tree)
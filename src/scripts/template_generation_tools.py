@@ -1,21 +1,40 @@
+import numpy as np
 import pandas as pd
 import os
 import ast
 import csv
 import json
+import glob
+import hashlib
 import logging
-from rdflib import Graph, Namespace
-from rdflib.namespace import RDFS
-
-from dendrogram_tools import cas_json_2_nodes_n_edges, read_json_file
-from template_generation_utils import read_taxonomy_config, generate_dendrogram_tree, read_csv_to_dict,\
-    get_gross_cell_type, merge_tables, \
-    extract_taxonomy_name_from_path, get_collapsed_nodes, read_one_concept_one_name_tsv, format_cell_label, get_class_membership_dict
+import multiprocessing
+import pickle
+import tempfile
+
+from abc import ABC, abstractmethod
+from functools import cached_property, partial
+
+from dendrogram_tools import read_cas_metadata, stream_cas_json_2_nodes_n_edges
+from taxonomy_tree import TaxonomyTree
+from gene_index import GeneIndex, as_gene_index
+from template_writer import TemplateWriter, ColumnFamily
+from template_sidecar import FLOAT_TYPE, LIST_TYPE
+from template_manifest import (ManifestReader, ManifestWriter, MANIFEST_VERSION, get_manifest_path,
+                               get_fingerprint)
+from template_generation_utils import generate_dendrogram_tree, read_csv_to_dict,\
+    get_gross_cell_type, resolve_all_gross_cell_types, merge_tables, read_taxonomy_details_yaml, get_taxonomy_configuration, \
+    extract_taxonomy_name_from_path, get_collapsed_nodes, read_one_concept_one_name_tsv, format_cell_label, get_class_membership_dict, \
+    get_hierarchy_table, LabelSuffixIndex, TAXONOMY_DETAILS_YAML
 from disclaimer_generator import (get_anatomical_location_inconsistencies, get_location_symbols,
                                   get_neurotransmitter_inconsistencies)
+from base_id_factory import BaseIdFactory
 from pcl_id_factory import PCLIdFactory
 from cl_id_factory import CLIdFactory
 from clm_id_factory import CLMIdFactory
+from cluster_annotations import get_cluster_annotations, CCF_BROAD_FREQ, CCF_ACRONYM_FREQ
+from dhba_index import read_dhba_index
+from loader_scheduler import LoaderScheduler
+from shared_inputs import load_shared_input, schedule_shared_input
 
 log = logging.getLogger(__name__)
 
@@ -54,60 +73,556 @@ ACRONYM_REGION = "CCF acronym region"
 BROAD_REGION = "CCF broad region"
 
 ABC_ATLAS_URL = "https://dev-knowledge.brain-map.org/abcatlas#"
+
+AUTHOR_MARKERS_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                     "../dendrograms/supplementary/version2/AP_WMB_evaluation_author_markers")
+AUTHOR_MARKERS_FILES = [os.path.join(AUTHOR_MARKERS_FOLDER, "subclass_results.csv"),
+                        os.path.join(AUTHOR_MARKERS_FOLDER, "supertype_results.csv"),
+                        os.path.join(AUTHOR_MARKERS_FOLDER, "cluster_results.csv")]
+AUTHOR_LOCAL_MARKERS_FILES = [os.path.join(AUTHOR_MARKERS_FOLDER, "local_cluster_results.csv")]
+NSFOREST_MARKERS_FILES = [os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                       "../dendrograms/supplementary/version2/NSForest_global_class_results.csv"),
+                          os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                       "../dendrograms/supplementary/version2/NSForest_global_subclass_comb_results.csv")]
+
+SNAPSHOT_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../dendrograms/.snapshot_cache")
+# increment when the content or the structure of the snapshot changes
+SNAPSHOT_VERSION = 3
+# increment when the content or the structure of the cached gene index changes
+GENE_INDEX_VERSION = 1
+# gene ID prefixes in order of precedence, used when a gene name has IDs in several gene databases. NCBI genes are
+# preferred since they are the ones imported to the ontology (see genedb import in bgo.Makefile)
+GENE_ID_PRECEDENCE = ["NCBIGene", "ensembl"]
 # ABC_ATLAS_URL = "https://knowledge.brain-map.org/abcatlas#"
 
+def get_content_hash(file_paths, version):
+    """
+    Returns the sha256 hash of the content of the given files and the cache version.
+    Args:
+        file_paths: list of file paths
+        version: cache format version
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256(str(version).encode())
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
 
-def generate_ind_template(taxonomy_file_path, output_filepath):
-    path_parts = taxonomy_file_path.split(os.path.sep)
-    taxon = path_parts[-1].split(".")[0]
-
-    dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-    all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-    pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-    cl_id_factory = CLIdFactory(read_json_file(taxonomy_file_path))
-
-    dend_tree = generate_dendrogram_tree(dend)
-    nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-    class_membership = get_class_membership_dict(dend_tree)
-
-    excluded_classes = get_excluded_classes(taxon)
-    atlas_payloads = read_abc_urls(ABC_URLS_MAPPING)
-    cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-    # dend_tree = generate_dendrogram_tree(dend)
-    # taxonomy_config = read_taxonomy_config(taxon)
-    # subtrees = get_subtrees(dend_tree, taxonomy_config)
-
-    robot_template_seed = {'ID': 'ID',
-                           'Label': 'LABEL',
-                           'PrefLabel': 'A skos:prefLabel',
-                           'Entity Type': 'TI %',
-                           'TYPE': 'TYPE',
-                           'Property Assertions': "I 'subcluster of' SPLIT=|",
-                           'Synonyms': 'A oboInOwl:hasExactSynonym SPLIT=|',
-                           'Cluster_ID': "A 'cluster id'",
-                           'Function': 'TI capable_of some %',
-                           'cell_set_preferred_alias': "A n2o:cell_set_preferred_alias",
-                           'original_label': "A n2o:original_label",
-                           'cell_set_label': "A n2o:cell_set_label",
-                           'cell_set_aligned_alias': "A n2o:cell_set_aligned_alias",
-                           'cell_set_additional_aliases': "A n2o:cell_set_additional_aliases SPLIT=|",
-                           'cell_set_alias_assignee': "A n2o:cell_set_alias_assignee SPLIT=|",
-                           'cell_set_alias_citation': "A n2o:cell_set_alias_citation SPLIT=|",
-                           'Metadata': "A n2o:node_metadata",
-                           'Exemplar_of': "TI 'exemplar data of' some %",
-                           'Comment': "A rdfs:comment",
-                           'Aliases': "A oboInOwl:hasRelatedSynonym SPLIT=|",
-                           'Rank': "A 'cell_type_rank' SPLIT=|",
-                           'Atlas_url': "A rdfs:seeAlso",
-                           'Atlas_url_label': ">A rdfs:label",
-                           'Matrix_url': "A rdfs:seeAlso",
-                           'Matrix_url_label': ">A rdfs:label",
-                           'Matrix_url_comment': ">A rdfs:comment",
-                           }
-    dl = [robot_template_seed]
 
-    for o in dend['nodes']:
+def get_generator_source_files():
+    """
+    Returns the source files of the template generators, so that a code change invalidates the template manifests.
+    """
+    return sorted(glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), "*.py")))
+
+
+def save_cache_file(data, cache_path, outdated_pattern):
+    """
+    Atomically pickles the data (protocol 5) to the cache path and removes the outdated cache files of the same
+    cache folder.
+    Args:
+        data: data to cache
+        cache_path: Path of the cache file
+        outdated_pattern: glob pattern of the cache files replaced by this one
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=cache_dir, delete=False) as f:
+        pickle.dump(data, f, protocol=5)
+    os.replace(f.name, cache_path)
+    for outdated in glob.glob(os.path.join(cache_dir, outdated_pattern)):
+        if outdated != cache_path:
+            os.remove(outdated)
+
+
+class TaxonomyContext:
+    """
+    Parsed taxonomy and the structures derived from it, shared by all template generators. The CAS json is read once
+    and every derived structure (dendrogram tree, collapsed chains, unique labels, id factories etc.) is built lazily
+    on first access and then reused. Generators must treat the context content as read-only.
+    """
+
+    # derived structures stored in the snapshot cache. All of them only depend on the snapshot key files.
+    SNAPSHOT_FIELDS = ('taxonomy_details', 'taxonomy_config', 'dend', 'all_nodes', 'all_names', 'pcl_id_factory',
+                       'cl_id_factory', 'clm_id_factory', 'labelset_ranks', 'dend_tree', 'taxonomy_tree', 'hierarchy',
+                       'class_membership', 'nodes_to_collapse', 'cl_subset', 'gross_cell_types', 'name_curations',
+                       'all_pref_labels', 'allocated_ids')
+
+    def __init__(self, taxonomy_file_path):
+        self.taxonomy_file_path = taxonomy_file_path
+        self._atlas_payloads = dict()
+
+    @classmethod
+    def from_snapshot(cls, taxonomy_file_path, cache_dir=SNAPSHOT_CACHE_DIR):
+        """
+        Loads the context from the snapshot cache. Snapshots are keyed on the content hash of the taxonomy, the
+        taxonomy details and the curation tables, so that a stale snapshot is never used. If there is no valid
+        snapshot, the context is built and a new snapshot is saved.
+        Args:
+            taxonomy_file_path: Path of the CAS taxonomy file
+            cache_dir: Snapshot cache directory
+        Returns:
+            TaxonomyContext: context with all SNAPSHOT_FIELDS loaded.
+        """
+        context = cls(taxonomy_file_path)
+        snapshot_path = os.path.join(cache_dir, "{}_{}.pickle".format(context.taxon, context.snapshot_key()))
+        if os.path.isfile(snapshot_path):
+            try:
+                with open(snapshot_path, "rb") as f:
+                    context.__dict__.update(pickle.load(f))
+                return context
+            except Exception as e:
+                log.warning("Ignoring unreadable taxonomy snapshot {}: {}".format(snapshot_path, e))
+        context.save_snapshot(snapshot_path)
+        return context
+
+    def snapshot_key(self):
+        """
+        Returns the content hash of all files the snapshot is derived from.
+        """
+        return get_content_hash([self.taxonomy_file_path, TAXONOMY_DETAILS_YAML, NAME_CURATION_MAPPING, CL_SUBSET_TABLE],
+                                SNAPSHOT_VERSION)
+
+    def save_snapshot(self, snapshot_path):
+        """
+        Saves the snapshot fields to the given path (pickle protocol 5) and removes the outdated snapshots of the
+        taxonomy.
+        Args:
+            snapshot_path: Path of the snapshot file
+        """
+        snapshot = {field: getattr(self, field) for field in self.SNAPSHOT_FIELDS}
+        save_cache_file(snapshot, snapshot_path, "{}_*.pickle".format(self.taxon))
+
+    @cached_property
+    def taxon(self):
+        return extract_taxonomy_name_from_path(self.taxonomy_file_path)
+
+    @cached_property
+    def taxonomy_details(self):
+        return read_taxonomy_details_yaml()
+
+    @cached_property
+    def taxonomy_config(self):
+        return get_taxonomy_configuration(self.taxonomy_details, self.taxon)
+
+    @cached_property
+    def streamed_taxonomy(self):
+        """
+        Streams the taxonomy annotations once into the dendrogram nodes, so that the annotations are only held as the
+        compact dendrogram nodes. 'cell_ids' of the annotations are not used by the generators and author annotation
+        fields are decoded on demand, optionally projected to the 'Author_annotation_fields' patterns of the taxonomy
+        config.
+        Returns:
+            tuple of the CAS metadata with the annotation summary of the id factories instead of the annotations (see
+            BaseIdFactory.add_annotation_summary) and the dendrogram.
+        """
+        author_fields = (self.taxonomy_config or dict()).get("Author_annotation_fields")
+        taxonomy = read_cas_metadata(self.taxonomy_file_path)
+        taxonomy.update(labelset_counts=dict(), accession_formats=dict())
+        dend = stream_cas_json_2_nodes_n_edges(self.taxonomy_file_path, author_fields=author_fields, metadata=taxonomy,
+                                               visit_annotation=partial(BaseIdFactory.add_annotation_summary, taxonomy))
+        return taxonomy, dend
+
+    @cached_property
+    def taxonomy(self):
+        return self.streamed_taxonomy[0]
+
+    @cached_property
+    def dend(self):
+        return self.streamed_taxonomy[1]
+
+    @cached_property
+    def all_nodes(self):
+        return {node['cell_set_accession']: node for node in self.dend['nodes']}
+
+    @cached_property
+    def all_names(self):
+        return {node['cell_label']: node for node in self.dend['nodes']}
+
+    @cached_property
+    def pcl_id_factory(self):
+        return PCLIdFactory(self.taxonomy, self.taxonomy_details)
+
+    @cached_property
+    def cl_id_factory(self):
+        return CLIdFactory(self.taxonomy, self.taxonomy_details)
+
+    @cached_property
+    def clm_id_factory(self):
+        return CLMIdFactory(self.taxonomy, self.taxonomy_details)
+
+    @cached_property
+    def allocated_ids(self):
+        # class and marker gene set ids of all nodes, allocated at once for each id factory (see get_id)
+        accessions = list(self.all_nodes)
+        return {type(id_factory): id_factory.allocate_ids(accessions)
+                for id_factory in (self.pcl_id_factory, self.cl_id_factory, self.clm_id_factory)}
+
+    def get_id(self, id_factory, kind, accession):
+        """
+        Returns the id allocated to a taxonomy node.
+        Args:
+            id_factory: PCL, CL or CLM id factory of the context
+            kind: id kind, such as 'class' or 'marker_gene_set' (see BaseIdFactory.get_id_displacements)
+            accession: cell set accession id of the node
+        Returns:
+            str: seven digit id
+        """
+        return self.allocated_ids[type(id_factory)][kind][accession]
+
+    @cached_property
+    def dend_tree(self):
+        return generate_dendrogram_tree(self.dend)
+
+    @cached_property
+    def taxonomy_tree(self):
+        return TaxonomyTree.from_dendrogram(self.dend)
+
+    @cached_property
+    def nodes_to_collapse(self):
+        return get_collapsed_nodes(self.taxonomy_tree, self.all_nodes)
+
+    @cached_property
+    def labelset_ranks(self):
+        return {labelset["name"]: labelset["rank"] for labelset in self.taxonomy['labelsets'] if "rank" in labelset}
+
+    @cached_property
+    def hierarchy(self):
+        return get_hierarchy_table(self.dend_tree, self.all_nodes, self.labelset_ranks)
+
+    @cached_property
+    def class_membership(self):
+        return get_class_membership_dict(self.dend_tree, self.hierarchy)
+
+    @cached_property
+    def cl_subset(self):
+        return get_cl_subset_nodes(self.nodes_to_collapse)
+
+    @cached_property
+    def gross_cell_types(self):
+        return resolve_all_gross_cell_types(self.dend)
+
+    @cached_property
+    def name_curations(self):
+        return read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
+
+    @cached_property
+    def all_pref_labels(self):
+        return get_all_unique_cell_labels(self.dend, self.nodes_to_collapse, self.all_names, self.name_curations)
+
+    @cached_property
+    def gene_db(self):
+        return load_shared_input(read_gene_index, TEMPLATES_FOLDER_PATH)
+
+    @cached_property
+    def excluded_classes(self):
+        return get_excluded_classes(self.taxon)
+
+    @cached_property
+    def structure_key(self):
+        """
+        Fingerprint of the taxonomy structure: the nodes in walk order, their labelsets and collapsed chains. Template
+        manifests are only reused for the same structure, which also fixes the ID ranges of the ID factories.
+        """
+        nodes_to_collapse = self.nodes_to_collapse
+        return get_fingerprint([(o['cell_set_accession'], o.get('labelset'),
+                                 nodes_to_collapse[o['cell_set_accession']].get('cell_set_accession')
+                                 if o['cell_set_accession'] in nodes_to_collapse else None)
+                                for o in self.dend['nodes']])
+
+    def get_node_fingerprint(self, o, node):
+        """
+        Returns the fingerprint of the taxonomy inputs of the template rows of a node: the node and collapsed chain
+        fields, their name curations and the node values of the structures derived from the whole taxonomy (unique
+        labels, gross cell types, class membership, CL subset).
+        Args:
+            o: taxonomy node in dendrogram order
+            node: collapsed singleton chain of the node, or the node itself if it is not part of a chain
+        Returns:
+            str: hex digest
+        """
+        accession = o['cell_set_accession']
+        node_accession = node.get('cell_set_accession')
+        chain = [self.all_nodes[chain_accession] for chain_accession in node.get('chain', [])]
+        curations = [self.name_curations.get(chain_node['cell_label'] + "##" + chain_node['labelset'])
+                     for chain_node in [o] + chain]
+        pref_labels = [self.all_pref_labels.get(label_accession) for label_accession in
+                       (accession, node_accession, node.get('parent_cell_set_accession'))]
+        return get_fingerprint(o, None if node is o else node, chain, curations, pref_labels,
+                               self.dend['parents'].get(accession),
+                               get_gross_cell_type(node_accession, self.dend['nodes'], self.gross_cell_types),
+                               self.class_membership.get(accession), self.class_membership.get(node_accession),
+                               accession in self.cl_subset, node_accession in self.cl_subset)
+
+    def preload(self):
+        """
+        Builds all derived structures used by the template builders, so that they are shared by the forked workers.
+        """
+        for field in self.SNAPSHOT_FIELDS + ('gene_db', 'excluded_classes', 'structure_key'):
+            getattr(self, field)
+
+    def get_atlas_payloads(self, file_path):
+        """
+        Returns the ABC atlas payloads of the given mapping file, reading each file only once.
+        Args:
+            file_path: Path to the json file containing ABC URLs.
+        Returns:
+            dict: Dictionary with ABC URLs.
+        """
+        if file_path not in self._atlas_payloads:
+            self._atlas_payloads[file_path] = read_abc_urls(file_path)
+        return self._atlas_payloads[file_path]
+
+
+class TemplateRowBuilder(ABC):
+    """
+    Streams the rows of a ROBOT template to its TemplateWriter while the taxonomy nodes are visited. Builders only
+    read the shared TaxonomyContext, so any number of them can be fed by a single walk over the taxonomy (see
+    build_templates).
+    """
+
+    # output file name suffix of the template, appended to the taxonomy name
+    file_suffix = None
+    # template columns and column families (see TemplateSchema), rows with other columns are rejected
+    columns = None
+    # OWL components built from the template, formatted with the taxonomy name (see bgo.Makefile)
+    owl_components = ()
+    # sidecar types of the non string columns, column names and column families to types (see template_sidecar)
+    column_types = None
+    # True if the rows of a node only depend on the node fingerprint (see TaxonomyContext.get_node_fingerprint) and
+    # the shared inputs of the builder (see get_input_key), so that they can be reused by the incremental generation
+    incremental = True
+
+    def __init__(self, context):
+        self.context = context
+        self.writer = None
+        self.manifest = None
+        self.previous_manifest = None
+        self.node_rows = None
+        self.reused_count = 0
+
+    def get_header_rows(self):
+        """
+        Returns the rows written before all node rows, such as the ROBOT template row.
+        """
+        return []
+
+    def get_input_files(self):
+        """
+        Returns the input files the template rows depend on, other than the taxonomy and the name curation table whose
+        content is part of the node fingerprints.
+        """
+        return [TAXONOMY_DETAILS_YAML, CL_SUBSET_TABLE] + get_generator_source_files()
+
+    def get_input_data(self):
+        """
+        Returns the json like inputs the template rows depend on that are not read from the input files.
+        """
+        return None
+
+    def get_input_key(self):
+        """
+        Returns the key of the inputs shared by all rows of the template. Any change in them invalidates the manifest.
+        """
+        return get_fingerprint(get_content_hash(self.get_input_files(), MANIFEST_VERSION), self.get_input_data())
+
+    def open(self, output_filepath, incremental=False, sidecar_format=None):
+        """
+        Opens the template writer. In incremental mode, also opens the previous manifest of the template to reuse the
+        rows of the unchanged nodes and the manifest to be written.
+        Args:
+            output_filepath: Path of the output template
+            incremental: True to reuse the rows of the previous manifest and skip writing an unchanged template
+            sidecar_format: optionally also write a 'parquet' or 'arrow' sidecar of the template
+        """
+        self.writer = TemplateWriter(output_filepath, self.columns, header_rows=self.get_header_rows(),
+                                     skip_unchanged=incremental, sidecar_format=sidecar_format,
+                                     column_types=self.column_types)
+        if incremental and self.incremental:
+            manifest_path = get_manifest_path(output_filepath)
+            input_key = self.get_input_key()
+            structure_key = self.context.structure_key
+            self.previous_manifest = ManifestReader.open(manifest_path, input_key, structure_key)
+            self.manifest = ManifestWriter(manifest_path, input_key, structure_key)
+
+    def write_row(self, d):
+        self.writer.write_row(d)
+        if self.node_rows is not None:
+            self.node_rows.append(d)
+
+    def visit(self, o, node, collapsed, fingerprint=None):
+        """
+        Adds the template rows of a taxonomy node, reusing the rows of the previous manifest if the node fingerprint
+        is unchanged.
+        Args:
+            o: taxonomy node in dendrogram order
+            node: collapsed singleton chain of the node, or the node itself if it is not part of a chain
+            collapsed: True if the node is part of a collapsed singleton chain
+            fingerprint: fingerprint of the node inputs, required in incremental mode
+        """
+        if self.manifest is None:
+            self.add_node(o, node, collapsed)
+            return
+        rows = None
+        if self.previous_manifest is not None:
+            rows = self.previous_manifest.get_rows(o['cell_set_accession'], fingerprint)
+        if rows is None:
+            self.node_rows = []
+            self.add_node(o, node, collapsed)
+            rows = self.node_rows
+            self.node_rows = None
+        else:
+            self.reuse_rows(o, node, collapsed, rows)
+            self.reused_count += 1
+        self.manifest.add_rows(o['cell_set_accession'], fingerprint, rows)
+
+    @abstractmethod
+    def add_node(self, o, node, collapsed):
+        """
+        Adds the template rows of a taxonomy node.
+        Args:
+            o: taxonomy node in dendrogram order
+            node: collapsed singleton chain of the node, or the node itself if it is not part of a chain
+            collapsed: True if the node is part of a collapsed singleton chain
+        """
+        pass
+
+    def reuse_rows(self, o, node, collapsed, rows):
+        """
+        Adds the rows recorded for an unchanged node. Builders with state across nodes restore it here.
+        """
+        for d in rows:
+            self.write_row(d)
+
+    def close(self):
+        """
+        Writes the template file and the manifest.
+        Returns:
+            bool: False if the template was not written since its content is unchanged (incremental mode), else True.
+        """
+        if self.previous_manifest is not None:
+            self.previous_manifest.close()
+        if self.manifest is not None:
+            self.manifest.close()
+            log.info("{}: rows of {} nodes reused".format(self.writer.output_filepath, self.reused_count))
+        return self.writer.close()
+
+    def discard(self):
+        if self.previous_manifest is not None:
+            self.previous_manifest.close()
+        if self.manifest is not None:
+            self.manifest.discard()
+        self.writer.discard()
+
+
+def build_templates(context, builders, incremental=False, sidecar_format=None):
+    """
+    Walks the taxonomy nodes once, dispatches each node to all template builders and writes the templates. No
+    template is written if the walk fails.
+    In incremental mode, the rows of the nodes whose fingerprint is unchanged since the previous generation are taken
+    from the template manifests and templates with an unchanged content are not rewritten.
+    Args:
+        context: TaxonomyContext of the taxonomy
+        builders: list of (TemplateRowBuilder, output file path) tuples
+        incremental: True to run the incremental generation
+        sidecar_format: optionally also write 'parquet' or 'arrow' sidecars of the templates (see template_sidecar)
+    Returns:
+        list: paths of the written templates.
+    """
+    opened = []
+    try:
+        for builder, output_filepath in builders:
+            builder.open(output_filepath, incremental, sidecar_format)
+            opened.append(builder)
+        fingerprints = any(builder.manifest is not None for builder in opened)
+        nodes_to_collapse = context.nodes_to_collapse
+        for o in context.dend['nodes']:
+            if o['cell_set_accession'] in nodes_to_collapse:
+                node = nodes_to_collapse[o['cell_set_accession']]
+                collapsed = True
+            else:
+                node = o
+                collapsed = False
+            fingerprint = context.get_node_fingerprint(o, node) if fingerprints else None
+            for builder in opened:
+                builder.visit(o, node, collapsed, fingerprint)
+    except BaseException:
+        for builder in opened:
+            builder.discard()
+        raise
+    return [output_filepath for builder, output_filepath in builders if builder.close()]
+
+
+class IndividualTemplateBuilder(TemplateRowBuilder):
+    """
+    Individuals template, a named individual for each taxonomy node.
+    """
+
+    file_suffix = ".tsv"
+    owl_components = ("{}_indv.owl", "{}_inferred_hierarchy.owl")
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.atlas_payloads = context.get_atlas_payloads(ABC_URLS_MAPPING)
+        self.robot_template_seed = {'ID': 'ID',
+                                    'Label': 'LABEL',
+                                    'PrefLabel': 'A skos:prefLabel',
+                                    'Entity Type': 'TI %',
+                                    'TYPE': 'TYPE',
+                                    'Property Assertions': "I 'subcluster of' SPLIT=|",
+                                    'Synonyms': 'A oboInOwl:hasExactSynonym SPLIT=|',
+                                    'Cluster_ID': "A 'cluster id'",
+                                    'Function': 'TI capable_of some %',
+                                    'cell_set_preferred_alias': "A n2o:cell_set_preferred_alias",
+                                    'original_label': "A n2o:original_label",
+                                    'cell_set_label': "A n2o:cell_set_label",
+                                    'cell_set_aligned_alias': "A n2o:cell_set_aligned_alias",
+                                    'cell_set_additional_aliases': "A n2o:cell_set_additional_aliases SPLIT=|",
+                                    'cell_set_alias_assignee': "A n2o:cell_set_alias_assignee SPLIT=|",
+                                    'cell_set_alias_citation': "A n2o:cell_set_alias_citation SPLIT=|",
+                                    'Metadata': "A n2o:node_metadata",
+                                    'Exemplar_of': "TI 'exemplar data of' some %",
+                                    'Comment': "A rdfs:comment",
+                                    'Aliases': "A oboInOwl:hasRelatedSynonym SPLIT=|",
+                                    'Rank': "A 'cell_type_rank' SPLIT=|",
+                                    'Atlas_url': "A rdfs:seeAlso",
+                                    'Atlas_url_label': ">A rdfs:label",
+                                    'Matrix_url': "A rdfs:seeAlso",
+                                    'Matrix_url_label': ">A rdfs:label",
+                                    'Matrix_url_comment': ">A rdfs:comment",
+                                    }
+        # the author annotation fields of the taxonomy become columns as they are found
+        self.columns = list(self.robot_template_seed) + ['cell_fullname',
+                                                         ColumnFamily(r".+", "author annotation fields")]
+
+    def get_header_rows(self):
+        # completed with the author annotation field columns until the template is written
+        return [self.robot_template_seed]
+
+    def get_input_files(self):
+        return super().get_input_files() + [ABC_URLS_MAPPING]
+
+    def get_input_data(self):
+        return sorted(self.context.excluded_classes)
+
+    def add_author_column(self, field):
+        if field not in self.robot_template_seed:
+            self.robot_template_seed[field] = ("A https://purl.brain-bican.org/taxonomy/CCN20230722#" +
+                                               field.replace(" ", "_").replace(".", "_"))
+
+    def reuse_rows(self, o, node, collapsed, rows):
+        super().reuse_rows(o, node, collapsed, rows)
+        # all other columns of the rows are in the template seed
+        for d in rows:
+            for k in d:
+                if k != 'cell_fullname':
+                    self.add_author_column(k)
+
+    def add_node(self, o, node, collapsed):
+        context = self.context
         d = dict()
         d['ID'] = 'BICAN_INDV:' + o['cell_set_accession']
         d['TYPE'] = 'owl:NamedIndividual'
@@ -123,8 +638,8 @@ def generate_ind_template(taxonomy_file_path, output_filepath):
             d['Synonyms'] = '|'.join(o.get('synonyms', []))
         else:
             d['Synonyms'] = ''
-        d['Property Assertions'] = '|'.join(
-            sorted(['BICAN_INDV:' + e[1] for e in dend['edges'] if e[0] == o['cell_set_accession'] and e[1]]))
+        parent = context.dend['parents'].get(o['cell_set_accession'])
+        d['Property Assertions'] = 'BICAN_INDV:' + parent if parent else ''
         meta_properties = ['cell_fullname']
         for prop in meta_properties:
             if prop in o.keys():
@@ -133,309 +648,388 @@ def generate_ind_template(taxonomy_file_path, output_filepath):
                 d[prop] = ''
         d['Cluster_ID'] = o['cell_set_accession']
 
-        if o['cell_set_accession'] in cl_subset:
-            id_factory = cl_id_factory
+        if o['cell_set_accession'] in context.cl_subset:
+            id_factory = context.cl_id_factory
             id_base = CL_BASE
         else:
-            id_factory = pcl_id_factory
+            id_factory = context.pcl_id_factory
             id_base = PCL_BASE
-        if o['cell_set_accession'] in nodes_to_collapse:
-            class_url = id_base + id_factory.get_class_id(nodes_to_collapse[o['cell_set_accession']]['cell_set_accession'])
-        else:
-            class_url = id_base + id_factory.get_class_id(o['cell_set_accession'])
-        if class_url not in excluded_classes:
+        # exemplar of the collapsed chain class, if any
+        class_url = id_base + context.get_id(id_factory, "class", node['cell_set_accession'])
+        if class_url not in context.excluded_classes:
             d['Exemplar_of'] = class_url
-        if atlas_payloads.get(o["cell_set_accession"]):
-            d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(
+        if self.atlas_payloads.get(o["cell_set_accession"]):
+            d["Atlas_url"] = ABC_ATLAS_URL + self.atlas_payloads.get(
                 o["cell_set_accession"])
             d["Atlas_url_label"] = "Reference data on Allen Brain Cell Atlas"
-        d["Matrix_url"] = "https://purl.brain-bican.org/taxonomy/CCN20230722/" + class_membership[o["cell_set_accession"]] + ".h5ad"
-        d["Matrix_url_label"] = "h5ad data file for " + class_membership[o["cell_set_accession"]]
+        class_name = context.class_membership[o["cell_set_accession"]]
+        d["Matrix_url"] = "https://purl.brain-bican.org/taxonomy/CCN20230722/" + class_name + ".h5ad"
+        d["Matrix_url_label"] = "h5ad data file for " + class_name
         d["Matrix_url_comment"] = "Warning large data file!"
 
         if "author_annotation_fields" in o and o["author_annotation_fields"]:
             for k, v in o["author_annotation_fields"].items():
                 if v and str(v).lower() != "none":
                     d[k] = v
-                    if k not in robot_template_seed.keys():
-                        robot_template_seed[k] = "A https://purl.brain-bican.org/taxonomy/CCN20230722#" + k.replace(" ", "_").replace(".", "_")
-
-        dl.append(d)
-    robot_template = pd.DataFrame.from_records(dl)
-    robot_template.to_csv(output_filepath, sep="\t", index=False)
-
-
-def generate_base_class_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        all_names = {node['cell_label']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        cl_id_factory = CLIdFactory(read_json_file(taxonomy_file_path))
-        clm_id_factory = CLMIdFactory(read_json_file(taxonomy_file_path))
-
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        name_curations = read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
-        # subtrees = get_subtrees(dend_tree, taxonomy_config)
-        all_pref_labels = get_all_unique_cell_labels(dend, nodes_to_collapse, all_names, name_curations)
-        class_membership = get_class_membership_dict(dend_tree)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        gene_db = read_gene_dbs(TEMPLATES_FOLDER_PATH)
-        author_markers = read_author_markers_dataframe()
-        author_local_markers = read_author_local_markers_dataframe()
-        ns_forest_markers = read_nsforest_markers_dataframe()
-
-        cluster_annotations = read_csv_to_dict(CLUSTER_ANNOTATIONS_PATH, id_column_name="cell_set_accession.cluster")[1]
-        nt_symbols_mapping = read_csv_to_dict(NT_SYMBOLS_MAPPING, delimiter="\t")[1]
-        mba_symbols = get_aba_symbols_map()
-        mba_labels = get_mba_labels_map()
-        anatomical_loc_inconsistencies = get_anatomical_location_inconsistencies(CLUSTER_ANNOTATIONS_PATH)
-        nt_inconsistencies = get_neurotransmitter_inconsistencies(CLUSTER_ANNOTATIONS_PATH)
-        atlas_payloads = read_abc_urls(ABC_URLS_MAPPING)
-
-        class_seed = ['defined_class',
-                      'prefLabel',
-                      'Taxonomy_label',
-                      'Alias_citations',
-                      'Short_form_citation',
-                      'Synonyms_from_taxonomy',
-                      'Gross_cell_type',
-                      'Taxon',
-                      'Taxon_abbv',
-                      'Brain_region',
-                      'Minimal_markers',
-                      'Allen_markers',
-                      'Individuals',
-                      'Brain_region_abbv',
-                      'Species_abbv',
-                      'Cluster_IDs',
-                      'Labelset',
-                      'Dataset_url',
-                      'part_of',
-                      'has_soma_location',
-                      'aligned_alias',
-                      'Parent_label',
-                      'NT',
-                      'NT_label',
-                      'NT_markers',
-                      'CL',
-                      'Nomenclature_Layers',
-                      'Nomenclature_Projection',
-                      'evidence_marker_gene_set',
-                      'marker_gene_set',
-                      'marker_gene_set_confidence',
-                      'ws_marker_gene_set',
-                      'ws_marker_gene_set_confidence',
-                      'nsforest_marker_gene_set_1',
-                      'nsforest_marker_gene_set_1_confidence',
-                      'nsforest_marker_gene_set_2',
-                      'nsforest_marker_gene_set_2_confidence',
-                      'MBA',
-                      'MBA_text',
-                      'Subclass_markers',
-                      'Location_disclaimer',
-                      'NT_disclaimer',
-                      'Atlas_url',
-                      'Atlas_url_label',
-                      'Matrix_url',
-                      'Class_name',
-                      ]
-        class_template = []
-        obsolete_template = []
-        processed_accessions = set()
-        terms_moved_to_cl_subset = []
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-                collapsed = True
-            else:
-                collapsed = False
-            if node.get('cell_set_accession') and node['cell_set_accession'] not in processed_accessions:
-                d = dict()
-                if o['cell_set_accession'] in cl_subset:
-                    id_factory = cl_id_factory
-                    marker_id_factory = clm_id_factory
-                    id_base = CL_BASE
-                    marker_id_base = CLM_BASE
-                else:
-                    id_factory = pcl_id_factory
-                    marker_id_factory = pcl_id_factory
-                    id_base = PCL_BASE
-                    marker_id_base = PCL_BASE
+                    self.add_author_column(k)
 
-                d['defined_class'] = id_base + id_factory.get_class_id(node['cell_set_accession'])
+        self.write_row(d)
 
-                d["prefLabel"] = all_pref_labels[node['cell_set_accession']]
-                if node.get('taxonomy_cell_label'):
-                    d["Taxonomy_label"] = node['taxonomy_cell_label']
-                else:
-                    d["Taxonomy_label"] = node['cell_label']
-                synonyms = node.get("synonyms", []) or []
-                synonyms.append(node['cell_label'])
-                if collapsed:
-                    synonyms.extend([ all_nodes[accession_id]['cell_label'] for accession_id in node["chain"]])
-                d['Synonyms_from_taxonomy'] = "|".join(sorted(list(set(synonyms))))
-                d['Gross_cell_type'] = get_gross_cell_type(node['cell_set_accession'], dend['nodes'])
-                d['Taxon'] = taxonomy_config['Species'][0]
-                d['Taxon_abbv'] = taxonomy_config['Gene_abbv'][0]
-                d['Brain_region'] = taxonomy_config['Brain_region'][0]
-                cluster_id = node['cell_set_accession']
-                if collapsed:
-                    cluster_id = "|".join(node["chain"])
-                d['Cluster_IDs'] = cluster_id
-                d['Labelset'] = node['labelset'].capitalize()
-                d['Dataset_url'] = "https://purl.brain-bican.org/taxonomy/CCN20230722"
-                reference_paper = "https://doi.org/10.1038/s41586-023-06812-z"
-                if 'rationale_dois' in node and node['rationale_dois']:
-                    alias_citations = {citation.strip() for citation in node['rationale_dois']
-                                       if citation and citation.strip()}
-                    alias_citations.add(reference_paper)
-                    d["Alias_citations"] = "|".join(alias_citations)
-                else:
-                    d["Alias_citations"] = reference_paper
-                d["Short_form_citation"] = "XYZ et al. (2023), Basal Ganglia Consensus"
-                if node.get('parent_cell_set_accession'):
-                    d['Parent_label'] = all_pref_labels[node['parent_cell_set_accession']]
-                if not node["author_annotation_fields"]:
-                    node["author_annotation_fields"] = dict()
-                markers_str = node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo", "")
-                markers_list = [marker.strip() for marker in markers_str.split(",") if marker.strip()]
-                d['Minimal_markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
-
-                d['Allen_markers'] = ""
-                if 'Brain_region_abbv' in taxonomy_config:
-                    d['Brain_region_abbv'] = taxonomy_config['Brain_region_abbv'][0]
-                if 'Species_abbv' in taxonomy_config:
-                    d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
-                d['Individuals'] = BICAN_INDV_BASE + node['cell_set_accession']
-                d['part_of'] = ''
-                d['has_soma_location'] = taxonomy_config['Brain_region'][0]
 
+def generate_ind_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+    build_templates(context, [(IndividualTemplateBuilder(context), output_filepath)])
 
-                associate_marker_sets(all_nodes, author_local_markers, author_markers, collapsed, d,
-                                      marker_id_factory, marker_id_base, node, ns_forest_markers, o)
 
-                if "cell_ontology_term_id" in node and node["cell_ontology_term_id"]:
-                    d['CL'] = node["cell_ontology_term_id"]
-                else:
-                    d['CL'] = ""
-
-                d['NT'] = ""
-                d['NT_markers'] = ""
-                if node.get('neurotransmitter_accession'):
-                    nt_accession = node.get('neurotransmitter_accession')
-                    if nt_accession in nt_symbols_mapping:
-                        d['NT'] = nt_symbols_mapping.get(nt_accession)["CELL TYPE NEUROTRANSMISSION ID"]
-                        d['NT_label'] = " and ".join(nt_symbols_mapping.get(nt_accession)["CELL TYPE LABEL"].split("|"))
-                if node.get('neurotransmitter_marker_gene_evidence'):
-                    nt_marker_names = node.get('neurotransmitter_marker_gene_evidence')
-                    d['NT_markers'] = "|".join(nt_marker_names)
-                    for i in range(1, 9):
-                        if i <= len(nt_marker_names):
-                            d['NT_marker_' + str(i)] = get_gene_id(gene_db, nt_marker_names[i - 1])
-                        else:
-                            d['NT_marker_' + str(i)] = ''
-                    if len(nt_marker_names) > 8:
-                        raise ValueError("More than 8 NT markers found for cluster: " + node['cell_set_accession'])
-
-                missed_regions = set()
-                if node['cell_set_accession'] in cluster_annotations:
-                    ccf_broad_freq = cluster_annotations[node['cell_set_accession']]["CCF_broad.freq"]
-                    ccf_acronym_freq = cluster_annotations[node['cell_set_accession']]["CCF_acronym.freq"]
-
-                    # BROAD_REGION:
-                    broad_mbas, mba_text = populate_mba_relations(ccf_broad_freq, BROAD_REGION, d, 1, mba_symbols, mba_labels, missed_regions)
-                    d['MBA'] = "|".join(broad_mbas)
-                    d['MBA_text'] = ", ".join(mba_text)
-                    # ACRONYM_REGION:
-                    acronym_mbas, mba_text = populate_mba_relations(ccf_acronym_freq, ACRONYM_REGION, d, len(broad_mbas) + 1, mba_symbols, mba_labels, missed_regions, broad_mbas)
-                    acronym_mbas = [acronym_mba for acronym_mba in acronym_mbas if acronym_mba not in broad_mbas]
-                    d['CCF_acronym_freq'] = "|".join(acronym_mbas)
-
-                d['MBA_assay'] = "EFO:0008992"
-                for missed_region in missed_regions:
-                    print("MBA symbol not found for region: ", missed_region)
-
-                d["Subclass_markers"] = (node.get("author_annotation_fields", dict()).
-                                         get("cluster.markers.combo _within subclass_", "").replace("None", "").replace(",", "|"))
-                if node["cell_label"] in anatomical_loc_inconsistencies:
-                    mentioned_locations = get_location_symbols(node["cell_label"])
-                    inconsistent_locations = anatomical_loc_inconsistencies[node["cell_label"]]
-                    location_names = ", ".join([mba_labels[mba_symbols[loc]] + " (" + loc + ")" for loc in inconsistent_locations])
-                    if len(mentioned_locations) == len(inconsistent_locations):
-                        d["Location_disclaimer"] = "Warning: This type {name} does not have cells in any of the regions it is named for {location_names}. " \
-                         "The name merely indicates that it is a subtype of more general transcriptomic type that does. This assertion is based on data " \
-                         "from registration to a reference standard common co-ordinate framework and parcelation scheme.".format(name=d["prefLabel"], location_names=location_names)
-                    else:
-                        d["Location_disclaimer"] = ("Warning: Despite its name, {name} does not have cells in {location_names}. " 
-                                                    "This assertion is based on data from registration to a reference standard common co-ordinate "
-                                                    "framework and parcelation scheme.").format(name=d["prefLabel"], location_names=location_names)
-                if node["cell_set_accession"] in nt_inconsistencies:
-                    inconsistent_nts = nt_inconsistencies[node["cell_set_accession"]]
-                    d["NT_disclaimer"] = "Warning: Despite its name, {name} does not secrete the neurotransmitter {nt}, as assessed by expression of multiple marker genes.".format(name=d["prefLabel"], nt=", ".join(inconsistent_nts))
-
-                if atlas_payloads.get(o["cell_set_accession"]):
-                    d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(o["cell_set_accession"])
-                    d["Atlas_url_label"] = "Reference data on Allen Brain Cell Atlas"
-
-                d["Matrix_url"] = "https://purl.brain-bican.org/taxonomy/CCN20230722/" + \
-                                  class_membership[node["cell_set_accession"]] + ".h5ad"
-                d["Class_name"] = class_membership[node["cell_set_accession"]]
-
-                for k in class_seed:
-                    if not (k in d.keys()):
-                        d[k] = ''
-                class_template.append(d)
-                processed_accessions.add(node['cell_set_accession'])
+class BaseClassTemplateBuilder(TemplateRowBuilder):
+    """
+    Class base template, a class for each taxonomy node or collapsed singleton chain.
+    """
 
-                if o['cell_set_accession'] in cl_subset:
-                    cloned = d.copy()
-                    cloned['cell_set_accession'] = node['cell_set_accession']
-                    terms_moved_to_cl_subset.append(cloned)
-        # Disabled obsoletion since we haven't made a public release yet.
-        #     else:
-        #         # process obsoleted classes due to chain compressing
-        #         if collapsed and o.get('cell_set_accession') not in processed_accessions:
-        #             d = dict()
-        #             d['defined_class'] = PCL_BASE + pcl_id_factory.get_class_id(o['cell_set_accession'])
-        #             d['prefLabel'] = "obsolete " + o['cell_label']
-        #             d['Comment'] = "This class is obsoleted due to chain compression."
-        #             d['Deprecated'] = "true"
-        #             d['Gross_cell_type'] = get_gross_cell_type(o['cell_set_accession'],
-        #                                                        dend['nodes'])
-        #             d['Taxon'] = taxonomy_config['Species'][0]
-        #             d['Taxon_abbv'] = taxonomy_config['Gene_abbv'][0]
-        #             d['Comment'] = "This term is obsoleted due to identical cell set chain compression."
-        #             d['Classification'] = "CL:0000000"
-        #             d['ReplacedBy'] = ""
-        #             obsolete_template.append(d)
-        #
-        # for cl_obsolete in terms_moved_to_cl_subset:
+    file_suffix = "_class_base.tsv"
+    owl_components = ("{}_class.owl", "{}_inferred_hierarchy.owl")
+
+    class_seed = ['defined_class',
+                  'prefLabel',
+                  'Taxonomy_label',
+                  'Alias_citations',
+                  'Short_form_citation',
+                  'Synonyms_from_taxonomy',
+                  'Gross_cell_type',
+                  'Taxon',
+                  'Taxon_abbv',
+                  'Brain_region',
+                  'Minimal_markers',
+                  'Allen_markers',
+                  'Individuals',
+                  'Brain_region_abbv',
+                  'Species_abbv',
+                  'Cluster_IDs',
+                  'Labelset',
+                  'Dataset_url',
+                  'part_of',
+                  'has_soma_location',
+                  'aligned_alias',
+                  'Parent_label',
+                  'NT',
+                  'NT_label',
+                  'NT_markers',
+                  'CL',
+                  'Nomenclature_Layers',
+                  'Nomenclature_Projection',
+                  'evidence_marker_gene_set',
+                  'marker_gene_set',
+                  'marker_gene_set_confidence',
+                  'ws_marker_gene_set',
+                  'ws_marker_gene_set_confidence',
+                  'nsforest_marker_gene_set_1',
+                  'nsforest_marker_gene_set_1_confidence',
+                  'nsforest_marker_gene_set_2',
+                  'nsforest_marker_gene_set_2_confidence',
+                  'MBA',
+                  'MBA_text',
+                  'Subclass_markers',
+                  'Location_disclaimer',
+                  'NT_disclaimer',
+                  'Atlas_url',
+                  'Atlas_url_label',
+                  'Matrix_url',
+                  'Class_name',
+                  ]
+
+    columns = class_seed + ['MBA_assay',
+                            'CCF_acronym_freq',
+                            ColumnFamily(r"NT_marker_\d+"),
+                            ColumnFamily(r"MBA_\d+"),
+                            ColumnFamily(r"MBA_\d+_cell_percentage"),
+                            ColumnFamily(r"MBA_\d+_comment"),
+                            ColumnFamily(r"nsforest_marker_gene_set_\d+"),
+                            ColumnFamily(r"nsforest_marker_gene_set_\d+_confidence"),
+                            ]
+
+    column_types = {'marker_gene_set_confidence': FLOAT_TYPE,
+                    'ws_marker_gene_set_confidence': FLOAT_TYPE,
+                    ColumnFamily(r"nsforest_marker_gene_set_\d+_confidence"): FLOAT_TYPE,
+                    ColumnFamily(r"MBA_\d+_cell_percentage"): FLOAT_TYPE,
+                    'Synonyms_from_taxonomy': LIST_TYPE,
+                    'Alias_citations': LIST_TYPE,
+                    'Cluster_IDs': LIST_TYPE,
+                    'Minimal_markers': LIST_TYPE,
+                    'Allen_markers': LIST_TYPE,
+                    'Individuals': LIST_TYPE,
+                    'NT': LIST_TYPE,
+                    'NT_markers': LIST_TYPE,
+                    'MBA': LIST_TYPE,
+                    'CCF_acronym_freq': LIST_TYPE,
+                    'Subclass_markers': LIST_TYPE}
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.prefetch_inputs(context)
+        self.author_markers = load_shared_input(read_author_markers_dataframe)
+        self.author_local_markers = load_shared_input(read_author_local_markers_dataframe)
+        self.ns_forest_markers = load_shared_input(read_nsforest_markers_dataframe)
+
+        self.cluster_annotations = get_cluster_annotations(CLUSTER_ANNOTATIONS_PATH)
+        self.nt_symbols_mapping = load_shared_input(read_csv_to_dict, NT_SYMBOLS_MAPPING, delimiter="\t")[1]
+        self.mba_symbols = load_shared_input(get_aba_symbols_map)
+        self.mba_labels = load_shared_input(get_mba_labels_map)
+        self.broad_regions = self.cluster_annotations.get_region_frequencies(CCF_BROAD_FREQ).get_region_assignments(
+            self.mba_symbols, self.mba_labels, BRAIN_REGION_THRESHOLD)
+        self.acronym_regions = self.cluster_annotations.get_region_frequencies(CCF_ACRONYM_FREQ).get_region_assignments(
+            self.mba_symbols, self.mba_labels, BRAIN_REGION_THRESHOLD)
+        self.anatomical_loc_inconsistencies = load_shared_input(get_anatomical_location_inconsistencies,
+                                                                CLUSTER_ANNOTATIONS_PATH)
+        self.nt_inconsistencies = load_shared_input(get_neurotransmitter_inconsistencies, CLUSTER_ANNOTATIONS_PATH)
+        self.atlas_payloads = context.get_atlas_payloads(ABC_URLS_MAPPING)
+
+        self.obsolete_template = []
+        self.processed_accessions = set()
+        self.terms_moved_to_cl_subset = []
+
+    @staticmethod
+    def prefetch_inputs(context):
+        """
+        Loads the independent inputs of the builder concurrently, so that they are already loaded when the builder
+        reads them. The load times are logged.
+        """
+        scheduler = LoaderScheduler()
+        schedule_shared_input(scheduler, "gene_db", read_gene_index, TEMPLATES_FOLDER_PATH, process=True)
+        schedule_shared_input(scheduler, "author_markers", read_author_markers_dataframe, process=True)
+        schedule_shared_input(scheduler, "author_local_markers", read_author_local_markers_dataframe, process=True)
+        schedule_shared_input(scheduler, "nsforest_markers", read_nsforest_markers_dataframe, process=True)
+        scheduler.add("cluster_annotations", get_cluster_annotations, (CLUSTER_ANNOTATIONS_PATH,))
+        schedule_shared_input(scheduler, "nt_symbols_mapping", read_csv_to_dict, NT_SYMBOLS_MAPPING, delimiter="\t")
+        scheduler.add("dhba_index", get_dhba_index)
+        schedule_shared_input(scheduler, "mba_symbols", get_aba_symbols_map, requires=["dhba_index"])
+        schedule_shared_input(scheduler, "mba_labels", get_mba_labels_map, requires=["dhba_index"])
+        schedule_shared_input(scheduler, "anatomical_loc_inconsistencies", get_anatomical_location_inconsistencies,
+                              CLUSTER_ANNOTATIONS_PATH, requires=["cluster_annotations"])
+        schedule_shared_input(scheduler, "nt_inconsistencies", get_neurotransmitter_inconsistencies,
+                              CLUSTER_ANNOTATIONS_PATH)
+        scheduler.add("atlas_payloads", context.get_atlas_payloads, (ABC_URLS_MAPPING,))
+        scheduler.run()
+        scheduler.log_timings("{} class base inputs".format(context.taxon))
+
+    def get_input_files(self):
+        marker_files = [file_path for file_path in
+                        AUTHOR_MARKERS_FILES + AUTHOR_LOCAL_MARKERS_FILES + NSFOREST_MARKERS_FILES
+                        if os.path.isfile(file_path)]
+        return (super().get_input_files() + get_gene_db_files(TEMPLATES_FOLDER_PATH) + marker_files +
+                [CLUSTER_ANNOTATIONS_PATH, NT_SYMBOLS_MAPPING, ABC_URLS_MAPPING])
+
+    def get_input_data(self):
+        # the DHBA maps are read from the DHBA ontology
+        return self.mba_symbols, self.mba_labels
+
+    def reuse_rows(self, o, node, collapsed, rows):
+        super().reuse_rows(o, node, collapsed, rows)
+        for d in rows:
+            self.processed_accessions.add(node['cell_set_accession'])
+            if o['cell_set_accession'] in self.context.cl_subset:
+                cloned = d.copy()
+                cloned['cell_set_accession'] = node['cell_set_accession']
+                self.terms_moved_to_cl_subset.append(cloned)
+
+    def add_node(self, o, node, collapsed):
+        context = self.context
+        taxonomy_config = context.taxonomy_config
+        all_pref_labels = context.all_pref_labels
+        gene_db = context.gene_db
+        mba_symbols = self.mba_symbols
+        mba_labels = self.mba_labels
+        if node.get('cell_set_accession') and node['cell_set_accession'] not in self.processed_accessions:
+            d = dict()
+            if o['cell_set_accession'] in context.cl_subset:
+                id_factory = context.cl_id_factory
+                marker_id_factory = context.clm_id_factory
+                id_base = CL_BASE
+                marker_id_base = CLM_BASE
+            else:
+                id_factory = context.pcl_id_factory
+                marker_id_factory = context.pcl_id_factory
+                id_base = PCL_BASE
+                marker_id_base = PCL_BASE
+
+            d['defined_class'] = id_base + context.get_id(id_factory, "class", node['cell_set_accession'])
+
+            d["prefLabel"] = all_pref_labels[node['cell_set_accession']]
+            if node.get('taxonomy_cell_label'):
+                d["Taxonomy_label"] = node['taxonomy_cell_label']
+            else:
+                d["Taxonomy_label"] = node['cell_label']
+            synonyms = list(node.get("synonyms", []) or [])
+            synonyms.append(node['cell_label'])
+            if collapsed:
+                synonyms.extend([context.all_nodes[accession_id]['cell_label'] for accession_id in node["chain"]])
+            d['Synonyms_from_taxonomy'] = "|".join(sorted(list(set(synonyms))))
+            d['Gross_cell_type'] = get_gross_cell_type(node['cell_set_accession'], context.dend['nodes'],
+                                                       context.gross_cell_types)
+            d['Taxon'] = taxonomy_config['Species'][0]
+            d['Taxon_abbv'] = taxonomy_config['Gene_abbv'][0]
+            d['Brain_region'] = taxonomy_config['Brain_region'][0]
+            cluster_id = node['cell_set_accession']
+            if collapsed:
+                cluster_id = "|".join(node["chain"])
+            d['Cluster_IDs'] = cluster_id
+            d['Labelset'] = node['labelset'].capitalize()
+            d['Dataset_url'] = "https://purl.brain-bican.org/taxonomy/CCN20230722"
+            reference_paper = "https://doi.org/10.1038/s41586-023-06812-z"
+            if 'rationale_dois' in node and node['rationale_dois']:
+                alias_citations = {citation.strip() for citation in node['rationale_dois']
+                                   if citation and citation.strip()}
+                alias_citations.add(reference_paper)
+                d["Alias_citations"] = "|".join(alias_citations)
+            else:
+                d["Alias_citations"] = reference_paper
+            d["Short_form_citation"] = "XYZ et al. (2023), Basal Ganglia Consensus"
+            if node.get('parent_cell_set_accession'):
+                d['Parent_label'] = all_pref_labels[node['parent_cell_set_accession']]
+            author_annotation_fields = node["author_annotation_fields"] or dict()
+            markers_str = author_annotation_fields.get(f"{node['labelset']}.markers.combo", "")
+            markers_list = [marker.strip() for marker in markers_str.split(",") if marker.strip()]
+            d['Minimal_markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
+
+            d['Allen_markers'] = ""
+            if 'Brain_region_abbv' in taxonomy_config:
+                d['Brain_region_abbv'] = taxonomy_config['Brain_region_abbv'][0]
+            if 'Species_abbv' in taxonomy_config:
+                d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
+            d['Individuals'] = BICAN_INDV_BASE + node['cell_set_accession']
+            d['part_of'] = ''
+            d['has_soma_location'] = taxonomy_config['Brain_region'][0]
+
+
+            associate_marker_sets(context.all_nodes, self.author_local_markers, self.author_markers, collapsed, d,
+                                  context.allocated_ids[type(marker_id_factory)], marker_id_base, node,
+                                  self.ns_forest_markers, o)
+
+            if "cell_ontology_term_id" in node and node["cell_ontology_term_id"]:
+                d['CL'] = node["cell_ontology_term_id"]
+            else:
+                d['CL'] = ""
+
+            d['NT'] = ""
+            d['NT_markers'] = ""
+            if node.get('neurotransmitter_accession'):
+                nt_accession = node.get('neurotransmitter_accession')
+                if nt_accession in self.nt_symbols_mapping:
+                    d['NT'] = self.nt_symbols_mapping.get(nt_accession)["CELL TYPE NEUROTRANSMISSION ID"]
+                    d['NT_label'] = " and ".join(self.nt_symbols_mapping.get(nt_accession)["CELL TYPE LABEL"].split("|"))
+            if node.get('neurotransmitter_marker_gene_evidence'):
+                nt_marker_names = node.get('neurotransmitter_marker_gene_evidence')
+                d['NT_markers'] = "|".join(nt_marker_names)
+                for i in range(1, 9):
+                    if i <= len(nt_marker_names):
+                        d['NT_marker_' + str(i)] = get_gene_id(gene_db, nt_marker_names[i - 1])
+                    else:
+                        d['NT_marker_' + str(i)] = ''
+                if len(nt_marker_names) > 8:
+                    raise ValueError("More than 8 NT markers found for cluster: " + node['cell_set_accession'])
+
+            missed_regions = set()
+            annotation_row = self.cluster_annotations.get_row(node['cell_set_accession'])
+            if annotation_row is not None:
+                broad_regions = self.broad_regions[annotation_row]
+                acronym_regions = self.acronym_regions[annotation_row]
+
+                # BROAD_REGION:
+                broad_mbas, mba_text = populate_mba_relations(broad_regions, BROAD_REGION, d, 1, missed_regions)
+                d['MBA'] = "|".join(broad_mbas)
+                d['MBA_text'] = ", ".join(mba_text)
+                # ACRONYM_REGION:
+                acronym_mbas, mba_text = populate_mba_relations(acronym_regions, ACRONYM_REGION, d, len(broad_mbas) + 1, missed_regions, broad_mbas)
+                acronym_mbas = [acronym_mba for acronym_mba in acronym_mbas if acronym_mba not in broad_mbas]
+                d['CCF_acronym_freq'] = "|".join(acronym_mbas)
+
+            d['MBA_assay'] = "EFO:0008992"
+            for missed_region in missed_regions:
+                print("MBA symbol not found for region: ", missed_region)
+
+            d["Subclass_markers"] = (author_annotation_fields.
+                                     get("cluster.markers.combo _within subclass_", "").replace("None", "").replace(",", "|"))
+            if node["cell_label"] in self.anatomical_loc_inconsistencies:
+                mentioned_locations = get_location_symbols(node["cell_label"])
+                inconsistent_locations = self.anatomical_loc_inconsistencies[node["cell_label"]]
+                location_names = ", ".join([mba_labels[mba_symbols[loc]] + " (" + loc + ")" for loc in inconsistent_locations])
+                if len(mentioned_locations) == len(inconsistent_locations):
+                    d["Location_disclaimer"] = "Warning: This type {name} does not have cells in any of the regions it is named for {location_names}. " \
+                     "The name merely indicates that it is a subtype of more general transcriptomic type that does. This assertion is based on data " \
+                     "from registration to a reference standard common co-ordinate framework and parcelation scheme.".format(name=d["prefLabel"], location_names=location_names)
+                else:
+                    d["Location_disclaimer"] = ("Warning: Despite its name, {name} does not have cells in {location_names}. " 
+                                                "This assertion is based on data from registration to a reference standard common co-ordinate "
+                                                "framework and parcelation scheme.").format(name=d["prefLabel"], location_names=location_names)
+            if node["cell_set_accession"] in self.nt_inconsistencies:
+                inconsistent_nts = self.nt_inconsistencies[node["cell_set_accession"]]
+                d["NT_disclaimer"] = "Warning: Despite its name, {name} does not secrete the neurotransmitter {nt}, as assessed by expression of multiple marker genes.".format(name=d["prefLabel"], nt=", ".join(inconsistent_nts))
+
+            if self.atlas_payloads.get(o["cell_set_accession"]):
+                d["Atlas_url"] = ABC_ATLAS_URL + self.atlas_payloads.get(o["cell_set_accession"])
+                d["Atlas_url_label"] = "Reference data on Allen Brain Cell Atlas"
+
+            d["Matrix_url"] = "https://purl.brain-bican.org/taxonomy/CCN20230722/" + \
+                              context.class_membership[node["cell_set_accession"]] + ".h5ad"
+            d["Class_name"] = context.class_membership[node["cell_set_accession"]]
+
+            for k in self.class_seed:
+                if not (k in d.keys()):
+                    d[k] = ''
+            self.write_row(d)
+            self.processed_accessions.add(node['cell_set_accession'])
+
+            if o['cell_set_accession'] in context.cl_subset:
+                cloned = d.copy()
+                cloned['cell_set_accession'] = node['cell_set_accession']
+                self.terms_moved_to_cl_subset.append(cloned)
+    # Disabled obsoletion since we haven't made a public release yet.
+    #     else:
+    #         # process obsoleted classes due to chain compressing
+    #         if collapsed and o.get('cell_set_accession') not in self.processed_accessions:
+    #             d = dict()
+    #             d['defined_class'] = PCL_BASE + context.pcl_id_factory.get_class_id(o['cell_set_accession'])
+    #             d['prefLabel'] = "obsolete " + o['cell_label']
+    #             d['Comment'] = "This class is obsoleted due to chain compression."
+    #             d['Deprecated'] = "true"
+    #             d['Gross_cell_type'] = get_gross_cell_type(o['cell_set_accession'],
+    #                                                        context.dend['nodes'])
+    #             d['Taxon'] = taxonomy_config['Species'][0]
+    #             d['Taxon_abbv'] = taxonomy_config['Gene_abbv'][0]
+    #             d['Comment'] = "This term is obsoleted due to identical cell set chain compression."
+    #             d['Classification'] = "CL:0000000"
+    #             d['ReplacedBy'] = ""
+    #             self.obsolete_template.append(d)
+
+    def close(self):
+        # for cl_obsolete in self.terms_moved_to_cl_subset:
         #     obsolete_d = dict()
-        #     obsolete_d['defined_class'] = PCL_BASE + pcl_id_factory.get_class_id(cl_obsolete['cell_set_accession'])
+        #     obsolete_d['defined_class'] = PCL_BASE + self.context.pcl_id_factory.get_class_id(cl_obsolete['cell_set_accession'])
         #     obsolete_d['prefLabel'] = "obsolete " + cl_obsolete['prefLabel']
         #     obsolete_d['Comment'] = "This PCL class is no longer in use; it has been relocated to CL."
         #     obsolete_d['Deprecated'] = "true"
         #     obsolete_d['Gross_cell_type'] = cl_obsolete['Gross_cell_type']
         #     obsolete_d['Classification'] = "CL:0000000"
         #     obsolete_d['ReplacedBy'] = cl_obsolete['defined_class']
-        #     obsolete_template.append(obsolete_d)
+        #     self.obsolete_template.append(obsolete_d)
 
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
-        # if obsolete_template:
-        #     obsolete_filepath = output_filepath.replace("_base.tsv", "_obsolete.tsv")
-        #     class_obsolete_template = pd.DataFrame.from_records(obsolete_template)
+        written = super().close()
+        # if self.obsolete_template:
+        #     obsolete_filepath = self.writer.output_filepath.replace("_base.tsv", "_obsolete.tsv")
+        #     class_obsolete_template = pd.DataFrame.from_records(self.obsolete_template)
         #     class_obsolete_template.to_csv(obsolete_filepath, sep="\t", index=False)
+        return written
+
+
+def generate_base_class_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(BaseClassTemplateBuilder(context), output_filepath)])
 
 
-def associate_marker_sets(all_nodes, author_local_markers, author_markers, collapsed, d, id_factory,
+def associate_marker_sets(all_nodes, author_local_markers, author_markers, collapsed, d, marker_ids,
                           id_prefix, node, ns_forest_markers, o):
     """
     Associates the following marker sets to the node:
@@ -444,65 +1038,57 @@ def associate_marker_sets(all_nodes, author_local_markers, author_markers, colla
     - within_subclass_marker_gene_set
     - nsforest_marker_gene_sets
     Args:
-        all_nodes:
-        author_local_markers:
-        author_markers:
-        collapsed:
-        d:
-        id_factory:
-        id_prefix:
-        node:
-        ns_forest_markers:
-        o:
+        all_nodes: all taxonomy nodes by accession id
+        author_local_markers: author local markers MarkerScoreIndex
+        author_markers: author markers MarkerScoreIndex
+        collapsed: True if the node is a collapsed singleton chain
+        d: template row
+        marker_ids: marker gene set ids of the nodes by id kind (see TaxonomyContext.allocated_ids)
+        id_prefix: marker gene set id prefix
+        node: taxonomy node or collapsed chain
+        ns_forest_markers: NS-Forest markers MarkerScoreIndex
+        o: taxonomy node
 
     Returns:
     """
     d['aligned_alias'] = ""
     if node.get('marker_gene_evidence'):
-        d['evidence_marker_gene_set'] = id_prefix + id_factory.get_evidence_marker_gene_set_id(
-            node['cell_set_accession'])
+        d['evidence_marker_gene_set'] = id_prefix + marker_ids["evidence_marker_gene_set"][node['cell_set_accession']]
     if ("author_annotation_fields" in node and node["author_annotation_fields"] and
             node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo") and
             str(node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo",
                                                      "")).lower() != "none"):
-        d['marker_gene_set'] = id_prefix + id_factory.get_marker_gene_set_id(
-            node['cell_set_accession'])
-        filtered_df = author_markers[author_markers['clusterName'] == o['cell_label']]
-        if not filtered_df.empty:
-            d['marker_gene_set_confidence'] = filtered_df['f_score'].values[0]
+        d['marker_gene_set'] = id_prefix + marker_ids["marker_gene_set"][node['cell_set_accession']]
+        if o['cell_label'] in author_markers:
+            d['marker_gene_set_confidence'] = author_markers.f_score(o['cell_label'])
     if ("author_annotation_fields" in node and node["author_annotation_fields"] and
             node["author_annotation_fields"].get(
                 f"{node['labelset']}.markers.combo _within subclass_") and
             str(node["author_annotation_fields"].get(
                 f"{node['labelset']}.markers.combo _within subclass_", "")).lower() != "none"):
-        d['ws_marker_gene_set'] = id_prefix + id_factory.get_ws_marker_gene_set_id(
-            node['cell_set_accession'])
-        filtered_df = author_local_markers[author_local_markers['clusterName'] == o['cell_label']]
-        if not filtered_df.empty:
-            d['ws_marker_gene_set_confidence'] = filtered_df['f_score'].values[0]
+        d['ws_marker_gene_set'] = id_prefix + marker_ids["ws_marker_gene_set"][node['cell_set_accession']]
+        if o['cell_label'] in author_local_markers:
+            d['ws_marker_gene_set_confidence'] = author_local_markers.f_score(o['cell_label'])
     if not collapsed:
-        filtered_df = ns_forest_markers[ns_forest_markers['clusterName'] == o['cell_label']]
-        if not filtered_df.empty:
-            d['nsforest_marker_gene_set_1'] = id_prefix + id_factory.get_nsf_marker_gene_set_id(
-                node['cell_set_accession'])
-            d['nsforest_marker_gene_set_1_confidence'] = filtered_df['f_score'].values[0]
+        if o['cell_label'] in ns_forest_markers:
+            d['nsforest_marker_gene_set_1'] = id_prefix + marker_ids["nsf_marker_gene_set"][node['cell_set_accession']]
+            d['nsforest_marker_gene_set_1_confidence'] = ns_forest_markers.f_score(o['cell_label'])
     else:
         index = 1
         for collapsed_accession in node['chain']:
             collapsed_node = all_nodes[collapsed_accession]
-            filtered_df = ns_forest_markers[
-                ns_forest_markers['clusterName'] == collapsed_node['cell_label']]
-            if not filtered_df.empty:
+            if collapsed_node['cell_label'] in ns_forest_markers:
                 d['nsforest_marker_gene_set_' + str(
-                    index)] = id_prefix + id_factory.get_nsf_marker_gene_set_id(
-                    collapsed_node['cell_set_accession'])
+                    index)] = id_prefix + marker_ids["nsf_marker_gene_set"][collapsed_node['cell_set_accession']]
                 d['nsforest_marker_gene_set_' + str(index) + '_confidence'] = \
-                filtered_df['f_score'].values[0]
+                ns_forest_markers.f_score(collapsed_node['cell_label'])
                 index += 1
 
 
 def get_all_unique_cell_labels(dend, nodes_to_collapse, all_names, name_curations):
     all_pref_labels = dict()
+    # label uniqueness checks count the taxonomy labels by suffix, indexed once for all nodes
+    all_names = LabelSuffixIndex(all_names)
 
     processed_accessions = set()
     all_cell_set_labels = set()
@@ -536,7 +1122,7 @@ def get_unique_cell_label(o, node, generated_labels, all_names, name_curations,
         o: Taxonomy node
         node: compressed node or 'o' if no compression
         generated_labels: all labels added to ontology
-        all_names: all labels existing in the taxonomy
+        all_names: all labels existing in the taxonomy or their LabelSuffixIndex
         name_curations: manual curation of cell labels
         is_collapsed: True if the node is part of a collapsed chain
         fail_on_duplicate: True if the function should raise an error if a duplicate label is found
@@ -552,16 +1138,14 @@ def get_unique_cell_label(o, node, generated_labels, all_names, name_curations,
     return cell_label
 
 
-def populate_mba_relations(ccf_text, approach, d, index, mba_symbols, mba_labels, missed_regions, existing_mbas=None):
+def populate_mba_relations(regions, approach, d, index, missed_regions, existing_mbas=None):
     """
 
     Args:
-        ccf_text: ccf_broad_freq or ccf_acronym_freq text
+        regions: RegionAssignment of the cluster (broad or acronym regions)
         approach: broad vs acronym
         d: data node
         index: MBA id index offset
-        mba_symbols: dict of MBA symbols - ids
-        mba_labels: dict of MBA ids - labels
         missed_regions: regions couldn't be mapped
         existing_mbas: list of existing mbas to avoid duplication
 
@@ -570,532 +1154,579 @@ def populate_mba_relations(ccf_text, approach, d, index, mba_symbols, mba_labels
     """
     if existing_mbas is None:
         existing_mbas = []
-    regions = [{"region": item.split(":")[0].strip(),
-                "percentage": float(item.split(":")[1].strip()) if ":" in item else 0}
-               for item in ccf_text.split(",")]
-    mbas = []
-    mba_text = []
-    for region in regions:
-        if region["percentage"] >= BRAIN_REGION_THRESHOLD:
-            region_label = str(region["region"]).strip()
-            if region_label.lower() == "na":
-                region_label = 'root'  # handle NA as brain
-            if mba_symbols.get(region_label) not in existing_mbas:
-                if region_label in mba_symbols:
-                    mbas.append(mba_symbols[region_label])
-                    mba_text.append(mba_labels[mba_symbols[region_label]] + " (" + str(region["region"]) + ", " + str(region["percentage"]) + ")")
-                    region["mba_id"] = mba_symbols[region_label]
-                else:
-                    missed_regions.add(region["region"])
-
-    # Sort mbas and mba_text together
-    sorted_pairs = sorted(zip(mbas, mba_text))
-    mbas, mba_text = zip(*sorted_pairs) if sorted_pairs else ([], [])
-
-    for i, mba in enumerate(mbas, start=index):
-        d['MBA_' + str(i)] = mba
-        region = [reg for reg in regions if reg.get("mba_id") == mba][0]
-        d['MBA_' + str(i) + '_cell_percentage'] = region["percentage"]
+    missed_regions.update(regions.missed)
+    # regions are sorted by mba id and text, so excluding the existing mbas keeps them sorted
+    assigned = [i for i, mba in enumerate(regions.mbas) if mba not in existing_mbas]
+    mbas = tuple(regions.mbas[i] for i in assigned)
+    mba_text = tuple(regions.texts[i] for i in assigned)
+
+    for i, region_index in enumerate(assigned, start=index):
+        d['MBA_' + str(i)] = regions.mbas[region_index]
+        d['MBA_' + str(i) + '_cell_percentage'] = regions.percentages[region_index]
         d['MBA_' + str(i) + '_comment'] = "Location assignment based on {}.".format(approach)
 
     return mbas, mba_text
 
 
-def generate_curated_class_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        cl_id_factory = CLIdFactory(read_json_file(taxonomy_file_path))
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        class_curation_seed = ['defined_class',
-                               'cell_set_accession',
-                               'Taxonomy_label',
-                               'Exclude_from_ontology',
-                               'defined_class_name',
-                               'defined_class_definition',
-                               'Curated_synonyms',
-                               'Classification',
-                               'Classification_comment',
-                               'Classification_pub',
-                               'Expresses',
-                               'Expresses_comment',
-                               'Expresses_pub',
-                               'Projection_type',
-                               'Locations',
-                               'Neurotransmitters',
-                               'Neurotransmitters_comment',
-                               'Neurotransmitters_publication',
-                               'Cross_species_text',
-                               'Comment'
-                               ]
-        class_template = []
-        processed_accessions = set()
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-            if node.get('cell_set_accession') and node['cell_set_accession'] not in processed_accessions:
-                d = dict()
-                if o['cell_set_accession'] in cl_subset:
-                    id_factory = cl_id_factory
-                    id_base = CL_BASE
-                else:
-                    id_factory = pcl_id_factory
-                    id_base = PCL_BASE
+class CuratedClassTemplateBuilder(TemplateRowBuilder):
+    """
+    Class curation template, to be filled in by the curators for each class of the class base template.
+    """
 
-                d['defined_class'] = id_base + id_factory.get_class_id(node['cell_set_accession'])
-                d["cell_set_accession"] = node['cell_set_accession']
-                d["Taxonomy_label"] = node['cell_label']
-                d["Exclude_from_ontology"] = ""  # set `True` to exclude from ontology
+    file_suffix = "_class_curation.tsv"
+    owl_components = ("{}_class.owl", "{}_inferred_hierarchy.owl")
+
+    class_curation_seed = ['defined_class',
+                           'cell_set_accession',
+                           'Taxonomy_label',
+                           'Exclude_from_ontology',
+                           'defined_class_name',
+                           'defined_class_definition',
+                           'Curated_synonyms',
+                           'Classification',
+                           'Classification_comment',
+                           'Classification_pub',
+                           'Expresses',
+                           'Expresses_comment',
+                           'Expresses_pub',
+                           'Projection_type',
+                           'Locations',
+                           'Neurotransmitters',
+                           'Neurotransmitters_comment',
+                           'Neurotransmitters_publication',
+                           'Cross_species_text',
+                           'Comment'
+                           ]
+
+    columns = class_curation_seed
+    column_types = {column: LIST_TYPE for column in ['Curated_synonyms', 'Classification_pub', 'Expresses',
+                                                     'Expresses_comment', 'Expresses_pub', 'Locations',
+                                                     'Neurotransmitters']}
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.processed_accessions = set()
+
+    def reuse_rows(self, o, node, collapsed, rows):
+        super().reuse_rows(o, node, collapsed, rows)
+        if rows:
+            self.processed_accessions.add(node['cell_set_accession'])
+
+    def add_node(self, o, node, collapsed):
+        context = self.context
+        if node.get('cell_set_accession') and node['cell_set_accession'] not in self.processed_accessions:
+            d = dict()
+            if o['cell_set_accession'] in context.cl_subset:
+                id_factory = context.cl_id_factory
+                id_base = CL_BASE
+            else:
+                id_factory = context.pcl_id_factory
+                id_base = PCL_BASE
 
-                for k in class_curation_seed:
-                    if not (k in d.keys()):
-                        d[k] = ''
-                class_template.append(d)
-                processed_accessions.add(node['cell_set_accession'])
+            d['defined_class'] = id_base + context.get_id(id_factory, "class", node['cell_set_accession'])
+            d["cell_set_accession"] = node['cell_set_accession']
+            d["Taxonomy_label"] = node['cell_label']
+            d["Exclude_from_ontology"] = ""  # set `True` to exclude from ontology
 
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
-
-
-def generate_marker_gene_set_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        all_names = {node['cell_label']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        clm_id_factory = CLMIdFactory(read_json_file(taxonomy_file_path))
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        name_curations = read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
-        author_markers = read_author_markers_dataframe()
-        all_pref_labels = get_all_unique_cell_labels(dend, nodes_to_collapse, all_names,
-                                                     name_curations)
-        atlas_payloads = read_abc_urls(ABC_URLS_MARKER_SET_MAPPING)
-
-        gene_db = read_gene_dbs(TEMPLATES_FOLDER_PATH)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        class_seed = ['defined_class',
-                      'Marker_set_of',
-                      'Markers',
-                      'Markers_label',
-                      'Species_abbv',
-                      'Brain_region',
-                      'Parent',
-                      'FBeta_confidence_score',
-                      'precision',
-                      'recall',
-                      'Algorithm',
-                      'Source',
-                      'Cell_label',
-                      'Labelset',
-                      'Atlas_url',
-                      'Atlas_url_label'
-                      ]
-        class_template = []
-        processed_accessions = set()
-        marker_labels = dict()
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-            if node.get('cell_set_accession') and node['cell_set_accession'] not in processed_accessions :
-                if ("author_annotation_fields" in node and node["author_annotation_fields"] and
-                        node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo", "") and
-                        str(node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo", "")).lower() != "none"):
-                    d = dict()
-                    if node['cell_set_accession'] in cl_subset:
-                        id_factory = clm_id_factory
-                        id_base = CLM_BASE
-                    else:
-                        id_factory = pcl_id_factory
-                        id_base = PCL_BASE
-
-                    d['defined_class'] = id_base + id_factory.get_marker_gene_set_id(node['cell_set_accession'])
-                    cell_set_label = all_pref_labels[node["cell_set_accession"]]
-                    d['Marker_set_of'] = cell_set_label
-                    markers_str = node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo", "")
-                    markers_list = [marker.strip() for marker in markers_str.split(",")]
-                    d['Markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
-                    d['Markers_label'] = node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo", "")
-                    if d['Markers_label'] not in marker_labels:
-                        marker_labels[d['Markers_label']] = 1
-                    else:
-                        # avoid label conflicts by appending a number
-                        marker_labels[d['Markers_label']] += 1
-                        d['Markers_label'] = d['Markers_label'] + " " + str(marker_labels[d['Markers_label']])
-                    if 'Species_abbv' in taxonomy_config:
-                        d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
-                    d['Brain_region'] = taxonomy_config['Brain_region'][0]
-                    d['Parent'] = "SO:0001260"  # sequence collection
-                    d['FBeta_confidence_score'] = ""
-                    d['Algorithm'] = ""
-                    d['Source'] = "Yao"
-                    d['Reference'] = "https://doi.org/10.1038/s41586-023-06812-z"
-                    filtered_df = author_markers[author_markers['clusterName'] == o['cell_label']]
-                    if not filtered_df.empty:
-                        d['FBeta_confidence_score'] = filtered_df['f_score'].values[0]
-                        d['precision'] = filtered_df['precision'].values[0]
-                        d['recall'] = filtered_df['recall'].values[0]
-                    d['Cell_label'] = o['cell_label']
-                    d['Labelset'] = o['labelset']
-                    if d['defined_class'] in atlas_payloads:
-                        d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(d['defined_class'])
-                        d["Atlas_url_label"] = "markers in reference data on Allen Brain Cell Atlas"
-
-                    for k in class_seed:
-                        if not (k in d.keys()):
-                            d[k] = ''
-                    class_template.append(d)
-                    processed_accessions.add(node['cell_set_accession'])
-
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
-
-def generate_within_subclass_marker_gene_set_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        all_names = {node['cell_label']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        clm_id_factory = CLMIdFactory(read_json_file(taxonomy_file_path))
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        name_curations = read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
-        author_local_markers = read_author_local_markers_dataframe()
-        all_pref_labels = get_all_unique_cell_labels(dend, nodes_to_collapse, all_names,
-                                                     name_curations)
-        atlas_payloads = read_abc_urls(ABC_URLS_WS_MAPPING)
-
-        gene_db = read_gene_dbs(TEMPLATES_FOLDER_PATH)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        class_seed = ['defined_class',
-                      'Marker_set_of',
-                      'Markers',
-                      'Markers_label',
-                      'Species_abbv',
-                      'Brain_region',
-                      'Parent',
-                      'FBeta_confidence_score',
-                      'precision',
-                      'recall',
-                      'Algorithm',
-                      'Source',
-                      'Cell_label',
-                      'Labelset',
-                      'Atlas_url',
-                      'Atlas_url_label'
-                      ]
-        class_template = []
-        processed_accessions = set()
-        marker_labels = dict()
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-            if node.get('cell_set_accession') and node['cell_set_accession'] not in processed_accessions :
-                if ("author_annotation_fields" in node and node["author_annotation_fields"] and
-                        node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo _within subclass_", "") and
-                        str(node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo _within subclass_", "")).lower() != "none"):
-                    d = dict()
-                    if node['cell_set_accession'] in cl_subset:
-                        id_factory = clm_id_factory
-                        id_base = CLM_BASE
-                    else:
-                        id_factory = pcl_id_factory
-                        id_base = PCL_BASE
-
-                    d['defined_class'] = id_base + id_factory.get_ws_marker_gene_set_id(node['cell_set_accession'])
-                    cell_set_label = all_pref_labels[node["cell_set_accession"]]
-                    d['Marker_set_of'] = cell_set_label
-                    markers_str = node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo _within subclass_", "")
-                    markers_list = [marker.strip() for marker in markers_str.split(",")]
-                    d['Markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
-                    d['Markers_label'] = node["author_annotation_fields"].get(f"{node['labelset']}.markers.combo _within subclass_", "")
-                    if d['Markers_label'] not in marker_labels:
-                        marker_labels[d['Markers_label']] = 1
-                    else:
-                        # avoid label conflicts by appending a number
-                        marker_labels[d['Markers_label']] += 1
-                        d['Markers_label'] = d['Markers_label'] + " " + str(marker_labels[d['Markers_label']])
-                    if 'Species_abbv' in taxonomy_config:
-                        d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
-                    d['Brain_region'] = taxonomy_config['Brain_region'][0]
-                    d['Parent'] = "SO:0001260"  # sequence collection
-                    d['FBeta_confidence_score'] = ""
-                    d['Algorithm'] = ""
-                    d['Source'] = "Yao - within subclass"
-                    d['Reference'] = "https://doi.org/10.1038/s41586-023-06812-z"
-                    filtered_df = author_local_markers[author_local_markers['clusterName'] == o['cell_label']]
-                    if not filtered_df.empty:
-                        d['FBeta_confidence_score'] = filtered_df['f_score'].values[0]
-                        d['precision'] = filtered_df['precision'].values[0]
-                        d['recall'] = filtered_df['recall'].values[0]
-                    d['Cell_label'] = o['cell_label']
-                    d['Labelset'] = o['labelset']
-                    if d['defined_class'] in atlas_payloads:
-                        d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(d['defined_class'])
-                        d["Atlas_url_label"] = "markers in reference data on Allen Brain Cell Atlas"
-
-                    for k in class_seed:
-                        if not (k in d.keys()):
-                            d[k] = ''
-                    class_template.append(d)
-                    processed_accessions.add(node['cell_set_accession'])
-
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
-
-
-def generate_evidence_marker_gene_set_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        all_names = {node['cell_label']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        clm_id_factory = CLMIdFactory(read_json_file(taxonomy_file_path))
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        name_curations = read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
-        all_pref_labels = get_all_unique_cell_labels(dend, nodes_to_collapse, all_names,
-                                                     name_curations)
-        atlas_payloads = read_abc_urls(ABC_URLS_EVIDENCE_MAPPING)
-
-        gene_db = read_gene_dbs(TEMPLATES_FOLDER_PATH)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        class_seed = ['defined_class',
-                      'Marker_set_of',
-                      'Markers',
-                      'Markers_label',
-                      'Species_abbv',
-                      'Brain_region',
-                      'Parent',
-                      'FBeta_confidence_score',
-                      'precision',
-                      'recall',
-                      'Algorithm',
-                      'Source',
-                      'Cell_label',
-                      'Labelset',
-                      'Atlas_url',
-                      'Atlas_url_label'
-                      ]
-        class_template = []
-        processed_accessions = set()
-        marker_labels = dict()
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-            if node.get('cell_set_accession') and node['cell_set_accession'] not in processed_accessions :
-                if "marker_gene_evidence" in node and node["marker_gene_evidence"]:
-                    d = dict()
-                    if node['cell_set_accession'] in cl_subset:
-                        id_factory = clm_id_factory
-                        id_base = CLM_BASE
-                    else:
-                        id_factory = pcl_id_factory
-                        id_base = PCL_BASE
-
-                    d['defined_class'] = id_base + id_factory.get_evidence_marker_gene_set_id(node['cell_set_accession'])
-                    cell_set_label = all_pref_labels[node["cell_set_accession"]]
-                    d['Marker_set_of'] = cell_set_label
-                    markers_list = [marker.strip() for marker in node["marker_gene_evidence"]]
-                    d['Markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
-                    d['Markers_label'] = ", ".join(markers_list)
-                    if d['Markers_label'] not in marker_labels:
-                        marker_labels[d['Markers_label']] = 1
-                    else:
-                        # avoid label conflicts by appending a number
-                        marker_labels[d['Markers_label']] += 1
-                        d['Markers_label'] = d['Markers_label'] + " " + str(marker_labels[d['Markers_label']])
-                    if 'Species_abbv' in taxonomy_config:
-                        d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
-                    d['Brain_region'] = taxonomy_config['Brain_region'][0]
-                    d['Parent'] = "SO:0001260"  # sequence collection
-                    d['FBeta_confidence_score'] = ""
-                    d['Algorithm'] = ""
-                    d['Source'] = "CAS evidence"
-                    d['Reference'] = ""
-                    d['FBeta_confidence_score'] = ""
-                    d['precision'] = ""
-                    d['recall'] = ""
-                    d['Cell_label'] = o['cell_label']
-                    d['Labelset'] = o['labelset']
-                    if d['defined_class'] in atlas_payloads:
-                        d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(d['defined_class'])
-                        d["Atlas_url_label"] = "markers in reference data on Allen Brain Cell Atlas"
-
-                    for k in class_seed:
-                        if not (k in d.keys()):
-                            d[k] = ''
-                    class_template.append(d)
-                    processed_accessions.add(node['cell_set_accession'])
-
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
-
-
-def generate_nsforest_marker_gene_set_template(taxonomy_file_path, output_filepath):
-    taxon = extract_taxonomy_name_from_path(taxonomy_file_path)
-    taxonomy_config = read_taxonomy_config(taxon)
-
-    if taxonomy_config:
-        dend = cas_json_2_nodes_n_edges(taxonomy_file_path)
-        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
-        all_names = {node['cell_label']: node for node in dend['nodes']}
-        pcl_id_factory = PCLIdFactory(read_json_file(taxonomy_file_path))
-        clm_id_factory = CLMIdFactory(read_json_file(taxonomy_file_path))
-        dend_tree = generate_dendrogram_tree(dend)
-        nodes_to_collapse = get_collapsed_nodes(dend_tree, all_nodes)
-        name_curations = read_one_concept_one_name_tsv(NAME_CURATION_MAPPING)
-        nsforest_markers = read_nsforest_markers_dataframe()
-        all_pref_labels = get_all_unique_cell_labels(dend, nodes_to_collapse, all_names,
-                                                     name_curations)
-        atlas_payloads = read_abc_urls(ABC_URLS_NSF_MAPPING)
-
-        gene_db = read_gene_dbs(TEMPLATES_FOLDER_PATH)
-        cl_subset = get_cl_subset_nodes(nodes_to_collapse)
-
-        class_seed = ['defined_class',
-                      'Marker_set_of',
-                      'Markers',
-                      'Markers_label',
-                      'Species_abbv',
-                      'Brain_region',
-                      'Parent',
-                      'FBeta_confidence_score',
-                      'precision',
-                      'recall',
-                      'Algorithm',
-                      'Source',
-                      'Cell_label',
-                      'Labelset',
-                      'Atlas_url',
-                      'Atlas_url_label'
-                      ]
-        class_template = []
-        marker_labels = dict()
-        for o in dend['nodes']:
-            node = o
-            if o['cell_set_accession'] in nodes_to_collapse:
-                node = nodes_to_collapse[o['cell_set_accession']]
-            if node.get('cell_set_accession'):
-                filtered_df = nsforest_markers[nsforest_markers['clusterName'] == o['cell_label']]
-                if not filtered_df.empty:
-                    d = dict()
-                    if node['cell_set_accession'] in cl_subset:
-                        id_factory = clm_id_factory
-                        id_base = CLM_BASE
-                    else:
-                        id_factory = pcl_id_factory
-                        id_base = PCL_BASE
-
-                    d['defined_class'] = id_base + id_factory.get_nsf_marker_gene_set_id(o['cell_set_accession'])
-                    cell_set_label = all_pref_labels[node["cell_set_accession"]]
-                    d['Marker_set_of'] = cell_set_label
-                    markers_list = ast.literal_eval(filtered_df['markers'].values[0])  # convert "['Vxn', 'C1ql3']" string to list
-                    d['Markers'] = "|".join([get_gene_id(gene_db, marker) for marker in markers_list])
-                    d['Markers_label'] = ", ".join(markers_list)
-                    if d['Markers_label'] not in marker_labels:
-                        marker_labels[d['Markers_label']] = 1
-                    else:
-                        # avoid label conflicts by appending a number
-                        marker_labels[d['Markers_label']] += 1
-                        d['Markers_label'] = d['Markers_label'] + " " + str(marker_labels[d['Markers_label']])
-                    if 'Species_abbv' in taxonomy_config:
-                        d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
-                    d['Brain_region'] = taxonomy_config['Brain_region'][0]
-                    d['Parent'] = "SO:0001260"  # sequence collection
-                    d['FBeta_confidence_score'] = filtered_df['f_score'].values[0]
-                    d['precision'] = filtered_df['PPV'].values[0]
-                    d['recall'] = filtered_df['recall'].values[0]
-                    d['Algorithm'] = "NSforest"
-                    d['Source'] = "NSforest"
-                    d['Reference'] = "https://doi.org/10.1101/2020.09.23.308932"
-                    d['Cell_label'] = o['cell_label']
-                    d['Labelset'] = o['labelset']
-                    if d['defined_class'] in atlas_payloads:
-                        d["Atlas_url"] = ABC_ATLAS_URL + atlas_payloads.get(d['defined_class'])
-                        d["Atlas_url_label"] = "markers in reference data on Allen Brain Cell Atlas"
-
-                    for k in class_seed:
-                        if not (k in d.keys()):
-                            d[k] = ''
-                    class_template.append(d)
-
-        class_robot_template = pd.DataFrame.from_records(class_template)
-        class_robot_template.to_csv(output_filepath, sep="\t", index=False)
+            for k in self.class_curation_seed:
+                if not (k in d.keys()):
+                    d[k] = ''
+            self.write_row(d)
+            self.processed_accessions.add(node['cell_set_accession'])
+
+
+def generate_curated_class_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(CuratedClassTemplateBuilder(context), output_filepath)])
+
+
+class MarkerScoreIndex:
+    """
+    Marker gene set evaluation scores indexed by clusterName. Scores are kept in float arrays and the rows of a cluster
+    are found with a dict lookup instead of scanning the whole table. If a cluster has several rows, the first one
+    is used.
+    """
+
+    def __init__(self, markers_df, precision_column="precision"):
+        """
+        Args:
+            markers_df: marker evaluation table with clusterName, f_score, recall and precision columns and
+            optionally a markers column
+            precision_column: name of the precision column (NS-Forest results name it 'PPV')
+        """
+        cluster_names = markers_df["clusterName"].tolist() if "clusterName" in markers_df else []
+        self.positions = dict()
+        for position, cluster_name in enumerate(cluster_names):
+            self.positions.setdefault(cluster_name, position)
+        self.f_scores = self._read_scores(markers_df, "f_score")
+        self.precisions = self._read_scores(markers_df, precision_column)
+        self.recalls = self._read_scores(markers_df, "recall")
+        self.markers = markers_df["markers"].tolist() if "markers" in markers_df else [None] * len(cluster_names)
+
+    @staticmethod
+    def _read_scores(markers_df, column):
+        if column in markers_df:
+            return pd.to_numeric(markers_df[column], errors="coerce").to_numpy(dtype=np.float64)
+        return np.full(len(markers_df), np.nan)
+
+    def __contains__(self, cluster_name):
+        return cluster_name in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def f_score(self, cluster_name):
+        return self.f_scores[self.positions[cluster_name]]
+
+    def precision(self, cluster_name):
+        return self.precisions[self.positions[cluster_name]]
+
+    def recall(self, cluster_name):
+        return self.recalls[self.positions[cluster_name]]
+
+    def get_markers(self, cluster_name):
+        return self.markers[self.positions[cluster_name]]
+
+
+def read_markers_dataframe(file_paths):
+    """
+    Reads and merges the given marker evaluation CSV files. Missing files are skipped.
+    Args:
+        file_paths: list of CSV file paths
+    Returns:
+        Merged markers dataframe, an empty dataframe if none of the files exists.
+    """
+    markers = None
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            log.warning("Marker evaluation file not found: {}".format(file_path))
+            continue
+        markers_df = pd.read_csv(file_path)
+        markers = markers_df if markers is None else pd.merge(markers, markers_df, how='outer')
+    if markers is None:
+        markers = pd.DataFrame(columns=["clusterName"])
+    return markers
 
 
 def read_author_markers_dataframe():
     """
-    Author markers dataframe is read from the CSV file.
-    Returns: Author markers dataframe
-    """
-    # author_marker_subclass_df = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/AP_WMB_evaluation_author_markers/subclass_results.csv'))
-    # author_marker_supertype_df = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/AP_WMB_evaluation_author_markers/supertype_results.csv'))
-    # author_marker_cluster_df = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/AP_WMB_evaluation_author_markers/cluster_results.csv'))
-    # author_markers = pd.merge(author_marker_subclass_df, author_marker_supertype_df,
-    #                             how='outer')
-    # author_markers = pd.merge(author_markers, author_marker_cluster_df,
-    #                             how='outer')
-    author_markers = pd.DataFrame(columns=["clusterName"])
-    return author_markers
+    Author markers are read from the subclass, supertype and cluster level evaluation CSV files.
+    Returns: Author markers index
+    """
+    return MarkerScoreIndex(read_markers_dataframe(AUTHOR_MARKERS_FILES))
 
 
 def read_author_local_markers_dataframe():
     """
-    Author local markers dataframe is read from the CSV file.
-    Returns: Author markers dataframe
+    Author local (within subclass) markers are read from the local cluster evaluation CSV file.
+    Returns: Author local markers index
     """
-    # author_local_markers = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/AP_WMB_evaluation_author_markers/local_cluster_results.csv'))
-    author_local_markers = pd.DataFrame(columns=["clusterName"])
-    return author_local_markers
+    return MarkerScoreIndex(read_markers_dataframe(AUTHOR_LOCAL_MARKERS_FILES))
 
 
 def read_nsforest_markers_dataframe():
     """
-    NS Forest markers dataframe is read from the CSV file.
-    Returns: NS Forest markers dataframe
+    NS Forest markers are read from the class and subclass level NS-Forest result CSV files.
+    Returns: NS Forest markers index
+    """
+    return MarkerScoreIndex(read_markers_dataframe(NSFOREST_MARKERS_FILES), precision_column="PPV")
+
+
+class MarkerSetTemplateBuilder(TemplateRowBuilder):
+    """
+    Base of the marker gene set templates. Subclasses define the atlas url mapping and the id kind of the marker sets
+    and add_node. Marker set labels are made unique across all nodes (see get_unique_markers_label), so rows are always
+    recomputed.
+    """
+
+    atlas_urls_mapping = None
+    # marker gene set id kind of the template (see BaseIdFactory.get_id_displacements)
+    id_kind = None
+    incremental = False
+
+    class_seed = ['defined_class',
+                  'Marker_set_of',
+                  'Markers',
+                  'Markers_label',
+                  'Species_abbv',
+                  'Brain_region',
+                  'Parent',
+                  'FBeta_confidence_score',
+                  'precision',
+                  'recall',
+                  'Algorithm',
+                  'Source',
+                  'Cell_label',
+                  'Labelset',
+                  'Atlas_url',
+                  'Atlas_url_label'
+                  ]
+
+    columns = class_seed + ['Reference']
+    column_types = {'Markers': LIST_TYPE,
+                    'FBeta_confidence_score': FLOAT_TYPE,
+                    'precision': FLOAT_TYPE,
+                    'recall': FLOAT_TYPE}
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.atlas_payloads = context.get_atlas_payloads(self.atlas_urls_mapping)
+        self.processed_accessions = set()
+        self.marker_labels = dict()
+
+    def get_marker_id_factory(self, node):
+        if node['cell_set_accession'] in self.context.cl_subset:
+            return self.context.clm_id_factory, CLM_BASE
+        return self.context.pcl_id_factory, PCL_BASE
+
+    def get_marker_gene_set_class(self, node, accession):
+        """
+        Returns the marker gene set class of the accession: a CLM class for the nodes of the CL subset, a PCL class
+        otherwise.
+        """
+        id_factory, id_base = self.get_marker_id_factory(node)
+        return id_base + self.context.get_id(id_factory, self.id_kind, accession)
+
+    def get_unique_markers_label(self, markers_label):
+        """
+        Avoids marker set label conflicts by appending a number to the repeating labels.
+        """
+        if markers_label not in self.marker_labels:
+            self.marker_labels[markers_label] = 1
+        else:
+            self.marker_labels[markers_label] += 1
+            markers_label = markers_label + " " + str(self.marker_labels[markers_label])
+        return markers_label
+
+    def add_row(self, d):
+        if d['defined_class'] in self.atlas_payloads:
+            d["Atlas_url"] = ABC_ATLAS_URL + self.atlas_payloads.get(d['defined_class'])
+            d["Atlas_url_label"] = "markers in reference data on Allen Brain Cell Atlas"
+
+        for k in self.class_seed:
+            if not (k in d.keys()):
+                d[k] = ''
+        self.write_row(d)
+
+
+class AuthorMarkerSetTemplateBuilder(MarkerSetTemplateBuilder):
+    """
+    Marker gene set template of the author markers ('{labelset}.markers.combo' author annotation field).
+    """
+
+    file_suffix = "_marker_set.tsv"
+    owl_components = ("{}_marker_set.owl",)
+    atlas_urls_mapping = ABC_URLS_MARKER_SET_MAPPING
+    id_kind = "marker_gene_set"
+
+    # author annotation field of the marker combo, suffixed to the labelset name
+    markers_field = ".markers.combo"
+    source = "Yao"
+    # shared input loader of the marker evaluation scores, the same as the one of the class base template
+    markers_loader = staticmethod(read_author_markers_dataframe)
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.author_markers = load_shared_input(self.markers_loader)
+
+    def add_node(self, o, node, collapsed):
+        if node.get('cell_set_accession') and node['cell_set_accession'] not in self.processed_accessions:
+            markers_field = node['labelset'] + self.markers_field
+            if ("author_annotation_fields" in node and node["author_annotation_fields"] and
+                    node["author_annotation_fields"].get(markers_field, "") and
+                    str(node["author_annotation_fields"].get(markers_field, "")).lower() != "none"):
+                taxonomy_config = self.context.taxonomy_config
+                d = dict()
+                d['defined_class'] = self.get_marker_gene_set_class(node, node['cell_set_accession'])
+                cell_set_label = self.context.all_pref_labels[node["cell_set_accession"]]
+                d['Marker_set_of'] = cell_set_label
+                markers_str = node["author_annotation_fields"].get(markers_field, "")
+                markers_list = [marker.strip() for marker in markers_str.split(",")]
+                d['Markers'] = "|".join([get_gene_id(self.context.gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
+                d['Markers_label'] = self.get_unique_markers_label(node["author_annotation_fields"].get(markers_field, ""))
+                if 'Species_abbv' in taxonomy_config:
+                    d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
+                d['Brain_region'] = taxonomy_config['Brain_region'][0]
+                d['Parent'] = "SO:0001260"  # sequence collection
+                d['FBeta_confidence_score'] = ""
+                d['Algorithm'] = ""
+                d['Source'] = self.source
+                d['Reference'] = "https://doi.org/10.1038/s41586-023-06812-z"
+                if o['cell_label'] in self.author_markers:
+                    d['FBeta_confidence_score'] = self.author_markers.f_score(o['cell_label'])
+                    d['precision'] = self.author_markers.precision(o['cell_label'])
+                    d['recall'] = self.author_markers.recall(o['cell_label'])
+                d['Cell_label'] = o['cell_label']
+                d['Labelset'] = o['labelset']
+                self.add_row(d)
+                self.processed_accessions.add(node['cell_set_accession'])
+
+
+def generate_marker_gene_set_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(AuthorMarkerSetTemplateBuilder(context), output_filepath)])
+
+
+class WithinSubclassMarkerSetTemplateBuilder(AuthorMarkerSetTemplateBuilder):
+    """
+    Marker gene set template of the author within subclass markers ('{labelset}.markers.combo _within subclass_'
+    author annotation field).
+    """
+
+    file_suffix = "_within_subclass_marker_set.tsv"
+    owl_components = ("{}_within_subclass_marker_set.owl",)
+    atlas_urls_mapping = ABC_URLS_WS_MAPPING
+    id_kind = "ws_marker_gene_set"
+
+    markers_field = ".markers.combo _within subclass_"
+    source = "Yao - within subclass"
+    markers_loader = staticmethod(read_author_local_markers_dataframe)
+
+
+def generate_within_subclass_marker_gene_set_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(WithinSubclassMarkerSetTemplateBuilder(context), output_filepath)])
+
+
+class EvidenceMarkerSetTemplateBuilder(MarkerSetTemplateBuilder):
+    """
+    Marker gene set template of the CAS 'marker_gene_evidence' of the nodes.
+    """
+
+    file_suffix = "_evidence_marker_set.tsv"
+    owl_components = ("{}_evidence_marker_set.owl",)
+    atlas_urls_mapping = ABC_URLS_EVIDENCE_MAPPING
+    id_kind = "evidence_marker_gene_set"
+
+    def add_node(self, o, node, collapsed):
+        if node.get('cell_set_accession') and node['cell_set_accession'] not in self.processed_accessions:
+            if "marker_gene_evidence" in node and node["marker_gene_evidence"]:
+                taxonomy_config = self.context.taxonomy_config
+                d = dict()
+                d['defined_class'] = self.get_marker_gene_set_class(node, node['cell_set_accession'])
+                cell_set_label = self.context.all_pref_labels[node["cell_set_accession"]]
+                d['Marker_set_of'] = cell_set_label
+                markers_list = [marker.strip() for marker in node["marker_gene_evidence"]]
+                d['Markers'] = "|".join([get_gene_id(self.context.gene_db, marker) for marker in markers_list if str(marker).lower() != "none"])
+                d['Markers_label'] = self.get_unique_markers_label(", ".join(markers_list))
+                if 'Species_abbv' in taxonomy_config:
+                    d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
+                d['Brain_region'] = taxonomy_config['Brain_region'][0]
+                d['Parent'] = "SO:0001260"  # sequence collection
+                d['FBeta_confidence_score'] = ""
+                d['Algorithm'] = ""
+                d['Source'] = "CAS evidence"
+                d['Reference'] = ""
+                d['precision'] = ""
+                d['recall'] = ""
+                d['Cell_label'] = o['cell_label']
+                d['Labelset'] = o['labelset']
+                self.add_row(d)
+                self.processed_accessions.add(node['cell_set_accession'])
+
+
+def generate_evidence_marker_gene_set_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(EvidenceMarkerSetTemplateBuilder(context), output_filepath)])
+
+
+class NSForestMarkerSetTemplateBuilder(MarkerSetTemplateBuilder):
+    """
+    Marker gene set template of the NS-Forest markers. Unlike the other marker sets, each node of a collapsed chain
+    has its own NS-Forest marker set.
+    """
+
+    file_suffix = "_nsforest_marker_set.tsv"
+    owl_components = ("{}_nsforest_marker_set.owl",)
+    atlas_urls_mapping = ABC_URLS_NSF_MAPPING
+    id_kind = "nsf_marker_gene_set"
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.nsforest_markers = load_shared_input(read_nsforest_markers_dataframe)
+
+    def add_node(self, o, node, collapsed):
+        if node.get('cell_set_accession'):
+            if o['cell_label'] in self.nsforest_markers:
+                taxonomy_config = self.context.taxonomy_config
+                d = dict()
+                d['defined_class'] = self.get_marker_gene_set_class(node, o['cell_set_accession'])
+                cell_set_label = self.context.all_pref_labels[node["cell_set_accession"]]
+                d['Marker_set_of'] = cell_set_label
+                markers_list = ast.literal_eval(self.nsforest_markers.get_markers(o['cell_label']))  # convert "['Vxn', 'C1ql3']" string to list
+                d['Markers'] = "|".join([get_gene_id(self.context.gene_db, marker) for marker in markers_list])
+                d['Markers_label'] = self.get_unique_markers_label(", ".join(markers_list))
+                if 'Species_abbv' in taxonomy_config:
+                    d['Species_abbv'] = taxonomy_config['Species_abbv'][0]
+                d['Brain_region'] = taxonomy_config['Brain_region'][0]
+                d['Parent'] = "SO:0001260"  # sequence collection
+                d['FBeta_confidence_score'] = self.nsforest_markers.f_score(o['cell_label'])
+                d['precision'] = self.nsforest_markers.precision(o['cell_label'])
+                d['recall'] = self.nsforest_markers.recall(o['cell_label'])
+                d['Algorithm'] = "NSforest"
+                d['Source'] = "NSforest"
+                d['Reference'] = "https://doi.org/10.1101/2020.09.23.308932"
+                d['Cell_label'] = o['cell_label']
+                d['Labelset'] = o['labelset']
+                self.add_row(d)
+
+
+def generate_nsforest_marker_gene_set_template(taxonomy_file_path, output_filepath, context=None):
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+
+    if context.taxonomy_config:
+        build_templates(context, [(NSForestMarkerSetTemplateBuilder(context), output_filepath)])
+
+
+# templates generated from the taxonomy nodes, in the order they are built by generate_all_templates. The class
+# curation template is not one of them: it is edited by the curators and the individuals template reads its exclusions
+# (see get_excluded_classes), so it is generated on its own before the others (see generate_curated_class_template).
+CLASS_TEMPLATE_BUILDERS = (BaseClassTemplateBuilder, AuthorMarkerSetTemplateBuilder,
+                           WithinSubclassMarkerSetTemplateBuilder, EvidenceMarkerSetTemplateBuilder,
+                           NSForestMarkerSetTemplateBuilder)
+
+
+def get_template_builders(context, output_dir, ind_output_filepath=None):
+    """
+    Creates the individuals, class base and marker gene set template builders of the taxonomy.
+    Templates are named after the taxonomy, e.g. 'CCN20250428_class_base.tsv'.
+    Args:
+        context: TaxonomyContext of the taxonomy
+        output_dir: Output folder of the class and marker gene set templates
+        ind_output_filepath: Path of the individuals template, defaults to '{taxon}.tsv' in the output_dir
+    Returns:
+        list: (TemplateRowBuilder, output file path) tuples
+    """
+    if not ind_output_filepath:
+        ind_output_filepath = os.path.join(output_dir, context.taxon + IndividualTemplateBuilder.file_suffix)
+
+    builders = [(IndividualTemplateBuilder(context), ind_output_filepath)]
+    if context.taxonomy_config:
+        for builder_class in CLASS_TEMPLATE_BUILDERS:
+            builders.append((builder_class(context), os.path.join(output_dir, context.taxon + builder_class.file_suffix)))
+    return builders
+
+
+def get_outdated_components(template_paths):
+    """
+    Returns the OWL components (see bgo.Makefile) that need rebuilding after the given templates were written.
+    Args:
+        template_paths: paths of the written templates
+    Returns:
+        list: OWL component file names, in build order.
+    """
+    components = []
+    # longest suffix first, the individuals template suffix is a suffix of all the others
+    builder_classes = sorted((IndividualTemplateBuilder, CuratedClassTemplateBuilder) + CLASS_TEMPLATE_BUILDERS,
+                             key=lambda builder_class: len(builder_class.file_suffix), reverse=True)
+    for template_path in template_paths:
+        file_name = os.path.basename(template_path)
+        for builder_class in builder_classes:
+            if file_name.endswith(builder_class.file_suffix):
+                taxon = file_name[:-len(builder_class.file_suffix)]
+                for component in builder_class.owl_components:
+                    if component.format(taxon) not in components:
+                        components.append(component.format(taxon))
+                break
+    if components:
+        components.append("all_templates.owl")
+    return components
+
+
+def generate_all_templates(taxonomy_file_path, output_dir, context=None, ind_output_filepath=None, incremental=False,
+                           sidecar_format=None):
+    """
+    Generates the individuals, class base and all marker gene set templates of the taxonomy with a single walk over the
+    taxonomy nodes. The individuals template reads the class exclusions of the existing class curation template.
+    Args:
+        taxonomy_file_path: Path of the CAS taxonomy file
+        output_dir: Output folder of the class and marker gene set templates
+        context: optional TaxonomyContext to reuse
+        ind_output_filepath: Path of the individuals template, defaults to '{taxon}.tsv' in the output_dir
+        incremental: only recompute the rows of the changed nodes and only write the changed templates (see
+        build_templates)
+        sidecar_format: optionally also write 'parquet' or 'arrow' sidecars of the templates (see template_sidecar)
+    Returns:
+        list: paths of the written templates.
+    """
+    if context is None:
+        context = TaxonomyContext(taxonomy_file_path)
+    builders = get_template_builders(context, output_dir, ind_output_filepath)
+    return build_templates(context, builders, incremental, sidecar_format)
+
+
+# (context, builder, output file path, incremental, sidecar format) tasks of the template workers, inherited from the
+# parent process by fork
+template_tasks = []
+
+
+def run_template_task(task_index):
+    context, builder, output_filepath, incremental, sidecar_format = template_tasks[task_index]
+    return build_templates(context, [(builder, output_filepath)], incremental, sidecar_format)
+
+
+def generate_templates_parallel(taxonomy_file_paths, output_dir, workers=1, ind_output_dir=None, use_cache=True,
+                                incremental=False, sidecar_format=None):
+    """
+    Generates all templates (see generate_all_templates) of the given taxonomies. The (taxonomy x template) tasks are
+    distributed over a pool of forked worker processes. Taxonomies and the shared inputs are loaded once in the parent
+    process before forking and inherited by the workers. Runs in process if a single worker is requested or fork is
+    not supported by the platform.
+    Args:
+        taxonomy_file_paths: Paths of the CAS taxonomy files
+        output_dir: Output folder of the class and marker gene set templates
+        workers: Number of worker processes
+        ind_output_dir: Output folder of the individuals templates, defaults to the output_dir
+        use_cache: Use the parsed taxonomy snapshot cache (see TaxonomyContext.from_snapshot)
+        incremental: only recompute the rows of the changed nodes and only write the changed templates (see
+        build_templates)
+        sidecar_format: optionally also write 'parquet' or 'arrow' sidecars of the templates (see template_sidecar)
+    Returns:
+        list: paths of the written templates.
     """
-    # ns_forest_marker_class_df = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/NSForest_global_class_results.csv'))
-    # ns_forest_marker_subclass_df = pd.read_csv(
-    #     os.path.join(os.path.dirname(os.path.realpath(__file__)),
-    #                  '../dendrograms/supplementary/version2/NSForest_global_subclass_comb_results.csv'))
-    # nsforest_markers = pd.merge(ns_forest_marker_class_df, ns_forest_marker_subclass_df,
-    #                             how='outer')
-    nsforest_markers = pd.DataFrame(columns=["clusterName"])
-    return nsforest_markers
+    global template_tasks
+    parallel = workers > 1 and "fork" in multiprocessing.get_all_start_methods()
+    tasks = []
+    output_filepaths = []
+    for taxonomy_file_path in taxonomy_file_paths:
+        if use_cache:
+            context = TaxonomyContext.from_snapshot(taxonomy_file_path)
+        else:
+            context = TaxonomyContext(taxonomy_file_path)
+        ind_output_filepath = None
+        if ind_output_dir:
+            ind_output_filepath = os.path.join(ind_output_dir, context.taxon + IndividualTemplateBuilder.file_suffix)
+        # builders load the shared inputs on creation
+        builders = get_template_builders(context, output_dir, ind_output_filepath)
+        if parallel:
+            context.preload()
+            tasks.extend((context, builder, output_filepath, incremental, sidecar_format)
+                         for builder, output_filepath in builders)
+        else:
+            output_filepaths.extend(build_templates(context, builders, incremental, sidecar_format))
+
+    if tasks:
+        template_tasks = tasks
+        try:
+            with multiprocessing.get_context("fork").Pool(min(workers, len(tasks))) as pool:
+                for written in pool.map(run_template_task, range(len(tasks)), chunksize=1):
+                    output_filepaths.extend(written)
+        finally:
+            template_tasks = []
+    return output_filepaths
 
 
 def index_base_files(base_files):
@@ -1132,76 +1763,113 @@ def get_centralized_taxonomy_folder(taxonomy_config):
            + "_" + taxonomy_config["Taxonomy_id"]
 
 def get_gene_id(gene_db, gene_name):
-    gene_name = gene_name.strip()
-    gene_id = None
-    if str(gene_name) in gene_db:
-        gene_id = gene_db[str(gene_name)]
-    else:
-        # gene_db may have styling issues, so workaround
-        for gene in gene_db:
-            if gene_name.lower() in gene.lower():
-                gene_id = gene_db[gene]
-    if gene_id:
-        if gene_id.startswith("ensembl:"):
-            print("Using Ensembl gene ID for gene: {}".format(gene_name))
-        return gene_id
+    """
+    Returns the ID of the gene, see GeneIndex.lookup for the matching rules.
+    Args:
+        gene_db: GeneIndex or dictionary of gene names to gene IDs
+        gene_name: gene name
+    Returns:
+        gene ID
+    """
+    match = as_gene_index(gene_db).lookup(gene_name)
+    if match:
+        if match.id.startswith("ensembl:"):
+            print("Using Ensembl gene ID for gene: {}".format(gene_name.strip()))
+        return match.id
     else:
-        raise Exception(f"Gene ID not found for gene: {gene_name}")
+        raise Exception(f"Gene ID not found for gene: {gene_name.strip()}")
 
 def get_aba_symbols_map():
-    obo_in_owl = Namespace("http://www.geneontology.org/formats/oboInOwl#")
-    g = get_aba_ontology()
-
-    synonyms = {}
-    for s, p, o in g:
-        if str(s).startswith("https://purl.brain-bican.org/ontology/dhbao/DHBA_") and p == obo_in_owl.hasExactSynonym:
-            synonyms[str(o).strip()] = "DHBA:" + str(s).split("_")[-1]
-
-    return synonyms
+    """
+    Returns the dict of DHBA region symbols (exact synonyms) - ids.
+    """
+    return get_dhba_index().synonyms
 
 def get_mba_labels_map():
-    g = get_aba_ontology()
-
-    labels = {}
-    for s, p, o in g:
-        if str(s).startswith("https://purl.brain-bican.org/ontology/dhbao/DHBA_") and p == RDFS.label:
-            labels["DHBA:" + str(s).split("_")[-1]] = str(o).strip().lower()
-
-    return labels
+    """
+    Returns the dict of DHBA ids - lower case labels.
+    """
+    return get_dhba_index().labels
 
-aba_ontology = None
+def get_dhba_index():
+    """
+    Returns the pre-indexed DHBA ontology (see dhba_index.read_dhba_index), built by 'make dhba_index' in the
+    dendrograms folder.
+    """
+    return load_shared_input(read_dhba_index)
 
-def get_aba_ontology():
-    global aba_ontology
-    if not aba_ontology:
-        import ssl
-        ssl._create_default_https_context = ssl._create_unverified_context
+def get_gene_db_files(folder_path: str):
+    """
+    Returns the gene TSV files of the templates folder, ignoring the taxonomy templates.
+    """
+    return [os.path.join(folder_path, file_name) for file_name in sorted(os.listdir(folder_path))
+            if file_name.endswith('.tsv') and not file_name.startswith("CS") and not file_name.startswith("CCN")]
 
-        aba_ontology = Graph()
-        aba_ontology.parse('https://purl.brain-bican.org/ontology/dhbao/dhbao.owl', format="xml")
-    return aba_ontology
 
-def read_gene_dbs(folder_path: str):
+def read_gene_dbs(folder_path: str, synonyms=None):
     """
     Reads all TSV files in the templates folder and creates a dictionary of genes
-    where the key is the NAME column and the value is the ID column.
+    where the key is the NAME column and the value is the ID column. If a gene NAME has IDs from several
+    gene databases, the ID is selected according to the GENE_ID_PRECEDENCE.
     Args:
         folder_path: Path to the folder containing gene TSV files.
+        synonyms: optional dictionary to collect the gene synonyms (SYNONYMS column) to gene NAME mappings.
     Returns:
         dict: Dictionary with gene NAME as keys and ID as values.
 
     """
-    gene_dict = {}
-
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith('.tsv') and not file_name.startswith("CS") and not file_name.startswith("CCN"):
-            file_path = os.path.join(folder_path, file_name)
-            df = pd.read_csv(file_path, sep='\t')
-            for _, row in df.iterrows():
-                if pd.notna(row['ID']):
-                    gene_dict[row['NAME'].replace("(Mmus)", "").strip()] = row['ID']
+    gene_dfs = []
+    for file_path in get_gene_db_files(folder_path):
+        df = pd.read_csv(file_path, sep='\t', dtype=str)
+        # skip the ROBOT template row and the genes without ID
+        gene_dfs.append(df[df['ID'].notna() & (df['ID'] != 'ID')])
+    if not gene_dfs:
+        return dict()
+    genes = pd.concat(gene_dfs, ignore_index=True)
+    genes['NAME'] = genes['NAME'].str.replace("(Mmus)", "", regex=False).str.strip()
+    if synonyms is not None and 'SYNONYMS' in genes:
+        # synonyms of all gene databases, not only of the preferred one
+        gene_synonyms = genes[['NAME', 'SYNONYMS']].dropna()
+        gene_synonyms = gene_synonyms.assign(SYNONYMS=gene_synonyms['SYNONYMS'].str.split("|")).explode('SYNONYMS')
+        gene_synonyms['SYNONYMS'] = gene_synonyms['SYNONYMS'].str.strip()
+        gene_synonyms = gene_synonyms[gene_synonyms['SYNONYMS'] != ""]
+        for synonym, gene_name in zip(gene_synonyms['SYNONYMS'], gene_synonyms['NAME']):
+            synonyms.setdefault(synonym, gene_name)
+
+    prefixes = genes['ID'].str.split(":", n=1).str[0]
+    genes['precedence'] = prefixes.map({prefix: i for i, prefix in enumerate(GENE_ID_PRECEDENCE)}).fillna(
+        len(GENE_ID_PRECEDENCE))
+    # lowest precedence first, so that the last row of a name is its preferred ID (the later row wins among equals)
+    genes = genes.sort_values('precedence', ascending=False, kind='stable')
+    genes = genes.drop_duplicates(subset='NAME', keep='last')
+    return dict(zip(genes['NAME'], genes['ID']))
+
+
+def read_gene_index(folder_path: str, cache_dir=SNAPSHOT_CACHE_DIR):
+    """
+    Reads the gene TSV files of the templates folder (see read_gene_dbs) into a GeneIndex. The index is cached in a
+    sidecar file keyed on the content hash of the gene TSV files and reused until they change.
+    Args:
+        folder_path: Path to the folder containing gene TSV files.
+        cache_dir: Gene index cache directory
+    Returns:
+        GeneIndex: gene index with the gene synonyms as aliases.
+    """
+    cache_key = get_content_hash(get_gene_db_files(folder_path), GENE_INDEX_VERSION)
+    cache_path = os.path.join(cache_dir, "gene_index_{}.pickle".format(cache_key))
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            log.warning("Ignoring unreadable gene index cache {}: {}".format(cache_path, e))
+
+    synonyms = dict()
+    genes = read_gene_dbs(folder_path, synonyms)
+    gene_index = GeneIndex(genes, synonyms)
+    save_cache_file(gene_index, cache_path, "gene_index_*.pickle")
+    return gene_index
 
-    return gene_dict
 
 def find_duplicate_cell_labels(nodes):
     seen_labels = set()
@@ -3,14 +3,14 @@ import os
 import csv
 import networkx as nx
 import json
-import copy
 import re
+from collections import deque
+from collections.abc import Mapping, MutableMapping
 
 from pandas.core.common import all_none
 
-import pcl_id_factory
-
 from dendrogram_tools import tree_recurse
+from taxonomy_tree import as_taxonomy_tree
 
 
 TAXONOMY_DETAILS_YAML = os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -19,6 +19,7 @@ TAXONOMY_DETAILS_YAML = os.path.join(os.path.dirname(os.path.realpath(__file__))
 EXPRESSIONS = "expressions"
 OR_SEPARATOR = '|'
 PAIR_SEPARATOR = ' ; '
+GROSS_CELL_TYPE_DEFAULT = 'CL:0000000'
 
 
 def get_synonyms_from_taxonomy(node):
@@ -120,8 +121,8 @@ def read_dendrogram_tree(dend_json_path):
     tree_recurse(j, out)
 
     tree = nx.DiGraph()
-    for edge in out['edges']:
-        tree.add_edge(edge[1], edge[0])
+    for child, parent in out['parents'].items():
+        tree.add_edge(parent, child)
 
     return tree
 
@@ -136,9 +137,10 @@ def generate_dendrogram_tree(dendrogram_data):
 
     """
     tree = nx.DiGraph()
-    for edge in dendrogram_data['edges']:
-        if edge[1] and edge[0]:
-            tree.add_edge(edge[1], edge[0])
+    for parent, children in dendrogram_data['children'].items():
+        for child in children:
+            if child:
+                tree.add_edge(parent, child)
 
     return tree
 
@@ -167,15 +169,16 @@ def get_subtrees(dend_tree, taxonomy_config):
     """
     For each root node in the taxonomy creates the list of subtree nodes
     Args:
-        dend_tree: dendrogram networkx representation
+        dend_tree: TaxonomyTree or dendrogram networkx representation
         taxonomy_config: taxonomy configuration
 
     Returns: list of subtree nodes
 
     """
+    dend_tree = as_taxonomy_tree(dend_tree)
     subtrees = []
     for root_node in taxonomy_config['Root_nodes']:
-        descendants = nx.descendants(dend_tree, root_node['Node'])
+        descendants = set(dend_tree.descendants(root_node['Node']))
         # subtrees exclude root node itself, if not root and leaf at the same time
         if len(descendants) == 0:
             descendants.add(root_node['Node'])
@@ -242,7 +245,7 @@ def read_csv(csv_path, id_column=0, delimiter=",", id_to_lower=False):
     return records
 
 
-def read_tsv_to_dict(tsv_path, id_column=0, use_accession_ids=False):
+def read_tsv_to_dict(tsv_path, id_column=0, use_accession_ids=False, id_factories=()):
     """
     Reads tsv file content into a dict. Key is the first column value and the value is dict representation of the
     row values (each header is a key and column value is the value).
@@ -250,15 +253,17 @@ def read_tsv_to_dict(tsv_path, id_column=0, use_accession_ids=False):
         tsv_path: Path of the TSV file
         id_column: Id column becomes the key of the dict. This column should be unique. Default value is first column.
         use_accession_ids: If 'True' converts key of the table to cell set accession id.
+        id_factories: id factories (such as PCLIdFactory) of the taxonomy, used to convert keys to accession ids.
     Returns:
         Function provides two return values: first; headers of the table and second; the TSV content dict. Key of the
         content is the first column value and the values are dict of row values.
     """
-    return read_csv_to_dict(tsv_path, id_column=id_column, delimiter="\t", use_accession_ids=use_accession_ids)
+    return read_csv_to_dict(tsv_path, id_column=id_column, delimiter="\t", use_accession_ids=use_accession_ids,
+                            id_factories=id_factories)
 
 
 def read_csv_to_dict(csv_path, id_column=0, id_column_name="", delimiter=",", id_to_lower=False, use_accession_ids=False
-                     , generated_ids=False):
+                     , generated_ids=False, id_factories=()):
     """
     Reads tsv file content into a dict. Key is the first column value and the value is dict representation of the
     row values (each header is a key and column value is the value).
@@ -268,13 +273,17 @@ def read_csv_to_dict(csv_path, id_column=0, id_column_name="", delimiter=",", id
         id_column_name: Alternative to the numeric id_column, id_column_name specifies id_column by its header string.
         delimiter: Value delimiter. Default is comma.
         id_to_lower: applies string lowercase operation to the key
-        use_accession_ids: If 'True' converts key of the table to cell set accession id.
+        use_accession_ids: If 'True' converts key of the table to cell set accession id. Keys that are not ids of the
+        id_factories are kept as they are.
         generated_ids: If 'True', uses row number as the key of the dict. Initial key is 0.
+        id_factories: id factories (such as PCLIdFactory) of the taxonomy, required by use_accession_ids.
 
     Returns:
         Function provides two return values: first; headers of the table and second; the CSV content dict. Key of the
         content is the first column value and the values are dict of row values.
     """
+    if use_accession_ids and not id_factories:
+        raise ValueError("use_accession_ids requires the id factories of the taxonomy")
     records = dict()
 
     headers = []
@@ -285,8 +294,6 @@ def read_csv_to_dict(csv_path, id_column=0, id_column_name="", delimiter=",", id
             _id = row[id_column]
             if id_to_lower:
                 _id = str(_id).lower()
-            if use_accession_ids and pcl_id_factory.is_pcl_id(_id):
-                _id = pcl_id_factory.get_reverse_id(_id)
             if generated_ids:
                 _id = row_count
 
@@ -302,6 +309,9 @@ def read_csv_to_dict(csv_path, id_column=0, id_column_name="", delimiter=",", id
 
             row_count += 1
 
+    if use_accession_ids and not generated_ids:
+        for id_factory in id_factories:
+            records = id_factory.rekey_records(records)
     return headers, records
 
 
@@ -379,8 +389,44 @@ def read_markers(marker_path, gene_names):
 #             matched_subtree_size = len(subtree)
 #     return gross_cell_type
 
-def get_gross_cell_type(_id, nodes):
-    gross_cell_type = 'CL:0000000'
+def resolve_all_gross_cell_types(dend):
+    """
+    Resolves the gross cell type (nearest 'cell_ontology_term_id' of the node or its ancestors) of all dendrogram
+    nodes in a single top-down pass.
+    Args:
+        dend: Dendrogram data with 'nodes' and 'children' indexes (see dendrogram_tools.tree_recurse)
+
+    Returns: dictionary of cell_set_accession to gross cell type
+    """
+    nodes = dict()
+    for node in dend['nodes']:
+        nodes.setdefault(node['cell_set_accession'], node)
+
+    gross_cell_types = dict()
+    stack = [(accession, GROSS_CELL_TYPE_DEFAULT) for accession, node in nodes.items()
+             if not node.get('parent_cell_set_accession') or node['parent_cell_set_accession'] not in nodes]
+    while stack:
+        accession, parent_cell_type = stack.pop()
+        cell_type = nodes[accession].get('cell_ontology_term_id') or parent_cell_type
+        gross_cell_types[accession] = cell_type
+        for child in dend['children'].get(accession, []):
+            stack.append((child, cell_type))
+    return gross_cell_types
+
+
+def get_gross_cell_type(_id, nodes, gross_cell_types=None):
+    """
+    Returns the nearest 'cell_ontology_term_id' of the node or its ancestors.
+    Args:
+        _id: cell_set_accession of the node
+        nodes: Dendrogram nodes
+        gross_cell_types: Optional gross cell types cache built by resolve_all_gross_cell_types
+
+    Returns: gross cell type of the node, 'CL:0000000' if not resolved
+    """
+    if gross_cell_types is not None:
+        return gross_cell_types.get(_id, GROSS_CELL_TYPE_DEFAULT)
+    gross_cell_type = GROSS_CELL_TYPE_DEFAULT
     for node in nodes:
         if _id == node['cell_set_accession']:
             if 'cell_ontology_term_id' in node and node['cell_ontology_term_id']:
@@ -428,7 +474,8 @@ def merge_tables(base_tsv, extension_tsv, output_filepath):
                 writer.writerow(row)
 
 
-def migrate_manual_curations(source_tsv, target_tsv, migrate_columns, output_filepath, use_accession_ids=False):
+def migrate_manual_curations(source_tsv, target_tsv, migrate_columns, output_filepath, use_accession_ids=False,
+                             id_factories=()):
     """
     Copies manual curations (for the specified columns) from source file to the target file and generates a
     new migration file.
@@ -439,9 +486,11 @@ def migrate_manual_curations(source_tsv, target_tsv, migrate_columns, output_fil
         output_filepath: Output file path
         use_accession_ids: If 'True' converts keys of the tables to accession id. Useful when one tables has pcl id, while other
         has cell cet accession id.
+        id_factories: id factories (such as PCLIdFactory) of the taxonomy, required by use_accession_ids.
     """
-    base_headers, base = read_tsv_to_dict(source_tsv, use_accession_ids=use_accession_ids)
-    target_headers, target = read_tsv_to_dict(target_tsv, use_accession_ids=use_accession_ids)
+    base_headers, base = read_tsv_to_dict(source_tsv, use_accession_ids=use_accession_ids, id_factories=id_factories)
+    target_headers, target = read_tsv_to_dict(target_tsv, use_accession_ids=use_accession_ids,
+                                              id_factories=id_factories)
 
     with open(output_filepath, mode='w') as out:
         writer = csv.writer(out, delimiter="\t", quotechar='"')
@@ -501,34 +550,27 @@ def extract_taxonomy_name_from_path(taxonomy_file_path):
 def find_singleton_chains(treex):
     """
     Finds the node chains composed of linked nodes who has only one child in the given networkx tree (DiGraph).
+    Chains are collected through a single depth-first traversal starting from the roots, so each node is visited once.
     Args:
-        treex: networkx directed graph that represents the taxonomy
+        treex: TaxonomyTree or networkx directed graph that represents the taxonomy
     """
-    def _follow_chain(start):
-        chain = [start]
-        while treex.out_degree(chain[-1]) == 1:
-            next_node = next(iter(treex.successors(chain[-1])))
-            chain.append(next_node)
-        return chain
-
+    treex = as_taxonomy_tree(treex)
     chains = []
-
-    # pick roots
-    roots = [n for n in treex.nodes if treex.in_degree(n) == 0]
-    # pick all branch starts: nodes whose parent has multiple children
-    branch_starts = [
-        node for node in treex.nodes
-        if any(treex.out_degree(pred) > 1 for pred in treex.predecessors(node))
-    ]
-
-    search_roots = roots + branch_starts
-    for root in search_roots:
-        chain = _follow_chain(root)
+    stack = list(reversed(treex.roots))
+    while stack:
+        # chain starts are roots and nodes whose parent has multiple children
+        chain = [stack.pop()]
+        children = treex.children(chain[-1])
+        while len(children) == 1:
+            chain.append(children[0])
+            children = treex.children(chain[-1])
         if len(chain) > 1:
             chains.append(chain)
+        stack.extend(reversed(children))
 
     return chains
 
+
 def get_collapsed_nodes(dend_tree, all_nodes):
     """
     The WMB taxonomy has many cases where there are multiple terms referring to the same set of
@@ -537,18 +579,16 @@ def get_collapsed_nodes(dend_tree, all_nodes):
 
     Requirement: https://github.com/Cellular-Semantics/whole_mouse_brain_ontology/issues/46
     Args:
-        dend_tree: networkx DiGraph representing the taxonomy
+        dend_tree: TaxonomyTree or networkx DiGraph representing the taxonomy
         all_nodes: list of all nodes in the dendrogram
 
     Returns: dictionary of nodes to be collapsed into a single node. Value is the node to be
-    collapsed into which is the deep merged node of the chain.
+    collapsed into which is the merged node (ChainNode) of the chain.
     """
     collapse_dict = {}
     chains = find_singleton_chains(dend_tree)
     for chain in chains:
-        merged_node = copy.deepcopy(all_nodes[chain[-1]])
-        for node_index in reversed(chain[:-1]):
-            merged_node = deep_merge_dicts(merged_node, all_nodes[node_index])
+        merged_node = ChainNode([all_nodes[node_id] for node_id in reversed(chain)])
         # use the cell_label and label set of the highest node in the chain
         merged_node['taxonomy_cell_label'] = merged_node['cell_label']
         merged_node['cell_label'] = all_nodes[chain[0]]['cell_label']
@@ -557,9 +597,93 @@ def get_collapsed_nodes(dend_tree, all_nodes):
         for node_to_collapse in chain:
             collapse_dict[node_to_collapse] = merged_node
 
-
     return collapse_dict
 
+
+def _is_empty_value(value):
+    return value in ["", None, "None"]
+
+
+class ChainNode(MutableMapping):
+    """
+    Copy-free merged view of the nodes of a singleton chain. Layers are ordered from the deepest node to the top of
+    the chain and values are resolved with the deep_merge_dicts semantics: the deepest non-empty value wins, nested
+    mappings are merged the same way. Assignments are kept in the view and never modify the underlying nodes.
+    """
+    __slots__ = ('_layers', '_overrides', '_deleted')
+
+    def __init__(self, layers):
+        self._layers = tuple(layers)
+        self._overrides = dict()
+        self._deleted = set()
+
+    def _resolve(self, key):
+        found = False
+        value = None
+        nested = None
+        for layer in self._layers:
+            if key not in layer:
+                continue
+            layer_value = layer[key]
+            if not found:
+                found = True
+                value = layer_value
+            elif nested is not None:
+                if isinstance(layer_value, Mapping):
+                    nested.append(layer_value)
+                continue
+            elif _is_empty_value(value):
+                value = layer_value
+            else:
+                continue
+            nested = [layer_value] if isinstance(layer_value, Mapping) else None
+        if not found:
+            raise KeyError(key)
+        if nested and len(nested) > 1:
+            return ChainNode(nested)
+        return value
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._resolve(key)
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        self._overrides[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._overrides.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._overrides:
+            return True
+        return key not in self._deleted and any(key in layer for layer in self._layers)
+
+    def __iter__(self):
+        seen = set()
+        for layer in self._layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    if key not in self._deleted or key in self._overrides:
+                        yield key
+        for key in self._overrides:
+            if key not in seen:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 def deep_merge_dicts(base, updates):
     """
     Merges two dictionaries deeply. If a key exists in both dictionaries, the value in the updates dictionary is used.
@@ -570,7 +694,9 @@ def deep_merge_dicts(base, updates):
     Returns: merged dictionary
     """
     for key, value in updates.items():
-        if isinstance(value, dict) and key in base and isinstance(base[key], dict):
+        if isinstance(value, Mapping) and key in base and isinstance(base[key], Mapping):
+            if not isinstance(base[key], MutableMapping):
+                base[key] = dict(base[key])
             deep_merge_dicts(base[key], value)
         else:
             if key in base:
@@ -609,13 +735,57 @@ def read_one_concept_one_name_tsv(file_path):
     return records
 
 
+class LabelSuffixIndex:
+    """
+    Reversed string trie of cell labels. Counts the labels ending with a given suffix in O(len(suffix)) and supports
+    adding labels as they are generated. Each trie node is a dict of the next (preceding) characters to the child
+    nodes, the number of labels passing through the node is kept under the '' key.
+    """
+
+    def __init__(self, labels=()):
+        """
+        Args:
+            labels: labels to index
+        """
+        self._root = {"": 0}
+        for label in labels:
+            self.add(label)
+
+    def add(self, label):
+        """
+        Adds a label to the index. Labels added multiple times are counted multiple times.
+        """
+        trie_node = self._root
+        trie_node[""] += 1
+        for char in reversed(label):
+            child = trie_node.get(char)
+            if child is None:
+                child = trie_node[char] = {"": 0}
+            child[""] += 1
+            trie_node = child
+
+    def count_suffix(self, suffix):
+        """
+        Returns the number of labels that end with the given suffix.
+        """
+        trie_node = self._root
+        for char in reversed(suffix):
+            trie_node = trie_node.get(char)
+            if trie_node is None:
+                return 0
+        return trie_node[""]
+
+    def __len__(self):
+        return self._root[""]
+
+
 def format_cell_label(cell_label, node, all_labels, generated_labels, is_collapsed=False, fail_on_duplicate=True):
     """
     Formats the cell labels to remove the heading numbers and making label unique by applying markers
     Args:
         cell_label: current name to format
         node: all cell set data
-        all_labels: all cell set names in the taxonomy
+        all_labels: all cell set names in the taxonomy, preferably as a LabelSuffixIndex when formatting many labels
         generated_labels: all labels added to ontology
         is_collapsed: if the cell set is part of a compressed chain
         fail_on_duplicate: if True, raises an error if a unique name can't be found
@@ -628,7 +798,9 @@ def format_cell_label(cell_label, node, all_labels, generated_labels, is_collaps
         formatted_name = m.group(2).strip()
     else:
         formatted_name = cell_label.strip()
-    will_be_unique =  len([cell_label for cell_label in all_labels if cell_label.endswith(formatted_name)]) <= 1
+    if not isinstance(all_labels, LabelSuffixIndex):
+        all_labels = LabelSuffixIndex(all_labels)
+    will_be_unique = all_labels.count_suffix(formatted_name) <= 1
     # print(node["cell_set_accession"] + "   " + str(node.get("marker_gene_evidence", "")))
     # print("is_collapsed: " + str(is_collapsed) + "   will_be_unique: " + str(will_be_unique) + "   formatted_name: " + formatted_name)
     if not is_collapsed and str(node["labelset"]).lower() == "group" and not will_be_unique:
@@ -637,7 +809,8 @@ def format_cell_label(cell_label, node, all_labels, generated_labels, is_collaps
         #                      "supertype.markers.combo _within subclass_", "supertype.markers.combo"]
         marker_properties = ["curated_markers"]
         unified_markers = []
-        author_annotations = node["author_annotation_fields"]
+        # copy, taxonomy nodes are shared between the template generators and should not be modified
+        author_annotations = dict(node["author_annotation_fields"])
         if "curated_markers" not in author_annotations and "marker_gene_evidence" in node:
             author_annotations["curated_markers"] = ",".join(node.get("marker_gene_evidence"))
         for marker_property in marker_properties:
@@ -658,24 +831,54 @@ def format_cell_label(cell_label, node, all_labels, generated_labels, is_collaps
     return formatted_name
 
 
-def get_class_membership_dict(dend_tree):
+def get_hierarchy_table(dend_tree, all_nodes=None, labelset_ranks=None):
+    """
+    Labels all nodes of the dendrogram tree with their root, depth and labelset rank through a single top-down
+    traversal from each root.
+    Args:
+        dend_tree: networkx directed graph that represents the taxonomy
+        all_nodes: Optional dictionary of cell_set_accession to dendrogram node, used to resolve the labelset rank
+        labelset_ranks: Optional dictionary of labelset name to labelset rank
+
+    Returns: dictionary of node to {"root": root node, "depth": distance from the root, "rank": labelset rank or None}
+    """
+    if all_nodes is None:
+        all_nodes = dict()
+    if labelset_ranks is None:
+        labelset_ranks = dict()
+
+    def _rank(node):
+        labelset = all_nodes[node].get("labelset") if node in all_nodes else None
+        return labelset_ranks.get(labelset)
+
+    hierarchy = dict()
+    # a node whose only parent is the '' placeholder is a root as well
+    roots = [node for node in dend_tree.nodes()
+             if dend_tree.in_degree(node) == 0 or list(dend_tree.predecessors(node)) == [""]]
+    for root in roots:
+        hierarchy[root] = {"root": root, "depth": 0, "rank": _rank(root)}
+    for root in roots:
+        queue = deque([root])
+        while queue:
+            current = queue.popleft()
+            current_record = hierarchy[current]
+            for child in dend_tree.successors(current):
+                if child not in hierarchy:
+                    hierarchy[child] = {"root": current_record["root"], "depth": current_record["depth"] + 1,
+                                        "rank": _rank(child)}
+                    queue.append(child)
+    return hierarchy
+
+
+def get_class_membership_dict(dend_tree, hierarchy=None):
     """
     Returns a dictionary of class membership for each node in the dendrogram tree.
     Args:
         dend_tree: networkx directed graph that represents the taxonomy
+        hierarchy: Optional hierarchy table of the tree built by get_hierarchy_table
 
     Returns: dictionary of class membership for each node in the dendrogram tree
     """
-    membership = {}
-    for node in dend_tree.nodes():
-        current = node
-        # Traverse up the tree until a node with no predecessors is found
-        while True:
-            predecessors = list(dend_tree.predecessors(current))
-            if not predecessors or (len(predecessors) == 1 and predecessors[0] == ""):
-                root = current
-                break
-            # If multiple, choose the first predecessor arbitrarily
-            current = predecessors[0]
-        membership[node] = root
-    return membership
+    if hierarchy is None:
+        hierarchy = get_hierarchy_table(dend_tree)
+    return {node: hierarchy[node]["root"] for node in dend_tree.nodes()}
@@ -0,0 +1,142 @@
+"""
+Template manifests for the incremental template generation. The manifest of a template is written next to it and
+records, for each taxonomy node in walk order, the fingerprint of the node inputs and the template rows generated from
+the node. When the template is regenerated, rows of the nodes with an unchanged fingerprint are taken from the
+manifest instead of being recomputed.
+
+Manifests are JSON lines files: a header line with the manifest version and the keys of the inputs shared by all rows,
+followed by an [accession, fingerprint, rows] line per node. Since a manifest is only reused for the same taxonomy
+structure (same nodes in the same order), it is read sequentially, in lockstep with the taxonomy walk.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections.abc import Mapping
+
+log = logging.getLogger(__name__)
+
+# increment when the content or the structure of the manifests changes
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(template_path):
+    """
+    Returns the path of the manifest of the given template.
+    """
+    return os.path.splitext(template_path)[0] + ".manifest.jsonl"
+
+
+def _json_default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def get_fingerprint(*inputs):
+    """
+    Returns a stable hash of the given json like inputs. Mappings (such as taxonomy nodes) are hashed by content.
+    Args:
+        *inputs: values to hash
+    Returns:
+        str: hex digest
+    """
+    text = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=_json_default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ManifestWriter:
+    """
+    Writes the manifest of a template. The manifest is written to a temporary file and only replaces the previous
+    manifest when closed.
+    """
+
+    def __init__(self, manifest_path, input_key, structure_key):
+        """
+        Args:
+            manifest_path: Path of the manifest
+            input_key: key of the inputs shared by all rows of the template
+            structure_key: key of the taxonomy structure (nodes in walk order)
+        """
+        self.manifest_path = manifest_path
+        self._file = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(manifest_path) or ".",
+                                                 suffix=".tmp", delete=False)
+        self._write_line({"version": MANIFEST_VERSION, "input_key": input_key, "structure_key": structure_key})
+
+    def _write_line(self, value):
+        self._file.write(json.dumps(value, ensure_ascii=False))
+        self._file.write("\n")
+
+    def add_rows(self, accession, fingerprint, rows):
+        """
+        Records the rows generated from a node.
+        Args:
+            accession: cell set accession of the node
+            fingerprint: fingerprint of the node inputs
+            rows: list of template rows
+        """
+        self._write_line([accession, fingerprint, rows])
+
+    def close(self):
+        self._file.close()
+        os.replace(self._file.name, self.manifest_path)
+
+    def discard(self):
+        self._file.close()
+        os.remove(self._file.name)
+
+
+class ManifestReader:
+    """
+    Reads the previous manifest of a template in walk order.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    @classmethod
+    def open(cls, manifest_path, input_key, structure_key):
+        """
+        Opens the manifest if it exists and was generated from the same shared inputs and taxonomy structure.
+        Args:
+            manifest_path: Path of the manifest
+            input_key: key of the inputs shared by all rows of the template
+            structure_key: key of the taxonomy structure (nodes in walk order)
+        Returns:
+            ManifestReader or None if there is no reusable manifest.
+        """
+        if not os.path.isfile(manifest_path):
+            return None
+        file = open(manifest_path, encoding="utf-8")
+        try:
+            header = json.loads(file.readline())
+        except ValueError as e:
+            log.warning("Ignoring unreadable template manifest {}: {}".format(manifest_path, e))
+            header = None
+        if header != {"version": MANIFEST_VERSION, "input_key": input_key, "structure_key": structure_key}:
+            file.close()
+            return None
+        return cls(file)
+
+    def get_rows(self, accession, fingerprint):
+        """
+        Returns the recorded rows of the next node, if the node inputs are unchanged.
+        Args:
+            accession: cell set accession of the node
+            fingerprint: fingerprint of the node inputs
+        Returns:
+            list: template rows or None if the rows need to be recomputed.
+        """
+        recorded_accession, recorded_fingerprint, rows = json.loads(self._file.readline())
+        if recorded_accession != accession:
+            raise ValueError("Template manifest {} is out of order: expected {} but found {}"
+                             .format(self._file.name, accession, recorded_accession))
+        if recorded_fingerprint != fingerprint:
+            return None
+        return rows
+
+    def close(self):
+        self._file.close()
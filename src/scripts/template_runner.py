@@ -1,9 +1,12 @@
-from template_generation_tools import (generate_base_class_template, generate_curated_class_template, \
+from template_generation_tools import (TaxonomyContext, generate_base_class_template, generate_curated_class_template, \
     generate_ind_template, merge_class_templates, generate_marker_gene_set_template,
     generate_nsforest_marker_gene_set_template, \
-    generate_within_subclass_marker_gene_set_template, generate_evidence_marker_gene_set_template)
+    generate_within_subclass_marker_gene_set_template, generate_evidence_marker_gene_set_template,
+    generate_templates_parallel, get_outdated_components)
+from template_sidecar import SIDECAR_FORMATS, is_sidecar_supported
 from marker_tools import generate_denormalised_marker_template, generate_allen_marker_template
 import argparse
+import logging
 import pathlib
 
 parser = argparse.ArgumentParser(description='Cli interface for BDS functions. Provides two interfaces; '
@@ -33,6 +36,19 @@ parser_generator.add_argument('-nms', action='store_true', help="Generate a NS-F
 parser_generator.add_argument('-am', action='store_true', help="Generate Allen markers template.")
 parser_generator.add_argument('-oi', action='store_true', help="Generate a obsolete individuals data template.")
 parser_generator.add_argument('-ot', action='store_true', help="Generate a obsolete taxonomies template.")
+parser_generator.add_argument('-all', action='store_true', help="Generate the ind, class base and all marker gene set "
+                                                                  "templates in one pass. -i can be a list of taxonomy "
+                                                                  "files, -o is the output folder.")
+parser_generator.add_argument('--ind_output_dir', help="Output folder of the ind templates, used with -all.")
+parser_generator.add_argument('--workers', type=int, default=1, help="Number of worker processes, used with -all.")
+parser_generator.add_argument('--no_cache', action='store_true', help="Don't use the parsed taxonomy snapshot cache.")
+parser_generator.add_argument('--timings', action='store_true', help="Log the load times of the template inputs.")
+parser_generator.add_argument('--incremental', action='store_true', help="Only recompute the template rows of the "
+                                                                         "changed taxonomy nodes and only write the "
+                                                                         "changed templates, used with -all.")
+parser_generator.add_argument('--sidecar', choices=SIDECAR_FORMATS, help="Also write a Parquet or Arrow IPC sidecar "
+                                                                     "of each template (requires pyarrow), used "
+                                                                     "with -all.")
 
 parser_modifier = subparsers.add_parser('modifier', description='Template modification interface')
 parser_modifier.add_argument('-i', '--input', action='store', type=pathlib.Path, help="Path to first input file")
@@ -46,10 +62,30 @@ if args.action == "modifier":
     if 'merge' in args and args.merge:
         merge_class_templates(args.input, args.input2, args.output)
 else:
-    if args.cb:
-        generate_base_class_template(args.input, args.output)
+    if args.sidecar and not is_sidecar_supported():
+        parser_generator.error("--sidecar requires pyarrow")
+    if args.timings:
+        logging.basicConfig(format="%(message)s")
+        logging.getLogger("loader_scheduler").setLevel(logging.INFO)
+    # taxonomy is parsed once and shared by the generators
+    context = None
+    if not (args.ch or args.md or args.cs or args.a or args.tx or args.am or args.all):
+        if args.no_cache:
+            context = TaxonomyContext(args.input)
+        else:
+            context = TaxonomyContext.from_snapshot(args.input)
+    if args.all:
+        all_taxonomy_files = [x.strip() for x in args.input.split(' ') if x.strip()]
+        written = generate_templates_parallel(all_taxonomy_files, args.output, args.workers, args.ind_output_dir,
+                                              use_cache=not args.no_cache, incremental=args.incremental,
+                                              sidecar_format=args.sidecar)
+        if args.incremental:
+            print("Updated templates: " + (", ".join(written) or "none"))
+            print("OWL components to rebuild: " + (", ".join(get_outdated_components(written)) or "none"))
+    elif args.cb:
+        generate_base_class_template(args.input, args.output, context)
     elif args.cc:
-        generate_curated_class_template(args.input, args.output)
+        generate_curated_class_template(args.input, args.output, context)
     elif args.ch:
         all_base_files = [x.strip() for x in args.base.split(' ') if x.strip()]
         generate_homologous_to_template(args.input, all_base_files, args.output)
@@ -62,14 +98,14 @@ else:
     elif args.tx:
         generate_taxonomies_template(args.input, args.output)
     elif args.ms:
-        generate_marker_gene_set_template(args.input, args.output)
+        generate_marker_gene_set_template(args.input, args.output, context)
     elif args.ems:
-        generate_evidence_marker_gene_set_template(args.input, args.output)
+        generate_evidence_marker_gene_set_template(args.input, args.output, context)
     elif args.wsms:
-        generate_within_subclass_marker_gene_set_template(args.input, args.output)
+        generate_within_subclass_marker_gene_set_template(args.input, args.output, context)
     elif args.nms:
-        generate_nsforest_marker_gene_set_template(args.input, args.output)
+        generate_nsforest_marker_gene_set_template(args.input, args.output, context)
     elif args.am:
         generate_allen_marker_template(args.input, args.output)
     else:
-        generate_ind_template(args.input, args.output)
+        generate_ind_template(args.input, args.output, context)
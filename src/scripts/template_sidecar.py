@@ -0,0 +1,182 @@
+"""
+Optional Parquet and Arrow IPC sidecars of the generated templates, so that downstream readers don't need to re-parse
+the TSV templates. The sidecar of 'CCN20250428_class_base.tsv' is 'CCN20250428_class_base.parquet' (or '.arrow') and
+holds the same rows with typed columns: float columns for the percentages and confidences, list columns for the '|'
+separated columns and string columns for the others. Readers use a sidecar in place of its template when it is at
+least as recent as the template, memory mapped so that the typed columns are read without copying.
+
+Sidecars require pyarrow, which is optional: without it no sidecar is written and readers use the templates.
+"""
+import os
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PARQUET = "parquet"
+ARROW = "arrow"
+SIDECAR_FORMATS = (PARQUET, ARROW)
+
+STRING_TYPE = "string"
+FLOAT_TYPE = "float"
+LIST_TYPE = "list"
+
+LIST_SEPARATOR = "|"
+
+
+def is_sidecar_supported():
+    """
+    Returns True if pyarrow is installed.
+    """
+    return pyarrow is not None
+
+
+def get_sidecar_path(template_path, sidecar_format):
+    """
+    Returns the sidecar path of a template.
+    Args:
+        template_path: Path of the TSV template
+        sidecar_format: 'parquet' or 'arrow'
+    Returns:
+        str: template path with the sidecar format extension.
+    """
+    if sidecar_format not in SIDECAR_FORMATS:
+        raise ValueError("Unknown sidecar format '{}', expected one of {}".format(sidecar_format, SIDECAR_FORMATS))
+    return os.path.splitext(str(template_path))[0] + "." + sidecar_format
+
+
+def find_sidecar(template_path):
+    """
+    Returns the sidecar of a template if it is at least as recent as the template.
+    Args:
+        template_path: Path of the TSV template
+    Returns:
+        str: Path of the sidecar, None if the template has no up to date sidecar or pyarrow is not installed.
+    """
+    if pyarrow is None or not os.path.isfile(template_path):
+        return None
+    template_mtime = os.path.getmtime(template_path)
+    for sidecar_format in SIDECAR_FORMATS:
+        sidecar_path = get_sidecar_path(template_path, sidecar_format)
+        if os.path.isfile(sidecar_path) and os.path.getmtime(sidecar_path) >= template_mtime:
+            return sidecar_path
+    return None
+
+
+def _is_float_text(value):
+    try:
+        return repr(float(value)) == value
+    except ValueError:
+        return False
+
+
+def _get_column_array(values, column_type):
+    """
+    Converts the template text values of a column to a typed arrow array. Empty values are null. Float columns with
+    values that the template doesn't format as floats are kept as strings, so that the template text is preserved.
+    """
+    if column_type == FLOAT_TYPE and all(_is_float_text(value) for value in values if value):
+        return pyarrow.array([float(value) if value else None for value in values], type=pyarrow.float64())
+    if column_type == LIST_TYPE:
+        return pyarrow.array([value.split(LIST_SEPARATOR) if value else None for value in values],
+                             type=pyarrow.list_(pyarrow.string()))
+    return pyarrow.array([value if value else None for value in values], type=pyarrow.string())
+
+
+def write_sidecar(sidecar_path, columns, column_types, rows):
+    """
+    Writes the sidecar of a template. The format is chosen by the sidecar path extension.
+    Args:
+        sidecar_path: Path of the sidecar (see get_sidecar_path)
+        columns: template column names
+        column_types: type of each column (STRING_TYPE, FLOAT_TYPE or LIST_TYPE)
+        rows: template rows, as lists of the template text values
+    """
+    if pyarrow is None:
+        raise ImportError("pyarrow is required to write template sidecars")
+    values = [[] for _ in columns]
+    for row in rows:
+        for column_values, value in zip(values, row):
+            column_values.append(value)
+    table = pyarrow.table([_get_column_array(column_values, column_type)
+                           for column_values, column_type in zip(values, column_types)], names=list(columns))
+    temp_path = sidecar_path + ".tmp"
+    if sidecar_path.endswith("." + PARQUET):
+        pyarrow.parquet.write_table(table, temp_path)
+    else:
+        with pyarrow.OSFile(temp_path, "wb") as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, sidecar_path)
+
+
+def read_sidecar(sidecar_path, columns=None):
+    """
+    Reads a sidecar, memory mapped.
+    Args:
+        sidecar_path: Path of the sidecar
+        columns: optional names of the columns to read, columns missing from the sidecar are ignored
+    Returns:
+        pyarrow.Table
+    """
+    if sidecar_path.endswith("." + PARQUET):
+        if columns is not None:
+            names = set(pyarrow.parquet.read_schema(sidecar_path, memory_map=True).names)
+            columns = [column for column in columns if column in names]
+        return pyarrow.parquet.read_table(sidecar_path, columns=columns, memory_map=True)
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(sidecar_path, "r")).read_all()
+    if columns is not None:
+        table = table.select([column for column in columns if column in table.column_names])
+    return table
+
+
+def read_template_columns(template_path, columns):
+    """
+    Reads typed columns of a template from its sidecar.
+    Args:
+        template_path: Path of the TSV template
+        columns: names of the columns to read
+    Returns:
+        pyarrow.Table of the columns that the template has, empty values are null. None if the template has no up to
+        date sidecar.
+    """
+    sidecar_path = find_sidecar(template_path)
+    if sidecar_path is None:
+        return None
+    return read_sidecar(sidecar_path, columns)
+
+
+def get_list_values(table, name):
+    """
+    Returns all values of a list column of a sidecar. String columns of '|' separated values (such as the NT_marker_N
+    columns) are split.
+    Args:
+        table: sidecar table (see read_template_columns)
+        name: column name
+    Returns:
+        pyarrow.Array of the flattened column values, empty column values are skipped.
+    """
+    column = table.column(name)
+    if not pyarrow.types.is_list(column.type):
+        column = pyarrow.compute.split_pattern(column, LIST_SEPARATOR)
+    return pyarrow.compute.list_flatten(column)
+
+
+def filter_prefixed_rows(table, name, prefixes):
+    """
+    Returns the rows of a sidecar table whose column value starts with one of the prefixes.
+    Args:
+        table: sidecar table (see read_template_columns)
+        name: column name
+        prefixes: value prefixes
+    Returns:
+        pyarrow.Table of the matching rows.
+    """
+    column = table.column(name)
+    mask = pyarrow.compute.starts_with(column, prefixes[0])
+    for prefix in prefixes[1:]:
+        mask = pyarrow.compute.or_(mask, pyarrow.compute.starts_with(column, prefix))
+    return table.filter(mask)
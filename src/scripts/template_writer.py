@@ -0,0 +1,278 @@
+"""
+Streaming ROBOT template (TSV) writer. Rows are spooled to a temporary file as they are produced and the template is
+written with the csv module when the writer is closed, so only one row is held in memory at a time. The output is
+byte-identical to pandas.DataFrame.from_records(rows).to_csv(path, sep="\t", index=False).
+"""
+import csv
+import math
+import numbers
+import os
+import pickle
+import re
+import shutil
+import tempfile
+
+from template_sidecar import STRING_TYPE, get_sidecar_path, find_sidecar, write_sidecar
+
+# value kinds tracked per column to reproduce the pandas column type inference
+_INT = 1
+_FLOAT = 2
+_OTHER = 4
+
+
+class ColumnFamily:
+    """
+    Dynamically numbered or named template columns, such as 'MBA_1', 'MBA_2' etc. declared as
+    ColumnFamily(r"MBA_\\d+").
+    """
+
+    def __init__(self, pattern, description=None):
+        """
+        Args:
+            pattern: regular expression that matches the full column names of the family
+            description: optional description of the columns
+        """
+        self.pattern = re.compile(pattern)
+        self.description = description
+
+    def matches(self, column):
+        return self.pattern.fullmatch(column) is not None
+
+    def __repr__(self):
+        return "ColumnFamily({!r})".format(self.pattern.pattern)
+
+
+class TemplateSchema:
+    """
+    Ordered template column schema of fixed columns and column families.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns: list of column names and ColumnFamily declarations
+        """
+        self.columns = list(columns)
+        self.fixed_columns = {column for column in self.columns if not isinstance(column, ColumnFamily)}
+        self.families = [column for column in self.columns if isinstance(column, ColumnFamily)]
+
+    def __contains__(self, column):
+        return column in self.fixed_columns or any(family.matches(column) for family in self.families)
+
+
+def get_column_type(column, column_types):
+    """
+    Returns the sidecar type of a template column.
+    Args:
+        column: column name
+        column_types: dict of column names and ColumnFamily declarations to sidecar types (see template_sidecar)
+    Returns:
+        sidecar type of the column, string if it is not declared.
+    """
+    if column in column_types:
+        return column_types[column]
+    for declared, column_type in column_types.items():
+        if isinstance(declared, ColumnFamily) and declared.matches(column):
+            return column_type
+    return STRING_TYPE
+
+
+class TemplateWriter:
+    """
+    Writes template rows to a TSV file. Columns are written in order of their first appearance in the rows, as
+    pandas does, and each column is formatted as pandas would format its inferred dtype: int columns with missing
+    values are written as floats, floats use the shortest repr and missing values are left empty.
+    """
+
+    def __init__(self, output_filepath, schema=None, header_rows=None, skip_unchanged=False, sidecar_format=None,
+                 column_types=None):
+        """
+        Args:
+            output_filepath: Path of the output TSV file
+            schema: optional TemplateSchema or list of columns. If given, rows with undeclared columns are rejected.
+            header_rows: rows to write before all other rows, such as the ROBOT template row. They are kept by
+            reference, so that they can be completed until the writer is closed.
+            skip_unchanged: don't rewrite the output file if its content is unchanged, so that its modification time
+            is preserved.
+            sidecar_format: optionally also write a 'parquet' or 'arrow' sidecar of the template (see template_sidecar)
+            column_types: sidecar types of the columns, dict of column names and ColumnFamily declarations to types
+        """
+        self.output_filepath = output_filepath
+        self.skip_unchanged = skip_unchanged
+        if schema is not None and not isinstance(schema, TemplateSchema):
+            schema = TemplateSchema(schema)
+        self.schema = schema
+        self.header_rows = header_rows if header_rows is not None else []
+        self.sidecar_format = sidecar_format
+        self.column_types = column_types or dict()
+        # column -> [value kinds, has missing values, number of rows with the column], in order of appearance
+        self.columns = dict()
+        self.row_count = 0
+        self._spool = tempfile.TemporaryFile()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_row(self, row):
+        """
+        Adds a row to the template.
+        Args:
+            row: dictionary of column names to values
+        """
+        self._add_row_columns(self.columns, row)
+        # rows are pickled independently, a shared pickler memo would keep all rows alive
+        pickle.dump(row, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self.row_count += 1
+
+    def _add_row_columns(self, columns, row):
+        for column, value in row.items():
+            stats = columns.get(column)
+            if stats is None:
+                if self.schema is not None and column not in self.schema:
+                    raise ValueError("Column '{}' is not declared in the template schema of {}"
+                                     .format(column, self.output_filepath))
+                stats = columns[column] = [0, False, 0]
+            kind, is_missing = _value_kind(value)
+            stats[0] |= kind
+            stats[1] = stats[1] or is_missing
+            stats[2] += 1
+
+    def close(self):
+        """
+        Writes the template file and releases the spooled rows.
+        Returns:
+            bool: False if the file was not written since its content is unchanged (see skip_unchanged), else True.
+        """
+        try:
+            written = self._write_template()
+            if self.sidecar_format and (written or find_sidecar(self.output_filepath) !=
+                                        get_sidecar_path(self.output_filepath, self.sidecar_format)):
+                self._write_sidecar()
+            return written
+        finally:
+            self._spool.close()
+
+    def _write_template(self):
+        if not self.skip_unchanged:
+            with open(self.output_filepath, "w", newline="") as f:
+                self._write(f)
+            return True
+        with tempfile.TemporaryFile("w+", newline="") as f:
+            self._write(f)
+            f.seek(0)
+            if _has_content(self.output_filepath, f):
+                return False
+            f.seek(0)
+            with open(self.output_filepath, "w", newline="") as output:
+                shutil.copyfileobj(f, output)
+        return True
+
+    def _write_sidecar(self):
+        """
+        Writes the sidecar of the template, with the template text values of the rows.
+        """
+        columns, formatters = self._get_column_formatters()
+        column_types = [get_column_type(column, self.column_types) for column in columns]
+        rows = ([formatter(row.get(column)) for column, formatter in zip(columns, formatters)]
+                for row in self._rows())
+        write_sidecar(get_sidecar_path(self.output_filepath, self.sidecar_format), columns, column_types, rows)
+
+    def _get_column_formatters(self):
+        # header rows come first, so their columns do as well
+        columns = dict()
+        for row in self.header_rows:
+            self._add_row_columns(columns, row)
+        for column, (kind, is_missing, count) in self.columns.items():
+            stats = columns.setdefault(column, [0, False, 0])
+            stats[0] |= kind
+            stats[1] = stats[1] or is_missing
+            stats[2] += count
+        total = len(self.header_rows) + self.row_count
+        formatters = [_column_formatter(kind, is_missing or count < total)
+                      for kind, is_missing, count in columns.values()]
+        return list(columns), formatters
+
+    def _write(self, f):
+        columns, formatters = self._get_column_formatters()
+        if not columns:
+            # pandas writes an empty header line for templates without columns
+            f.write(os.linesep)
+            return
+        writer = csv.writer(f, delimiter="\t", lineterminator=os.linesep)
+        writer.writerow(columns)
+        for row in self._rows():
+            writer.writerow([formatter(row.get(column)) for column, formatter in zip(columns, formatters)])
+
+    def discard(self):
+        """
+        Releases the spooled rows without writing the template file.
+        """
+        self._spool.close()
+
+    def _rows(self):
+        yield from self.header_rows
+        self._spool.seek(0)
+        for _ in range(self.row_count):
+            yield pickle.load(self._spool)
+
+
+def _has_content(file_path, f):
+    """
+    Checks if the file at the given path has the same content as the given open file.
+    """
+    if not os.path.isfile(file_path):
+        return False
+    with open(file_path, newline="") as existing:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if chunk != existing.read(1024 * 1024):
+                return False
+            if not chunk:
+                return True
+
+
+def _is_nan(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral) and math.isnan(value)
+
+
+def _value_kind(value):
+    """
+    Returns the kind of the value and whether pandas considers it missing.
+    """
+    if value is None:
+        return 0, True
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return _OTHER, False
+    if isinstance(value, numbers.Integral):
+        return _INT, False
+    return _FLOAT, _is_nan(value)
+
+
+def _column_formatter(kind, is_missing):
+    if kind == _INT and not is_missing:
+        return _format_int
+    if kind and not kind & _OTHER:
+        return _format_float
+    return _format_object
+
+
+def _format_int(value):
+    return str(int(value))
+
+
+def _format_float(value):
+    if value is None or _is_nan(value):
+        return ""
+    return repr(float(value))
+
+
+def _format_object(value):
+    if value is None or _is_nan(value):
+        return ""
+    return str(value)
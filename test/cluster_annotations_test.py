@@ -0,0 +1,63 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from cluster_annotations import (read_cluster_annotations, get_cluster_annotations, CLUSTER_ACCESSION,
+                                 GROUP_ACCESSION, CCF_BROAD_FREQ, CCF_ACRONYM_FREQ)
+from template_generation_tools import CLUSTER_ANNOTATIONS_PATH
+
+
+class ClusterAnnotationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.folder, "annotations.csv")
+        with open(self.csv_path, "w", encoding="utf-8-sig") as f:
+            f.write("Group,accession_group,cell_set_accession.cluster,CCF_broad.freq,unused\n"
+                    "STR D1,CS_GROUP_1,CS:1,\"STR:0.9,PAL:0.1\",1\n"
+                    "PAL GABA,CS_GROUP_2,CS:2,,2\n"
+                    "STR D2,,CS:3,STR:1,3\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_projection_and_indexes(self):
+        annotations = read_cluster_annotations(self.csv_path)
+
+        self.assertEqual(["Group", GROUP_ACCESSION, CLUSTER_ACCESSION, CCF_BROAD_FREQ],
+                         list(annotations.frame.columns))
+        self.assertEqual("string", str(annotations.frame[CCF_BROAD_FREQ].dtype))
+        self.assertEqual(3, len(annotations))
+        self.assertEqual(1, annotations.get_row("CS:2"))
+        self.assertEqual(0, annotations.get_row("CS_GROUP_1", GROUP_ACCESSION))
+        self.assertIsNone(annotations.get_row("CS:4"))
+        self.assertEqual({"Group": "PAL GABA", GROUP_ACCESSION: "CS_GROUP_2", CLUSTER_ACCESSION: "CS:2",
+                          CCF_BROAD_FREQ: None}, annotations.get_record("CS:2"))
+
+    def test_region_frequencies(self):
+        annotations = read_cluster_annotations(self.csv_path)
+        # parsed on first use
+        self.assertEqual({}, annotations.region_frequencies)
+
+        broad = annotations.get_region_frequencies(CCF_BROAD_FREQ)
+        self.assertIs(broad, annotations.get_region_frequencies(CCF_BROAD_FREQ))
+        self.assertEqual([CCF_BROAD_FREQ], list(annotations.region_frequencies))
+        self.assertEqual(["STR", "PAL"], broad.get_region_symbols(annotations.get_row("CS:1")))
+        self.assertEqual([], broad.get_region_symbols(annotations.get_row("CS:2")))
+        acronym = annotations.get_region_frequencies(CCF_ACRONYM_FREQ)
+        self.assertEqual(3, len(acronym))
+        self.assertEqual(0, len(acronym.data))
+
+    def test_loaded_once(self):
+        self.assertIs(get_cluster_annotations(self.csv_path), get_cluster_annotations(self.csv_path))
+
+    def test_consensus_annotations(self):
+        annotations = get_cluster_annotations(CLUSTER_ANNOTATIONS_PATH)
+        self.assertIn(GROUP_ACCESSION, annotations.frame.columns)
+        self.assertEqual(annotations.get_record("CS20250428_GROUP_0049", GROUP_ACCESSION)["Group"],
+                         "STRd D1 Matrix MSN")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import copy
+import json
+import pickle
+import os
+import tempfile
+
+from dendrogram_tools import tree_recurse, read_json_file, read_cas_json_stream, iter_cas_annotations, \
+    read_cas_metadata, cas_json_2_nodes_n_edges, stream_cas_json_2_nodes_n_edges, _JsonStream, TaxonomyNode, \
+    LazyFields
+
+PATH_TO_CAS = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src/dendrograms/CCN20250428.json")
+
+CAS = {
+    "labelsets": [{"name": "Class", "rank": 2}, {"name": "Group", "rank": 0}, {"name": "Unranked"}],
+    "annotations": [
+        {"labelset": "Class", "cell_set_accession": "C1"},
+        {"labelset": "Group", "cell_set_accession": "G1", "parent_cell_set_accession": "C1"},
+        {"labelset": "Group", "cell_set_accession": "G2", "parent_cell_set_accession": "C1"},
+        {"labelset": "Unranked", "cell_set_accession": "U1", "parent_cell_set_accession": "C1"},
+    ]
+}
+
+
+class DendrogramToolsTest(unittest.TestCase):
+
+    def test_edge_indexes(self):
+        dend = {}
+        tree_recurse(CAS, dend)
+
+        self.assertEqual({("C1", ""), ("G1", "C1"), ("G2", "C1")}, dend["edges"])
+        self.assertEqual({"C1": "", "G1": "C1", "G2": "C1"}, dend["parents"])
+        self.assertEqual({"C1": ["G1", "G2"]}, dend["children"])
+
+
+class TaxonomyNodeTest(unittest.TestCase):
+
+    def test_dict_behaviour(self):
+        annotation = {"labelset": "Group", "cell_set_accession": "G1", "parent_cell_set_accession": None,
+                      "author_annotation_fields": {"a": "1", "b": ""}}
+        node = TaxonomyNode(annotation)
+
+        self.assertEqual(annotation, node)
+        self.assertEqual(list(annotation.keys()), list(node.keys()))
+        self.assertNotIn("cell_label", node)
+        self.assertIsNone(node.get("cell_label"))
+        self.assertRaises(KeyError, lambda: node["cell_label"])
+        self.assertEqual("G1", node.cell_set_accession)
+        self.assertEqual({"a": "1", "b": ""}, dict(node["author_annotation_fields"]))
+
+        node["chain"] = ["G1"]
+        node["cell_label"] = "label"
+        self.assertEqual(["G1"], node["chain"])
+        self.assertEqual(6, len(node))
+        del node["chain"]
+        self.assertNotIn("chain", node)
+
+    def test_copies(self):
+        node = TaxonomyNode({"cell_set_accession": "G1", "author_annotation_fields": {"a": "1"}})
+
+        self.assertEqual(node, copy.deepcopy(node))
+        self.assertEqual(node, pickle.loads(pickle.dumps(node)))
+        cloned = node.copy()
+        cloned["cell_set_accession"] = "G2"
+        self.assertEqual("G1", node["cell_set_accession"])
+
+
+class StreamingCasReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        cas = dict(CAS)
+        cas["annotations"] = [dict(annotation, cell_ids=["c1", "c\\\"]2"]) for annotation in CAS["annotations"]]
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(cas, f)
+        self.cas = cas
+        self.cas_path = f.name
+
+    def tearDown(self):
+        os.remove(self.cas_path)
+
+    def test_stream_equals_json_load(self):
+        self.assertEqual(read_json_file(PATH_TO_CAS), read_cas_json_stream(PATH_TO_CAS, include_cell_ids=True))
+        self.assertEqual(self.cas, read_cas_json_stream(self.cas_path, include_cell_ids=True))
+
+    def test_small_chunks(self):
+        with open(self.cas_path) as f:
+            stream = _JsonStream(f, chunk_size=3)
+            content = {key: stream.read_value() for key in stream.iter_object_keys()}
+        self.assertEqual(self.cas, content)
+
+    def test_cell_ids_skipped(self):
+        annotations = list(iter_cas_annotations(self.cas_path))
+
+        self.assertEqual(4, len(annotations))
+        self.assertTrue(all("cell_ids" not in annotation for annotation in annotations))
+        self.assertEqual({"labelsets": CAS["labelsets"]}, read_cas_metadata(self.cas_path))
+
+    def test_stream_nodes_n_edges(self):
+        dend = cas_json_2_nodes_n_edges(self.cas_path)
+        for node in dend["nodes"]:
+            del node["cell_ids"]
+
+        self.assertEqual(dend, stream_cas_json_2_nodes_n_edges(self.cas_path))
+
+    def test_lazy_author_fields(self):
+        nodes = stream_cas_json_2_nodes_n_edges(PATH_TO_CAS, lazy_author_fields=True)["nodes"]
+        expected = cas_json_2_nodes_n_edges(PATH_TO_CAS)["nodes"]
+
+        group = next(i for i, node in enumerate(expected) if node["author_annotation_fields"])
+        self.assertIs(LazyFields, type(nodes[group].author_annotation_fields))
+        self.assertEqual(dict(expected[group]["author_annotation_fields"]),
+                         dict(nodes[group]["author_annotation_fields"]))
+        self.assertIsNot(LazyFields, type(nodes[group].author_annotation_fields))
+        for node, expected_node in zip(nodes, expected):
+            del expected_node["cell_ids"]
+            self.assertEqual(expected_node, node)
+
+    def test_projected_author_fields(self):
+        nodes = stream_cas_json_2_nodes_n_edges(PATH_TO_CAS, author_fields=["tokens_*", "embedding_set"])["nodes"]
+        expected = cas_json_2_nodes_n_edges(PATH_TO_CAS)["nodes"]
+
+        for node, expected_node in zip(nodes, expected):
+            expected_fields = expected_node["author_annotation_fields"]
+            if expected_fields:
+                self.assertEqual({key: value for key, value in expected_fields.items()
+                                  if key.startswith("tokens_") or key == "embedding_set"},
+                                 dict(node["author_annotation_fields"]))
+            else:
+                self.assertEqual(expected_fields, node["author_annotation_fields"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from rdflib import Graph, URIRef, Literal, BNode
+from rdflib.namespace import RDF, RDFS, OWL
+
+import disclaimer_generator
+from shared_inputs import shared_inputs
+from dhba_index import (DhbaIndex, build_dhba_index, read_dhba_index, DHBA_BASE, SYMBOL, PART_OF, OBO_IN_OWL,
+                        OBO)
+
+
+def dhba(number):
+    return URIRef(DHBA_BASE + str(number))
+
+
+class DhbaIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ontology_path = os.path.join(self.folder, "dhbao.owl")
+        self.index_path = os.path.join(self.folder, "dhba_index.json")
+
+        graph = Graph()
+        for number, symbol, label in [(10153, "root", "Brain"), (10333, "STR", "Striatum"),
+                                      (10334, "CaB", "Caudate body"), (10342, "PAL", "Pallidum")]:
+            graph.add((dhba(number), RDF.type, OWL.Class))
+            graph.add((dhba(number), SYMBOL, Literal(symbol)))
+            graph.add((dhba(number), OBO_IN_OWL.hasExactSynonym, Literal(symbol)))
+            graph.add((dhba(number), RDFS.label, Literal(label)))
+        # materialized and existential part_of relations, through an external region
+        graph.add((dhba(10334), PART_OF, dhba(10333)))
+        graph.add((dhba(10333), PART_OF, OBO.UBERON_0002435))
+        restriction = BNode()
+        graph.add((OBO.UBERON_0002435, RDFS.subClassOf, restriction))
+        graph.add((restriction, OWL.onProperty, PART_OF))
+        graph.add((restriction, OWL.someValuesFrom, dhba(10153)))
+        graph.add((dhba(10342), PART_OF, dhba(10153)))
+        graph.serialize(self.ontology_path, format="xml")
+        self.graph = graph
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_build_index(self):
+        index = build_dhba_index(self.graph)
+
+        self.assertEqual("DHBA:10333", index.symbols["STR"])
+        self.assertEqual("DHBA:10334", index.synonyms["CaB"])
+        self.assertEqual("caudate body", index.labels["DHBA:10334"])
+        self.assertEqual({"DHBA:10333", "DHBA:10153"}, index.part_of["DHBA:10334"])
+        self.assertTrue(index.is_part_of("DHBA:10334", "DHBA:10153"))
+        self.assertTrue(index.is_part_of("DHBA:10333", "DHBA:10333"))
+        self.assertFalse(index.is_part_of("DHBA:10333", "DHBA:10334"))
+        self.assertFalse(index.is_part_of("DHBA:10342", "DHBA:10333"))
+
+    def test_index_cache(self):
+        index = read_dhba_index(self.index_path, self.ontology_path)
+        self.assertTrue(os.path.isfile(self.index_path))
+
+        # the saved index is read without parsing the ontology
+        os.remove(self.ontology_path)
+        cached = read_dhba_index(self.index_path, self.ontology_path)
+        self.assertEqual(index.to_json(), cached.to_json())
+
+    def test_missing_index(self):
+        missing = os.path.join(self.folder, "missing.owl")
+        with self.assertRaises(FileNotFoundError):
+            read_dhba_index(self.index_path, missing)
+
+    def test_location_support(self):
+        # the disclaimer checks read the DHBA index shared with the template generators
+        with mock.patch.dict(shared_inputs, {(read_dhba_index, (), ()): build_dhba_index(self.graph)}):
+            self.assertEqual(DHBA_BASE + "10333", disclaimer_generator.get_mba_entity("STR"))
+            self.assertIsNone(disclaimer_generator.get_mba_entity("XYZ"))
+            self.assertTrue(disclaimer_generator.is_location_supported("STR", ["CaB", "XYZ"]))
+            self.assertFalse(disclaimer_generator.is_location_supported("STR", ["PAL"]))
+            self.assertTrue(disclaimer_generator.is_location_supported("XYZ", ["PAL"]))
+
+    def test_json_roundtrip(self):
+        index = DhbaIndex({"STR": "DHBA:1"}, {}, {"DHBA:1": "striatum"}, {"DHBA:2": {"DHBA:1"}})
+        self.assertEqual(index.to_json(), DhbaIndex.from_json(index.to_json()).to_json())
+        with self.assertRaises(ValueError):
+            DhbaIndex.from_json(dict(index.to_json(), version=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gene_index import GeneIndex, as_gene_index, EXACT, CASEFOLD, ALIAS, SUBSTRING
+from template_generation_tools import read_gene_dbs, read_gene_index
+
+
+class GeneIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.genes = {"Gad1": "NCBIGene:14415",
+                      "Gad2": "NCBIGene:14417",
+                      "Slc17a7": "NCBIGene:72961",
+                      "Slc17a6": "NCBIGene:140919",
+                      "Drd1a-ps": "NCBIGene:1",
+                      "Drd1": "NCBIGene:13488",
+                      "Foxp2": "ensembl:ENSMUSG00000029563"}
+        self.index = GeneIndex(self.genes, synonyms={"VGLUT1": "Slc17a7", "Unknown": "Missing"})
+
+    def test_mapping(self):
+        self.assertEqual(len(self.genes), len(self.index))
+        self.assertIn("Gad1", self.index)
+        self.assertEqual("NCBIGene:14417", self.index["Gad2"])
+        self.assertEqual(self.genes, dict(self.index))
+        self.assertIs(self.index, as_gene_index(self.index))
+
+    def test_match_quality(self):
+        self.assertEqual(("Gad1", EXACT), self.match(" Gad1 "))
+        self.assertEqual(("Slc17a7", CASEFOLD), self.match("SLC17A7"))
+        self.assertEqual(("Slc17a7", ALIAS), self.match("vglut1"))
+        self.assertEqual(("Foxp2", SUBSTRING), self.match("oxp"))
+        self.assertIsNone(self.index.lookup("Unknown"))
+
+    def test_substring_match_is_deterministic(self):
+        # shortest name wins, then alphabetical order
+        self.assertEqual(("Drd1", SUBSTRING), self.match("rd1"))
+        self.assertEqual(("Gad1", SUBSTRING), self.match("ad"))
+        self.assertEqual(("Slc17a6", SUBSTRING), self.match("c17"))
+
+    def test_misses_are_cached(self):
+        self.assertIsNone(self.index.lookup("Sst"))
+        self.assertIn("Sst", self.index.misses)
+        self.assertIsNone(self.index.lookup("Sst"))
+
+    def test_bulk_lookup(self):
+        matches = self.index.bulk_lookup(["Gad1", "gad2", "Sst", "Gad1"])
+
+        self.assertEqual(["Gad1", "gad2", "Sst"], list(matches))
+        self.assertEqual("NCBIGene:14415", matches["Gad1"].id)
+        self.assertEqual(CASEFOLD, matches["gad2"].quality)
+        self.assertIsNone(matches["Sst"])
+
+    def match(self, gene_name):
+        match = self.index.lookup(gene_name)
+        return match.name, match.quality
+
+
+class GeneDbReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.folder, "cache")
+        self.write("genedb.tsv", ["ID\tTYPE\tNAME",
+                                  "ID\tSC %\tA rdfs:label",
+                                  "NCBIGene:14415\tSO:0000704\tGad1 (Mmus)",
+                                  "ensembl:ENSMUSG00000029563\tSO:0000704\tFoxp2",
+                                  "\tSO:0000704\tNoId"])
+        self.write("genedb_ensembl.tsv", ["ID\tTYPE\tNAME\tSYNONYMS",
+                                          "ID\tSC %\tA rdfs:label\tA oboInOwl:hasExactSynonym SPLIT=|",
+                                          "ensembl:ENSMUSG00000070880\tSO:0000704\tGad1\tGAD67|Gad-1",
+                                          "ensembl:ENSMUSG00000029563\tSO:0000704\tFoxp2\t",
+                                          "ensembl:ENSMUSG00000026787\tSO:0000704\tGad2\t"])
+        # taxonomy templates are not gene dbs
+        self.write("CCN20250428.tsv", ["ID\tTYPE\tNAME", "CS:1\tSO:0000704\tNotAGene"])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, file_name, lines):
+        with open(os.path.join(self.folder, file_name), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def test_read_gene_dbs(self):
+        synonyms = dict()
+        genes = read_gene_dbs(self.folder, synonyms)
+
+        self.assertEqual({"Gad1": "NCBIGene:14415",
+                          "Foxp2": "ensembl:ENSMUSG00000029563",
+                          "Gad2": "ensembl:ENSMUSG00000026787"}, genes)
+        self.assertEqual({"GAD67": "Gad1", "Gad-1": "Gad1"}, synonyms)
+
+    def test_gene_index_cache(self):
+        gene_index = read_gene_index(self.folder, self.cache_dir)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        cache_file = os.listdir(self.cache_dir)[0]
+        self.assertEqual(dict(gene_index), dict(read_gene_index(self.folder, self.cache_dir)))
+        self.assertEqual("Gad1", read_gene_index(self.folder, self.cache_dir).lookup("gad67").name)
+
+        self.write("genedb.tsv", ["ID\tTYPE\tNAME", "NCBIGene:20604\tSO:0000704\tSst"])
+        changed = read_gene_index(self.folder, self.cache_dir)
+        self.assertEqual("NCBIGene:20604", changed["Sst"])
+        self.assertNotIn(cache_file, os.listdir(self.cache_dir))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
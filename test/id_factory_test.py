@@ -1,7 +1,14 @@
 import unittest
+import os
+from collections import Counter
+from itertools import compress
+import shutil
+import tempfile
+
 from pcl_id_factory import PCLIdFactory
 from cl_id_factory import CLIdFactory
 from clm_id_factory import CLMIdFactory
+from template_generation_utils import read_tsv_to_dict
 
 class PCLIdFactoryTestCase(unittest.TestCase):
 
@@ -59,5 +66,115 @@ class PCLIdFactoryTestCase(unittest.TestCase):
         self.assertEqual("5000102", self.clm_id_factory.get_evidence_marker_gene_set_id("CS20230722_SUBC_002"))
 
 
+class BatchIdAllocationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        labelsets = [("Neighborhood", "NEIGH", 2), ("Class", "CLASS", 3), ("Subclass", "SUBCL", 5),
+                     ("Group", "GROUP", 8), ("Cluster", "CLUST", 13)]
+        self.taxonomy = {'labelsets': [{'name': name, 'rank': rank} for rank, (name, _, _) in
+                                       enumerate(reversed(labelsets))],
+                         'annotations': [{'labelset': name, 'cell_set_accession': "CS20250428_{}_{:04d}".format(
+                             symbol, index)} for name, symbol, count in labelsets for index in range(count)]}
+        self.accessions = [node['cell_set_accession'] for node in self.taxonomy['annotations']][::-1]
+
+    def assert_same_ids(self, id_factory, methods):
+        batch_ids = id_factory.get_batch_ids(self.accessions)
+        self.assertEqual(list(methods), list(batch_ids))
+        for kind, method in methods.items():
+            self.assertEqual("int64", str(batch_ids[kind].dtype))
+            self.assertEqual([method(accession) for accession in self.accessions],
+                             id_factory.format_ids(batch_ids[kind]).tolist())
+
+    def test_pcl_batch_ids(self):
+        id_factory = PCLIdFactory(self.taxonomy, taxonomy_details=[])
+        self.assert_same_ids(id_factory, {"class": id_factory.get_class_id,
+                                          "marker_gene_set": id_factory.get_marker_gene_set_id,
+                                          "nsf_marker_gene_set": id_factory.get_nsf_marker_gene_set_id,
+                                          "ws_marker_gene_set": id_factory.get_ws_marker_gene_set_id,
+                                          "evidence_marker_gene_set": id_factory.get_evidence_marker_gene_set_id})
+        self.assertEqual(["class"], list(id_factory.get_batch_ids(self.accessions, kinds=["class"])))
+
+    def test_cl_batch_ids(self):
+        id_factory = CLIdFactory(self.taxonomy, taxonomy_details=[])
+        self.assert_same_ids(id_factory, {"class": id_factory.get_class_id})
+
+    def test_clm_batch_ids(self):
+        id_factory = CLMIdFactory(self.taxonomy, taxonomy_details=[])
+        self.assert_same_ids(id_factory, {"marker_gene_set": id_factory.get_marker_gene_set_id,
+                                          "nsf_marker_gene_set": id_factory.get_nsf_marker_gene_set_id,
+                                          "ws_marker_gene_set": id_factory.get_ws_marker_gene_set_id,
+                                          "evidence_marker_gene_set": id_factory.get_evidence_marker_gene_set_id})
+
+    def test_unknown_labelsets(self):
+        id_factory = PCLIdFactory(self.taxonomy, taxonomy_details=[])
+        with self.assertRaises(KeyError):
+            id_factory.get_batch_ids(["CS20250428_CLUST_0001", "CS20250428_SUPT_0001"])
+        with self.assertRaises(KeyError):
+            id_factory.get_batch_ids(["CS20250428_CLUST_0001"], kinds=["dataset"])
+        self.assertEqual(0, len(id_factory.get_batch_ids([])["class"]))
+        # formatted allocation skips the accession ids of other labelsets
+        self.assertEqual({"class": {"CS20250428_CLUST_0001": id_factory.get_class_id("CS20250428_CLUST_0001")}},
+                         id_factory.allocate_ids(["CS20250428_CLUST_0001", "CS20250428_SUPT_0001", "CS20250428"],
+                                                 kinds=["class"]))
+
+
+class ReverseIdLookupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        BatchIdAllocationTestCase.setUp(self)
+
+    def test_reverse_ids(self):
+        for id_factory in [PCLIdFactory(self.taxonomy, taxonomy_details=[]),
+                           CLIdFactory(self.taxonomy, taxonomy_details=[]),
+                           CLMIdFactory(self.taxonomy, taxonomy_details=[])]:
+            batch_ids = id_factory.get_batch_ids(self.accessions)
+            # spare space of the last labelset ranges can overlap the next id kind range, ids allocated twice are
+            # resolved to the later range
+            id_counts = Counter(id_number for ids in batch_ids.values() for id_number in ids.tolist())
+            for kind, ids in batch_ids.items():
+                id_strs = [id_factory.PREFIXES[1] + id_str for id_str in id_factory.format_ids(ids).tolist()]
+                expected = [(accession, kind) for accession in self.accessions]
+                unique = [id_counts[id_number] == 1 for id_number in ids.tolist()]
+                self.assertEqual(list(compress(expected, unique)),
+                                 list(compress([id_factory.resolve_id(id_str) for id_str in id_strs], unique)))
+                self.assertEqual(list(compress(expected, unique)),
+                                 list(compress(zip(*id_factory.get_reverse_ids(id_strs)), unique)))
+
+    def test_unresolved_ids(self):
+        id_factory = PCLIdFactory(self.taxonomy, taxonomy_details=[])
+        unresolved = ["PCL:0159999", "PCL:" + id_factory.get_dataset_id(None, 0), "PCL:9999999", "CL:0160003",
+                      "PCL:abc", "CS20250428_CLUST_0001"]
+        self.assertEqual([None] * len(unresolved), [id_factory.resolve_id(id_str) for id_str in unresolved])
+        self.assertEqual(([None] * len(unresolved), [None] * len(unresolved)),
+                         id_factory.get_reverse_ids(unresolved))
+        self.assertEqual("CS20250428_NEIGH_0001", id_factory.get_reverse_id("http://purl.obolibrary.org/obo/PCL_0160001"))
+        # spare space of the ranges is resolved too
+        self.assertEqual(("CS20250428_NEIGH_0009", "class"), id_factory.resolve_id("PCL:0160009"))
+        self.assertEqual(("CS20250428_GROUP_0003", PCLIdFactory.INDIVIDUAL_KIND),
+                         id_factory.resolve_id("PCL_INDV:CS20250428_GROUP_0003"))
+
+    def test_rekey_curations(self):
+        pcl_id_factory = PCLIdFactory(self.taxonomy, taxonomy_details=[])
+        cl_id_factory = CLIdFactory(self.taxonomy, taxonomy_details=[])
+        folder = tempfile.mkdtemp()
+        try:
+            tsv_path = os.path.join(folder, "curation.tsv")
+            with open(tsv_path, "w") as f:
+                f.write("defined_class\tcuration\n")
+                f.write("PCL:{}\tpcl\n".format(pcl_id_factory.get_class_id("CS20250428_GROUP_0007")))
+                f.write("CL:{}\tcl\n".format(cl_id_factory.get_class_id("CS20250428_CLASS_0002")))
+                f.write("CS20250428_CLUST_0001\taccession\n")
+
+            headers, records = read_tsv_to_dict(tsv_path, use_accession_ids=True,
+                                                id_factories=[pcl_id_factory, cl_id_factory])
+            self.assertEqual({"CS20250428_GROUP_0007": "pcl", "CS20250428_CLASS_0002": "cl",
+                              "CS20250428_CLUST_0001": "accession"},
+                             {key: row["curation"] for key, row in records.items()})
+            with self.assertRaises(ValueError):
+                read_tsv_to_dict(tsv_path, use_accession_ids=True)
+        finally:
+            shutil.rmtree(folder)
+
+
 if __name__ == '__main__':
     unittest.main()
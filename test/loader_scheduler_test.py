@@ -0,0 +1,68 @@
+import unittest
+import os
+import threading
+import time
+
+from loader_scheduler import LoaderScheduler
+
+
+def get_pid():
+    return os.getpid()
+
+
+def fail():
+    raise ValueError("broken input")
+
+
+class LoaderSchedulerTest(unittest.TestCase):
+
+    def test_dependencies(self):
+        loaded = []
+        lock = threading.Lock()
+
+        def load(name, delay=0.0):
+            time.sleep(delay)
+            with lock:
+                loaded.append(name)
+            return name.upper()
+
+        scheduler = LoaderScheduler()
+        scheduler.add("slow", load, ("slow", 0.2))
+        scheduler.add("fast", load, ("fast",))
+        scheduler.add("derived", load, ("derived",), requires=["slow", "fast"])
+        results = scheduler.run()
+
+        self.assertEqual({"slow": "SLOW", "fast": "FAST", "derived": "DERIVED"}, results)
+        self.assertEqual(["fast", "slow", "derived"], loaded)
+        self.assertEqual(["slow", "derived"], [timing.name for timing in scheduler.get_critical_path()])
+        self.assertGreaterEqual(scheduler.timings["derived"].submitted, scheduler.timings["slow"].finished)
+
+    def test_process_loaders(self):
+        results = []
+        scheduler = LoaderScheduler()
+        scheduler.add("pid", get_pid, process=True, on_result=results.append)
+        scheduler.run()
+
+        self.assertEqual(1, len(results))
+        self.assertNotEqual(os.getpid(), results[0])
+        self.assertTrue(scheduler.timings["pid"].process)
+
+    def test_failures(self):
+        scheduler = LoaderScheduler()
+        scheduler.add("broken", fail)
+        scheduler.add("dependent", get_pid, requires=["broken"])
+        scheduler.add("independent", get_pid)
+
+        with self.assertRaises(ValueError):
+            scheduler.run()
+        self.assertIn("independent", scheduler.results)
+        self.assertNotIn("dependent", scheduler.timings)
+
+        with self.assertRaises(ValueError):
+            scheduler.add("independent", get_pid)
+        with self.assertRaises(ValueError):
+            scheduler.add("other", get_pid, requires=["unknown"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import math
+import os
+import tempfile
+import shutil
+
+import pandas as pd
+
+from template_generation_tools import MarkerScoreIndex, read_markers_dataframe
+
+
+class MarkerScoreIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.markers_df = pd.DataFrame({"clusterName": ["c1", "c2", "c1"],
+                                        "f_score": [0.5, 0.75, 0.25],
+                                        "PPV": [0.9, 0.8, 0.7],
+                                        "recall": [0.1, 0.2, 0.3],
+                                        "markers": ["['A', 'B']", "['C']", "['D']"]})
+
+    def test_lookup_matches_first_row(self):
+        index = MarkerScoreIndex(self.markers_df, precision_column="PPV")
+
+        self.assertEqual(2, len(index))
+        self.assertNotIn("c3", index)
+        for cluster_name in ["c1", "c2"]:
+            filtered_df = self.markers_df[self.markers_df['clusterName'] == cluster_name]
+            self.assertEqual(filtered_df['f_score'].values[0], index.f_score(cluster_name))
+            self.assertEqual(filtered_df['PPV'].values[0], index.precision(cluster_name))
+            self.assertEqual(filtered_df['recall'].values[0], index.recall(cluster_name))
+            self.assertEqual(filtered_df['markers'].values[0], index.get_markers(cluster_name))
+
+    def test_missing_columns(self):
+        index = MarkerScoreIndex(self.markers_df[["clusterName", "f_score"]])
+
+        self.assertEqual(0.75, index.f_score("c2"))
+        self.assertTrue(math.isnan(index.precision("c2")))
+        self.assertIsNone(index.get_markers("c2"))
+        self.assertEqual(0, len(MarkerScoreIndex(pd.DataFrame(columns=["clusterName"]))))
+
+    def test_read_markers_skips_missing_files(self):
+        folder = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(folder, "cluster_results.csv")
+            self.markers_df.to_csv(file_path, index=False)
+            markers = read_markers_dataframe([os.path.join(folder, "missing.csv"), file_path])
+            self.assertEqual(["c1", "c2", "c1"], markers["clusterName"].tolist())
+            self.assertTrue(read_markers_dataframe([os.path.join(folder, "missing.csv")]).empty)
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
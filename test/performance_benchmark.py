@@ -0,0 +1,218 @@
+"""
+Benchmarks of the template generation hot spots on a synthetic taxonomy. Not part of the test suite, run with:
+
+    PYTHONPATH=../src/scripts python performance_benchmark.py [--nodes 100000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from dendrogram_tools import tree_recurse, TaxonomyNode, stream_cas_json_2_nodes_n_edges
+from template_generation_utils import get_gross_cell_type, resolve_all_gross_cell_types, LabelSuffixIndex
+from gene_index import GeneIndex
+from pcl_id_factory import PCLIdFactory
+
+LABELSETS = [("Neighborhood", 3, "NEIGH"), ("Class", 2, "CLASS"), ("Subclass", 1, "SUBCL"), ("Group", 0, "GROUP")]
+FAN_OUT = 10
+LEGACY_SAMPLE_SIZE = 200
+
+
+def generate_synthetic_taxonomy(node_count, seed=7):
+    """
+    Generates a CAS json like taxonomy with the given number of annotations. Upper levels have a fan-out of 10 and
+    all remaining nodes are leaves distributed over the deepest non-leaf level.
+    Args:
+        node_count: Number of annotations to generate
+        seed: random seed used to assign cell ontology terms
+
+    Returns: CAS json like dict
+    """
+    rnd = random.Random(seed)
+    annotations = []
+    parents = [""]
+    for level, (labelset, rank, symbol) in enumerate(LABELSETS):
+        is_leaf_level = level == len(LABELSETS) - 1
+        count = node_count - len(annotations) if is_leaf_level else len(parents) * FAN_OUT
+        level_nodes = []
+        for index in range(count):
+            accession = "CS00000000_{}_{:06d}".format(symbol, index)
+            annotation = {"labelset": labelset, "cell_set_accession": accession,
+                          "cell_label": "{} {}".format(labelset, index), "cell_fullname": None,
+                          "rationale_dois": [], "marker_gene_evidence": [], "synonyms": [],
+                          "author_annotation_fields": {"embedding_set": "Neuron", "tokens_group": labelset,
+                                                       "display_order_group": str(index % 100),
+                                                       "color_hex_group": "#66493D", "color_group": "",
+                                                       "neurotransmitter": rnd.choice(["GABA", "Glut", ""])}}
+            parent = parents[index % len(parents)]
+            if parent:
+                annotation["parent_cell_set_accession"] = parent
+            if not is_leaf_level and rnd.random() < 0.3:
+                annotation["cell_ontology_term_id"] = "CL:{:07d}".format(rnd.randint(1, 9999999))
+            annotations.append(annotation)
+            level_nodes.append(accession)
+        parents = level_nodes
+    return {"labelsets": [{"name": labelset, "rank": rank} for labelset, rank, _ in LABELSETS],
+            "annotations": annotations}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_gross_cell_types(dend):
+    nodes = dend['nodes']
+    sample = random.Random(1).sample(nodes, min(LEGACY_SAMPLE_SIZE, len(nodes)))
+
+    def legacy():
+        return [get_gross_cell_type(node['cell_set_accession'], nodes) for node in sample]
+
+    def cached():
+        gross_cell_types = resolve_all_gross_cell_types(dend)
+        return [get_gross_cell_type(node['cell_set_accession'], nodes, gross_cell_types) for node in nodes]
+
+    legacy_result, legacy_time = timed(legacy)
+    cached_result, cached_time = timed(cached)
+    sample_indexes = {id(node): i for i, node in enumerate(nodes)}
+    assert legacy_result == [cached_result[sample_indexes[id(node)]] for node in sample]
+
+    legacy_estimate = legacy_time / len(sample) * len(nodes)
+    print("gross cell types: legacy {:.1f}s (extrapolated from {} nodes), resolved {:.3f}s, speed-up x{:.0f}"
+          .format(legacy_estimate, len(sample), cached_time, legacy_estimate / cached_time))
+
+
+def benchmark_node_store(taxonomy, sample_size=20000):
+    # nodes decoded independently, as when parsing a large file
+    raw_annotations = [json.dumps(annotation) for annotation in taxonomy["annotations"][:sample_size]]
+    memory = dict()
+    for name, node_type in (("dict", dict), ("TaxonomyNode", TaxonomyNode)):
+        tracemalloc.start()
+        nodes = [node_type(json.loads(raw)) for raw in raw_annotations]
+        memory[name] = tracemalloc.get_traced_memory()[0] / len(nodes)
+        tracemalloc.stop()
+        del nodes
+    print("node store: dict {:.0f} bytes/node, TaxonomyNode {:.0f} bytes/node, x{:.1f} smaller"
+          .format(memory["dict"], memory["TaxonomyNode"], memory["dict"] / memory["TaxonomyNode"]))
+
+
+def benchmark_author_fields(taxonomy, sample_size=2000, column_count=200):
+    annotations = []
+    for annotation in taxonomy["annotations"][:sample_size]:
+        annotation = dict(annotation)
+        annotation["author_annotation_fields"] = {"column_{}".format(i): "value {} {}".format(
+            i, annotation["cell_set_accession"]) for i in range(column_count)}
+        annotation["author_annotation_fields"]["Group.markers.combo"] = "GENE1,GENE2"
+        annotations.append(annotation)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"labelsets": taxonomy["labelsets"], "annotations": annotations}, f)
+    try:
+        for name, options in (("eager", {"lazy_author_fields": False}), ("lazy", {"lazy_author_fields": True}),
+                              ("projected", {"author_fields": ["*.markers.combo"]})):
+            dend, load_time = timed(lambda: stream_cas_json_2_nodes_n_edges(f.name, **options))
+            del dend
+            tracemalloc.start()
+            dend = stream_cas_json_2_nodes_n_edges(f.name, **options)
+            memory = tracemalloc.get_traced_memory()[0] / len(dend["nodes"])
+            tracemalloc.stop()
+            print("author fields ({} columns) {}: load {:.2f}s, {:.0f} bytes/node"
+                  .format(column_count, name, load_time, memory))
+    finally:
+        os.remove(f.name)
+
+
+def benchmark_gene_lookup(gene_count=16000, query_count=2000):
+    rnd = random.Random(3)
+    genes = {"Gene{}x{}".format(i, rnd.randint(0, 99)): "NCBIGene:{}".format(i) for i in range(gene_count)}
+    names = list(genes)
+    # case variations and name fragments, the queries that miss the exact lookup
+    queries = [rnd.choice(names).upper() if i % 2 else rnd.choice(names)[1:-2] for i in range(query_count)]
+
+    def legacy():
+        results = []
+        for query in queries:
+            gene_id = None
+            for gene in genes:
+                if query.lower() in gene.lower():
+                    gene_id = genes[gene]
+            results.append(gene_id)
+        return results
+
+    def indexed():
+        index = GeneIndex(genes)
+        return [index.lookup(query) for query in queries]
+
+    legacy_result, legacy_time = timed(legacy)
+    indexed_result, indexed_time = timed(indexed)
+    assert all(match is not None for match in indexed_result) and all(legacy_result)
+    print("gene lookup: legacy {:.2f}s, indexed {:.3f}s (including index build), speed-up x{:.0f}"
+          .format(legacy_time, indexed_time, legacy_time / indexed_time))
+
+
+def benchmark_label_suffixes(dend):
+    labels = {node['cell_label']: node for node in dend['nodes']}
+    queries = [node['cell_label'].split(" ", 1)[-1] for node in dend['nodes']]
+    sample = random.Random(2).sample(queries, min(LEGACY_SAMPLE_SIZE, len(queries)))
+
+    def legacy():
+        return [len([label for label in labels if label.endswith(query)]) for query in sample]
+
+    def indexed():
+        index = LabelSuffixIndex(labels)
+        return [index.count_suffix(query) for query in queries]
+
+    legacy_result, legacy_time = timed(legacy)
+    indexed_result, indexed_time = timed(indexed)
+    counts = dict(zip(queries, indexed_result))
+    assert legacy_result == [counts[query] for query in sample]
+
+    legacy_estimate = legacy_time / len(sample) * len(queries)
+    print("label suffix counts: legacy {:.1f}s (extrapolated from {} labels), indexed {:.3f}s (including index build), "
+          "speed-up x{:.0f}".format(legacy_estimate, len(sample), indexed_time, legacy_estimate / indexed_time))
+
+
+def benchmark_id_allocation(taxonomy):
+    id_factory = PCLIdFactory(taxonomy, taxonomy_details=[])
+    accessions = [annotation['cell_set_accession'] for annotation in taxonomy['annotations']]
+    methods = {"class": id_factory.get_class_id,
+               "marker_gene_set": id_factory.get_marker_gene_set_id,
+               "nsf_marker_gene_set": id_factory.get_nsf_marker_gene_set_id,
+               "ws_marker_gene_set": id_factory.get_ws_marker_gene_set_id,
+               "evidence_marker_gene_set": id_factory.get_evidence_marker_gene_set_id}
+
+    def legacy():
+        return {kind: [method(accession) for accession in accessions] for kind, method in methods.items()}
+
+    def batch():
+        return {kind: id_factory.format_ids(ids) for kind, ids in id_factory.get_batch_ids(accessions).items()}
+
+    legacy_result, legacy_time = timed(legacy)
+    batch_result, batch_time = timed(batch)
+    assert all(legacy_result[kind] == batch_result[kind].tolist() for kind in methods)
+    print("id allocation: legacy {:.2f}s, batch {:.3f}s, speed-up x{:.0f}"
+          .format(legacy_time, batch_time, legacy_time / batch_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template generation performance benchmarks.")
+    parser.add_argument("--nodes", type=int, default=100000, help="Number of synthetic taxonomy nodes.")
+    args = parser.parse_args()
+
+    taxonomy = generate_synthetic_taxonomy(args.nodes)
+    dend = {}
+    tree_recurse(taxonomy, dend)
+    print("synthetic taxonomy: {} nodes".format(len(dend['nodes'])))
+    benchmark_gross_cell_types(dend)
+    benchmark_node_store(taxonomy)
+    benchmark_author_fields(taxonomy)
+    benchmark_gene_lookup()
+    benchmark_label_suffixes(dend)
+    benchmark_id_allocation(taxonomy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import unittest
+
+import pandas as pd
+
+from region_frequencies import RegionFrequencyMatrix
+from template_generation_tools import populate_mba_relations, BROAD_REGION, ACRONYM_REGION
+
+
+class RegionFrequencyMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mba_symbols = {"STR": "DHBA:10333", "PAL": "DHBA:10342", "root": "DHBA:10153", "CaB": "DHBA:10334"}
+        self.mba_labels = {"DHBA:10333": "striatum", "DHBA:10342": "pallidum", "DHBA:10153": "brain",
+                           "DHBA:10334": "caudate body"}
+        self.freqs = RegionFrequencyMatrix.from_series(pd.Series(
+            ["STR:0.6, PAL:0.3,na:0.05,XYZ:0.05", "PAL: 0.5,STR:0.2,XYZ:0.3", None, "CaB,Cb:0.95", "STR:0.4"],
+            index=["CS:1", "CS:2", "CS:3", "CS:4", "CS:2"]))
+
+    def test_parsing(self):
+        self.assertEqual(4, len(self.freqs))
+        self.assertIn("CS:3", self.freqs)
+        # last duplicate wins
+        self.assertEqual(["STR"], self.freqs.get_region_symbols("CS:2"))
+        self.assertEqual(["STR", "PAL", "na", "XYZ"], self.freqs.get_region_symbols("CS:1"))
+        self.assertEqual([], self.freqs.get_region_symbols("CS:3"))
+        self.assertEqual([], self.freqs.get_region_symbols("CS:5"))
+        self.assertEqual([0.6, 0.3, 0.05, 0.05, 0.0, 0.95, 0.4], self.freqs.data.tolist())
+
+    def test_region_assignments(self):
+        assignments = self.freqs.get_region_assignments(self.mba_symbols, self.mba_labels, 0.05)
+
+        self.assertEqual(("DHBA:10153", "DHBA:10333", "DHBA:10342"), assignments["CS:1"].mbas)
+        self.assertEqual(("brain (na, 0.05)", "striatum (STR, 0.6)", "pallidum (PAL, 0.3)"), assignments["CS:1"].texts)
+        self.assertEqual((0.05, 0.6, 0.3), assignments["CS:1"].percentages)
+        self.assertEqual(("XYZ",), assignments["CS:1"].missed)
+        # below the threshold and unknown regions
+        self.assertEqual((), assignments["CS:3"].mbas)
+        self.assertEqual((), assignments["CS:4"].mbas)
+        self.assertEqual(("Cb",), assignments["CS:4"].missed)
+
+    def test_populate_mba_relations(self):
+        broad = self.freqs.get_region_assignments(self.mba_symbols, self.mba_labels, 0.1)
+        acronym = RegionFrequencyMatrix.from_series(pd.Series(["CaB:0.2,STR:0.8"], index=["CS:1"])) \
+            .get_region_assignments(self.mba_symbols, self.mba_labels, 0.1)
+        d = dict()
+        missed_regions = set()
+
+        broad_mbas, mba_text = populate_mba_relations(broad["CS:1"], BROAD_REGION, d, 1, missed_regions)
+        acronym_mbas, _ = populate_mba_relations(acronym["CS:1"], ACRONYM_REGION, d, len(broad_mbas) + 1,
+                                                 missed_regions, broad_mbas)
+
+        self.assertEqual(("DHBA:10333", "DHBA:10342"), broad_mbas)
+        self.assertEqual(("striatum (STR, 0.6)", "pallidum (PAL, 0.3)"), mba_text)
+        self.assertEqual(("DHBA:10334",), acronym_mbas)
+        self.assertEqual({"MBA_1": "DHBA:10333", "MBA_1_cell_percentage": 0.6,
+                          "MBA_1_comment": "Location assignment based on CCF broad region.",
+                          "MBA_2": "DHBA:10342", "MBA_2_cell_percentage": 0.3,
+                          "MBA_2_comment": "Location assignment based on CCF broad region.",
+                          "MBA_3": "DHBA:10334", "MBA_3_cell_percentage": 0.2,
+                          "MBA_3_comment": "Location assignment based on CCF acronym region."}, d)
+        self.assertEqual(set(), missed_regions)
+
+
+if __name__ == '__main__':
+    unittest.main()
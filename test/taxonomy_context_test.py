@@ -0,0 +1,193 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from template_generation_tools import (TaxonomyContext, build_templates, generate_ind_template,
+                                       generate_curated_class_template, generate_marker_gene_set_template,
+                                       generate_evidence_marker_gene_set_template, IndividualTemplateBuilder,
+                                       CuratedClassTemplateBuilder, AuthorMarkerSetTemplateBuilder,
+                                       EvidenceMarkerSetTemplateBuilder, WithinSubclassMarkerSetTemplateBuilder,
+                                       load_shared_input, get_outdated_components, read_author_markers_dataframe,
+                                       read_author_local_markers_dataframe, MarkerSetTemplateBuilder)
+
+from dendrogram_tools import cas_json_2_nodes_n_edges, read_json_file
+from pcl_id_factory import PCLIdFactory
+
+PATH_TO_CAS = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src/dendrograms/CCN20250428.json")
+
+
+class TaxonomyContextTest(unittest.TestCase):
+
+    def test_lazy_structures_built_once(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+
+        self.assertEqual("CCN20250428", context.taxon)
+        self.assertIs(context.dend, context.dend)
+        self.assertIs(context.nodes_to_collapse, context.nodes_to_collapse)
+        self.assertIs(context.pcl_id_factory, context.pcl_id_factory)
+        self.assertEqual(len(context.dend['nodes']), len(context.all_nodes))
+
+    def test_id_factories_share_taxonomy(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+
+        self.assertIs(context.taxonomy_details, context.pcl_id_factory.taxonomies)
+        self.assertIs(context.taxonomy_details, context.cl_id_factory.taxonomies)
+        self.assertIs(context.taxonomy_details, context.clm_id_factory.taxonomies)
+
+    def test_annotations_held_once(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+        expected = cas_json_2_nodes_n_edges(PATH_TO_CAS)
+
+        # annotations are streamed into the dendrogram, the id factories only get their labelset counts
+        self.assertNotIn("annotations", context.taxonomy)
+        self.assertEqual([node['cell_set_accession'] for node in expected['nodes']],
+                         [node['cell_set_accession'] for node in context.dend['nodes']])
+        self.assertEqual(expected['parents'], context.dend['parents'])
+        self.assertEqual(vars(PCLIdFactory(read_json_file(PATH_TO_CAS), context.taxonomy_details)),
+                         vars(context.pcl_id_factory))
+
+    def test_labels_do_not_modify_nodes(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+        before = {accession: dict(node["author_annotation_fields"] or {})
+                  for accession, node in context.all_nodes.items()}
+        self.assertTrue(context.all_pref_labels)
+        after = {accession: dict(node["author_annotation_fields"] or {})
+                 for accession, node in context.all_nodes.items()}
+
+        self.assertEqual(before, after)
+
+
+class TaxonomySnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.taxonomy_path = os.path.join(self.cache_dir, "CCN20250428.json")
+        shutil.copy(PATH_TO_CAS, self.taxonomy_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def snapshots(self):
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(".pickle")]
+
+    def test_snapshot_round_trip(self):
+        built = TaxonomyContext.from_snapshot(self.taxonomy_path, self.cache_dir)
+        self.assertEqual(1, len(self.snapshots()))
+        loaded = TaxonomyContext.from_snapshot(self.taxonomy_path, self.cache_dir)
+
+        for field in TaxonomyContext.SNAPSHOT_FIELDS:
+            self.assertIn(field, loaded.__dict__)
+        self.assertNotIn("taxonomy", loaded.__dict__)
+        self.assertEqual(built.dend['nodes'], loaded.dend['nodes'])
+        self.assertEqual(built.all_pref_labels, loaded.all_pref_labels)
+        self.assertEqual(built.pcl_id_factory.class_ranges, loaded.pcl_id_factory.class_ranges)
+        self.assertEqual({key: dict(node) for key, node in built.nodes_to_collapse.items()},
+                         {key: dict(node) for key, node in loaded.nodes_to_collapse.items()})
+        # shared node identity is preserved
+        accession = loaded.dend['nodes'][0]['cell_set_accession']
+        self.assertIs(loaded.dend['nodes'][0], loaded.all_nodes[accession])
+
+    def test_snapshot_invalidated_on_change(self):
+        context = TaxonomyContext.from_snapshot(self.taxonomy_path, self.cache_dir)
+        key = context.snapshot_key()
+        with open(self.taxonomy_path, "a") as f:
+            f.write("\n")
+        changed = TaxonomyContext.from_snapshot(self.taxonomy_path, self.cache_dir)
+
+        self.assertNotEqual(key, changed.snapshot_key())
+        self.assertEqual(["CCN20250428_{}.pickle".format(changed.snapshot_key())], self.snapshots())
+
+
+class TemplateBuildersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def read(self, file_name):
+        with open(os.path.join(self.output_dir, file_name)) as f:
+            return f.read()
+
+    def test_single_walk_matches_generators(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+        generators = [("ind", generate_ind_template, IndividualTemplateBuilder),
+                      ("cc", generate_curated_class_template, CuratedClassTemplateBuilder),
+                      ("ms", generate_marker_gene_set_template, AuthorMarkerSetTemplateBuilder),
+                      ("ems", generate_evidence_marker_gene_set_template, EvidenceMarkerSetTemplateBuilder)]
+        for name, generator, _ in generators:
+            generator(PATH_TO_CAS, os.path.join(self.output_dir, name + ".tsv"), context)
+
+        build_templates(context, [(builder_class(context), os.path.join(self.output_dir, name + "_all.tsv"))
+                                  for name, _, builder_class in generators])
+
+        for name, _, _ in generators:
+            self.assertEqual(self.read(name + ".tsv"), self.read(name + "_all.tsv"))
+
+    def build_incremental(self, taxonomy_path, suffix="", incremental=True):
+        context = TaxonomyContext(taxonomy_path)
+        builders = [(IndividualTemplateBuilder(context), os.path.join(self.output_dir, "ind" + suffix + ".tsv")),
+                    (CuratedClassTemplateBuilder(context), os.path.join(self.output_dir, "cc" + suffix + ".tsv"))]
+        written = build_templates(context, builders, incremental=incremental)
+        return [os.path.basename(path) for path in written], [builder.reused_count for builder, _ in builders]
+
+    def test_incremental_generation(self):
+        node_count = len(TaxonomyContext(PATH_TO_CAS).dend['nodes'])
+        self.assertEqual((["ind.tsv", "cc.tsv"], [0, 0]), self.build_incremental(PATH_TO_CAS))
+        self.assertEqual(([], [node_count, node_count]), self.build_incremental(PATH_TO_CAS))
+
+        # taxonomy name is read from the file name
+        changed_path = os.path.join(self.output_dir, os.path.basename(PATH_TO_CAS))
+        with open(PATH_TO_CAS) as f:
+            taxonomy = json.load(f)
+        group = next(annotation for annotation in taxonomy["annotations"] if annotation["labelset"] == "Group")
+        group["synonyms"] = ["changed synonym"]
+        with open(changed_path, "w") as f:
+            json.dump(taxonomy, f)
+
+        written, reused = self.build_incremental(changed_path)
+        self.assertEqual(["ind.tsv"], written)
+        self.assertEqual([node_count - 1, node_count - 1], reused)
+        self.build_incremental(changed_path, "_full", incremental=False)
+        self.assertEqual(self.read("ind_full.tsv"), self.read("ind.tsv"))
+        self.assertEqual(self.read("cc_full.tsv"), self.read("cc.tsv"))
+
+    def test_outdated_components(self):
+        self.assertEqual(["CCN20250428_indv.owl", "CCN20250428_inferred_hierarchy.owl", "CCN20250428_class.owl",
+                          "CCN20250428_nsforest_marker_set.owl", "all_templates.owl"],
+                         get_outdated_components(["templates/CCN20250428.tsv",
+                                                  "default/CCN20250428_class_curation.tsv",
+                                                  "default/CCN20250428_nsforest_marker_set.tsv"]))
+        self.assertEqual([], get_outdated_components([]))
+
+    def test_shared_inputs_loaded_once(self):
+        calls = []
+
+        def loader(path, delimiter=","):
+            calls.append((path, delimiter))
+            return {"path": path}
+
+        first = load_shared_input(loader, "a.tsv", delimiter="\t")
+        self.assertIs(first, load_shared_input(loader, "a.tsv", delimiter="\t"))
+        load_shared_input(loader, "b.tsv")
+        self.assertEqual([("a.tsv", "\t"), ("b.tsv", ",")], calls)
+
+    def test_builders_implement_add_node(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+        with self.assertRaises(TypeError):
+            MarkerSetTemplateBuilder(context)
+
+    def test_marker_builders_share_class_base_inputs(self):
+        context = TaxonomyContext(PATH_TO_CAS)
+        # same shared inputs as the class base template (see BaseClassTemplateBuilder)
+        self.assertIs(load_shared_input(read_author_markers_dataframe),
+                      AuthorMarkerSetTemplateBuilder(context).author_markers)
+        self.assertIs(load_shared_input(read_author_local_markers_dataframe),
+                      WithinSubclassMarkerSetTemplateBuilder(context).author_markers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import networkx as nx
+
+from dendrogram_tools import cas_json_2_nodes_n_edges
+from template_generation_utils import generate_dendrogram_tree
+from taxonomy_tree import TaxonomyTree, as_taxonomy_tree
+from marker_tools import extend_expressions, EXPRESSIONS, CLUSTER
+
+PATH_TO_CAS = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../src/dendrograms/CCN20250428.json")
+
+
+class TaxonomyTreeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dend = cas_json_2_nodes_n_edges(PATH_TO_CAS)
+        cls.nx_tree = generate_dendrogram_tree(cls.dend)
+        cls.tree = TaxonomyTree.from_dendrogram(cls.dend)
+
+    def test_matches_networkx(self):
+        self.assertEqual(set(self.nx_tree.nodes()), set(self.tree.nodes))
+        for node in self.nx_tree.nodes():
+            self.assertEqual(nx.ancestors(self.nx_tree, node), set(self.tree.ancestors(node)))
+            self.assertEqual(nx.descendants(self.nx_tree, node), set(self.tree.descendants(node)))
+            self.assertEqual(set(self.nx_tree.successors(node)), set(self.tree.children(node)))
+            for ancestor in self.tree.ancestors(node):
+                self.assertTrue(self.tree.is_ancestor(ancestor, node))
+                self.assertFalse(self.tree.is_ancestor(node, ancestor))
+            self.assertFalse(self.tree.is_ancestor(node, node))
+            self.assertTrue(self.tree.is_ancestor_or_self(node, node))
+
+    def test_edges(self):
+        tree = TaxonomyTree(self.dend['edges'])
+
+        self.assertEqual(set(self.tree.roots), set(tree.roots))
+        self.assertEqual(sorted(self.tree.nodes), sorted(tree.nodes))
+        for root in tree.roots:
+            self.assertEqual(0, tree.depth(root))
+            self.assertIsNone(tree.parent(root))
+            self.assertEqual([root] + tree.descendants(root), tree.subtree(root))
+
+    def test_as_taxonomy_tree(self):
+        self.assertIs(self.tree, as_taxonomy_tree(self.tree))
+        self.assertEqual(set(self.tree.nodes), set(as_taxonomy_tree(self.nx_tree).nodes))
+
+    def test_extend_expressions(self):
+        group = next(node['cell_set_accession'] for node in self.dend['nodes'] if node['labelset'] == 'Group')
+        parent = self.dend['parents'][group]
+        root = self.tree.ancestors(group)[-1]
+
+        def marker_expressions():
+            return {group: {EXPRESSIONS: ["g1"], CLUSTER: "group"},
+                    parent: {EXPRESSIONS: ["p1"], CLUSTER: "parent"}}
+
+        for tree in [self.tree, self.nx_tree]:
+            extended = extend_expressions(tree, marker_expressions(), [root])
+            self.assertEqual({"g1", "p1"}, extended[group][EXPRESSIONS])
+            # root nodes don't inherit or keep markers
+            extended = extend_expressions(tree, marker_expressions(), [group])
+            self.assertEqual(set(), extended[group][EXPRESSIONS])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import os
+import copy
 import csv
 import requests
 from cProfile import label
@@ -7,11 +8,15 @@ from cProfile import label
 from dendrogram_tools import cas_json_2_nodes_n_edges, read_json_file
 from template_generation_utils import get_synonyms_from_taxonomy, get_synonym_pairs, \
     PAIR_SEPARATOR, OR_SEPARATOR, read_taxonomy_config, get_subtrees, read_dendrogram_tree, \
-    find_singleton_chains, generate_dendrogram_tree, read_one_concept_one_name_tsv, get_class_membership_dict
+    find_singleton_chains, generate_dendrogram_tree, read_one_concept_one_name_tsv, get_class_membership_dict, \
+    get_gross_cell_type, resolve_all_gross_cell_types, get_hierarchy_table, get_collapsed_nodes, deep_merge_dicts, \
+    ChainNode, LabelSuffixIndex, format_cell_label
 
 
 PATH_TO_CAS = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                            "../src/dendrograms/CS20250428.json")
+PATH_TO_CCN_CAS = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               "../src/dendrograms/CCN20250428.json")
 PATH_OCON_REPORT_TSV = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                            "./test_data/one_concept_one_name_curation.tsv")
 OCON_TSV = os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -117,6 +122,104 @@ class TemplateUtilsTest(unittest.TestCase):
         self.assertEqual("CS20230722_CLAS_01", membership["CS20230722_SUPT_0001"])
         self.assertEqual("CS20230722_CLAS_01", membership["CS20230722_CLUS_0001"])
 
+    def test_resolve_all_gross_cell_types(self):
+        dend = cas_json_2_nodes_n_edges(PATH_TO_CCN_CAS)
+        gross_cell_types = resolve_all_gross_cell_types(dend)
+
+        self.assertEqual(len({node['cell_set_accession'] for node in dend['nodes']}), len(gross_cell_types))
+        for node in dend['nodes']:
+            accession = node['cell_set_accession']
+            self.assertEqual(get_gross_cell_type(accession, dend['nodes']),
+                             get_gross_cell_type(accession, dend['nodes'], gross_cell_types))
+        self.assertEqual("CL:0000000", get_gross_cell_type("unknown", dend['nodes'], gross_cell_types))
+
+    def test_hierarchy_table(self):
+        cas = read_json_file(PATH_TO_CCN_CAS)
+        dend = cas_json_2_nodes_n_edges(PATH_TO_CCN_CAS)
+        dend_tree = generate_dendrogram_tree(dend)
+        node_index = {node['cell_set_accession']: node for node in dend['nodes']}
+        labelset_ranks = {labelset["name"]: labelset["rank"] for labelset in cas['labelsets'] if "rank" in labelset}
+        hierarchy = get_hierarchy_table(dend_tree, node_index, labelset_ranks)
+
+        self.assertEqual(set(dend_tree.nodes()), set(hierarchy.keys()))
+        for node, record in hierarchy.items():
+            ancestors = []
+            current = node
+            while dend['parents'].get(current):
+                current = dend['parents'][current]
+                ancestors.append(current)
+            self.assertEqual(current, record["root"])
+            self.assertEqual(len(ancestors), record["depth"])
+            self.assertEqual(labelset_ranks[node_index[node]["labelset"]], record["rank"])
+        self.assertEqual({node: record["root"] for node, record in hierarchy.items()},
+                         get_class_membership_dict(dend_tree))
+
+    def test_singleton_chains(self):
+        dend = cas_json_2_nodes_n_edges(PATH_TO_CCN_CAS)
+        dend_tree = generate_dendrogram_tree(dend)
+        chains = find_singleton_chains(dend_tree)
+
+        self.assertEqual(22, len(chains))
+        for chain in chains:
+            self.assertTrue(dend_tree.in_degree(chain[0]) == 0 or
+                            dend_tree.out_degree(dend['parents'][chain[0]]) > 1)
+            for node in chain[:-1]:
+                self.assertEqual(1, dend_tree.out_degree(node))
+            self.assertNotEqual(1, dend_tree.out_degree(chain[-1]))
+        chain_nodes = [node for chain in chains for node in chain]
+        self.assertEqual(len(chain_nodes), len(set(chain_nodes)))
+
+    def test_chain_node_merge(self):
+        dend = cas_json_2_nodes_n_edges(PATH_TO_CCN_CAS)
+        all_nodes = {node['cell_set_accession']: node for node in dend['nodes']}
+        collapsed = get_collapsed_nodes(generate_dendrogram_tree(dend), all_nodes)
+
+        for accession, merged_node in collapsed.items():
+            chain = merged_node['chain']
+            expected = copy.deepcopy(dict(all_nodes[chain[-1]]))
+            for node_id in reversed(chain[:-1]):
+                expected = deep_merge_dicts(expected, copy.deepcopy(dict(all_nodes[node_id])))
+            for key in expected:
+                if key not in ('cell_label', 'parent_cell_set_accession'):
+                    self.assertEqual(expected[key], merged_node[key])
+
+    def test_chain_node_layers(self):
+        deepest = {"a": "", "b": "x", "c": None, "n": {"k1": "", "k2": "deep"}}
+        top = {"a": "top", "b": "y", "c": "", "d": "z", "n": {"k1": "top", "k3": "t"}}
+        chain_node = ChainNode([deepest, top])
+        chain_node["a"] = "override"
+
+        self.assertEqual({"a": "override", "b": "x", "c": "", "d": "z",
+                          "n": {"k1": "top", "k2": "deep", "k3": "t"}},
+                         {key: dict(value) if key == "n" else value for key, value in chain_node.items()})
+        self.assertEqual("", deepest["a"])
+        del chain_node["d"]
+        self.assertNotIn("d", chain_node)
+
+
+class LabelSuffixIndexTest(unittest.TestCase):
+
+    def test_count_suffix(self):
+        labels = ["STRd D1 Matrix MSN", "STRv D1 MSN", "D1 MSN", "Astro", "STRd D1 Matrix MSN"]
+        index = LabelSuffixIndex(labels)
+
+        for suffix in ["MSN", "D1 MSN", "Matrix MSN", "1 MSN", "", "Astro", "xAstro", "Oligo"]:
+            self.assertEqual(len([label for label in labels if label.endswith(suffix)]), index.count_suffix(suffix))
+        self.assertEqual(5, len(index))
+
+        index.add("Matrix MSN")
+        self.assertEqual(3, index.count_suffix("Matrix MSN"))
+
+    def test_format_cell_label_uniqueness(self):
+        node = {"cell_set_accession": "CS_1", "labelset": "Group", "author_annotation_fields": {},
+                "marker_gene_evidence": ["Drd1", "Tac1"]}
+        all_labels = {"STRd D1 MSN": None, "STRv D1 MSN": None}
+        # "D1 MSN" is a suffix of other taxonomy labels, so markers are appended to make it unique
+        self.assertEqual("D1 MSN Drd1", format_cell_label("01 D1 MSN", node, all_labels, set()))
+        self.assertEqual("D1 MSN Tac1", format_cell_label("D1 MSN", node, LabelSuffixIndex(all_labels),
+                                                          {"D1 MSN Drd1"}))
+        self.assertEqual("STRd D1 MSN", format_cell_label("STRd D1 MSN", node, LabelSuffixIndex(all_labels), set()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from template_sidecar import (is_sidecar_supported, get_sidecar_path, find_sidecar, read_template_columns,
+                              get_list_values, STRING_TYPE, FLOAT_TYPE, LIST_TYPE, PARQUET, ARROW)
+from template_writer import TemplateWriter, ColumnFamily, get_column_type
+from template_generation_utils import read_tsv_to_dict, merge_tables
+from cl_subset_terms import collect_classes
+from ensembl import extract_ensembl_terms
+
+COLUMN_TYPES = {"Markers": LIST_TYPE, "FBeta_confidence_score": FLOAT_TYPE,
+                ColumnFamily(r"MBA_\d+_cell_percentage"): FLOAT_TYPE}
+
+ROWS = [{"defined_class": "http://purl.obolibrary.org/obo/CLM_5050001", "Markers": "ensembl:ENSG1|ensembl:ENSG2",
+         "FBeta_confidence_score": 0.75, "MBA_1_cell_percentage": 0.5},
+        {"defined_class": "http://purl.obolibrary.org/obo/PCL_0160001", "Markers": "",
+         "FBeta_confidence_score": None, "MBA_1_cell_percentage": 1.0, "Comment": "a \"quoted\"\tvalue"}]
+
+
+class TemplateSidecarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.folder, "CCN20250428_marker_set.tsv")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_template(self, sidecar_format=None, skip_unchanged=False):
+        with TemplateWriter(self.template_path, sidecar_format=sidecar_format, column_types=COLUMN_TYPES,
+                            skip_unchanged=skip_unchanged) as writer:
+            for row in ROWS:
+                writer.write_row(row)
+
+    def test_column_types(self):
+        self.assertEqual(LIST_TYPE, get_column_type("Markers", COLUMN_TYPES))
+        self.assertEqual(FLOAT_TYPE, get_column_type("MBA_12_cell_percentage", COLUMN_TYPES))
+        self.assertEqual(STRING_TYPE, get_column_type("MBA_12_comment", COLUMN_TYPES))
+        self.assertEqual(os.path.join(self.folder, "CCN20250428_marker_set.parquet"),
+                         get_sidecar_path(self.template_path, PARQUET))
+        with self.assertRaises(ValueError):
+            get_sidecar_path(self.template_path, "csv")
+
+    def test_templates_without_sidecar(self):
+        self.write_template()
+        self.assertIsNone(find_sidecar(self.template_path))
+        self.assertIsNone(read_template_columns(self.template_path, ["Markers"]))
+        headers, records = read_tsv_to_dict(self.template_path)
+        self.assertEqual("ensembl:ENSG1|ensembl:ENSG2", records[ROWS[0]["defined_class"]]["Markers"])
+
+    @unittest.skipUnless(is_sidecar_supported(), "pyarrow is not installed")
+    def test_typed_sidecars(self):
+        for sidecar_format in (PARQUET, ARROW):
+            self.write_template(sidecar_format)
+            sidecar_path = get_sidecar_path(self.template_path, sidecar_format)
+            self.assertEqual(sidecar_path, find_sidecar(self.template_path))
+
+            columns = read_template_columns(self.template_path, ["Markers", "FBeta_confidence_score", "unknown"])
+            self.assertEqual({"Markers": [["ensembl:ENSG1", "ensembl:ENSG2"], None],
+                              "FBeta_confidence_score": [0.75, None]}, columns.to_pydict())
+            self.assertEqual("double", str(columns.schema.field("FBeta_confidence_score").type))
+            self.assertEqual(["ensembl:ENSG1", "ensembl:ENSG2"], get_list_values(columns, "Markers").to_pylist())
+            os.remove(sidecar_path)
+
+    @unittest.skipUnless(is_sidecar_supported(), "pyarrow is not installed")
+    def test_readers_use_sidecars(self):
+        self.write_template()
+        expected = read_tsv_to_dict(self.template_path)
+        classes = collect_classes(self.folder, collect_genes=True)
+        merged_path = os.path.join(self.folder, "merged.tsv.out")
+        merge_tables(self.template_path, self.template_path, merged_path)
+        with open(merged_path) as f:
+            merged = f.read()
+        terms_path = os.path.join(self.folder, "terms.txt")
+        extract_ensembl_terms(self.folder, terms_path)
+        with open(terms_path) as f:
+            terms = f.read()
+
+        self.write_template(ARROW)
+        self.assertEqual(expected, read_tsv_to_dict(self.template_path))
+        self.assertEqual(classes, collect_classes(self.folder, collect_genes=True))
+        merge_tables(self.template_path, self.template_path, merged_path)
+        with open(merged_path) as f:
+            self.assertEqual(merged, f.read())
+        extract_ensembl_terms(self.folder, terms_path)
+        with open(terms_path) as f:
+            self.assertEqual(terms, f.read())
+
+        # unchanged templates are not rewritten, their sidecar is still up to date
+        sidecar_mtime = os.path.getmtime(get_sidecar_path(self.template_path, ARROW))
+        self.write_template(ARROW, skip_unchanged=True)
+        self.assertEqual(sidecar_mtime, os.path.getmtime(get_sidecar_path(self.template_path, ARROW)))
+        self.assertIsNotNone(find_sidecar(self.template_path))
+
+        # hand edited templates are read again
+        with open(self.template_path, "a") as f:
+            f.write("http://purl.obolibrary.org/obo/CLM_5050002\t\t\t\t\n")
+        os.utime(self.template_path, (os.path.getmtime(self.template_path) + 10,) * 2)
+        self.assertIsNone(find_sidecar(self.template_path))
+        self.assertIn("http://purl.obolibrary.org/obo/CLM_5050002", read_tsv_to_dict(self.template_path)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from template_writer import TemplateWriter, TemplateSchema, ColumnFamily
+
+
+class TemplateWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def assert_same_as_pandas(self, rows, header_rows=()):
+        expected_path = os.path.join(self.folder, "expected.tsv")
+        pd.DataFrame.from_records(list(header_rows) + rows).to_csv(expected_path, sep="\t", index=False)
+
+        output_path = os.path.join(self.folder, "output.tsv")
+        with TemplateWriter(output_path, header_rows=list(header_rows)) as writer:
+            for row in rows:
+                writer.write_row(row)
+
+        with open(expected_path, "rb") as expected, open(output_path, "rb") as output:
+            self.assertEqual(expected.read(), output.read())
+
+    def test_column_types(self):
+        self.assert_same_as_pandas([{"int": 1, "int_missing": 1, "int_none": 1, "int_float": 1, "int_str": 1,
+                                     "bool": True, "float": 0.1 + 0.2, "big": 1e16, "small": 1e-7},
+                                    {"int": 2, "int_none": None, "int_float": 2.5, "int_str": "a",
+                                     "bool_missing": False, "float": float("inf"), "big": 100.0,
+                                     "small": float("nan")}])
+
+    def test_quoting(self):
+        self.assert_same_as_pandas([{"a": 'quoted "value"', "b": "tab\tvalue", "c": "new\nline",
+                                     "d": ["list", "value"], "e": ""}])
+
+    def test_empty_templates(self):
+        self.assert_same_as_pandas([{"a": ""}, {"a": None}])
+        self.assert_same_as_pandas([])
+
+    def test_header_rows_are_completed_until_closed(self):
+        header = {"ID": "ID", "Label": "LABEL"}
+        rows = [{"ID": "ind:1", "Label": "one", "extra": 5}]
+        self.assert_same_as_pandas(rows, header_rows=[dict(header, extra="A extra")])
+
+        output_path = os.path.join(self.folder, "output.tsv")
+        writer = TemplateWriter(output_path, header_rows=[header])
+        writer.write_row(rows[0])
+        header["extra"] = "A extra"
+        writer.close()
+        with open(output_path) as f:
+            self.assertEqual(["ID\tLabel\textra", "ID\tLABEL\tA extra", "ind:1\tone\t5"], f.read().splitlines())
+
+    def test_schema(self):
+        schema = TemplateSchema(["defined_class", ColumnFamily(r"MBA_\d+")])
+        self.assertIn("MBA_12", schema)
+        self.assertNotIn("MBA_12_comment", schema)
+
+        output_path = os.path.join(self.folder, "output.tsv")
+        writer = TemplateWriter(output_path, schema)
+        writer.write_row({"defined_class": "PCL:1", "MBA_1": "MBA:1"})
+        with self.assertRaises(ValueError):
+            writer.write_row({"defined_class": "PCL:2", "MBA_1_comment": "comment"})
+        writer.discard()
+        self.assertFalse(os.path.exists(output_path))
+
+
+if __name__ == '__main__':
+    unittest.main()